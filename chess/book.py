@@ -0,0 +1,187 @@
+"""
+Opening books: the moves played from positions early in known games.
+
+A book file is a list of 16 byte entries sorted by key, laid out like a
+Polyglot book: the position's Zobrist key (8 bytes), the move (2 bytes),
+a weight (2 bytes) and a learn field (4 bytes, kept as 0), all big endian.
+The key is Board.zobrist rather than Polyglot's own hash, so the files are
+read by this module rather than other Polyglot tools. Book reads the file
+through mmap and finds a position's moves by binary search, so opening a
+book costs nothing however large it is.
+
+  python book.py build book.bin games.pgn [tests.epd ...] [-p plies]
+  python book.py probe book.bin [fen]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from chess import Bishop, Board, Knight, Location, Queen, Rook
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+PROMOTION_CODES = {Knight: 1, Bishop: 2, Rook: 3, Queen: 4}
+MAX_WEIGHT = 0xffff
+
+
+def encode_move(move):
+  """
+  A move as Polyglot writes it: the end file and rank, the start file and
+  rank, three bits each, then the promotion. Castling is written as the
+  king taking its own rook.
+  """
+  end = move.end
+  if move.castle:
+    end = Location(end.row, 7 if end.col == 6 else 0)
+  return (end.col | end.row << 3 | move.start.col << 6 | move.start.row << 9 |
+          PROMOTION_CODES.get(move.promotion, 0) << 12)
+
+
+def decode_move(board, code):
+  """ The legal move on board written as code, or None. """
+  for move in board.legal_moves():
+    if encode_move(move) == code:
+      return move
+  return None
+
+
+def book_games(paths, plies):
+  """
+  Yields (board, move) for the first plies moves of every game in the PGN
+  files of paths, and the bm move of every position in the EPD files. The
+  move is made on board once the next pair is asked for.
+  """
+  from epd import parse_epd, read_epd
+  from pgn import read_games, san_moves, start_board
+  for path in paths:
+    with open(path) as lines:
+      if path.endswith('.epd'):
+        for line in read_epd(lines):
+          board, operations = parse_epd(line)
+          for san in operations.get('bm', '').split():
+            try:
+              yield board, board.parse_san(san)
+            except ValueError:
+              continue
+        continue
+      for tags, movetext in read_games(lines):
+        board = start_board(tags)
+        for san in san_moves(movetext)[:plies]:
+          try:
+            move = board.parse_san(san)
+          except ValueError:
+            break
+          yield board, move
+          board.make_move(move)
+
+
+def build(pairs, path):
+  """
+  Writes a book of (board, move) pairs to path, weighting each move by how
+  many times it was played from its position. Returns the number of entries.
+  """
+  counts = {}
+  for board, move in pairs:
+    key = (board.zobrist, encode_move(move))
+    counts[key] = counts.get(key, 0) + 1
+  # Sorted by key, and most played first within a position
+  entries = sorted(counts.items(), key = lambda e: (e[0][0], -e[1], e[0][1]))
+  with open(path, 'wb') as f:
+    for (key, move), weight in entries:
+      f.write(ENTRY.pack(key, move, min(weight, MAX_WEIGHT), 0))
+  return len(entries)
+
+
+class Book(object):
+  """ Looks positions up in a book file without reading it into memory. """
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      # mmap can't map an empty file, and an empty book has nothing to read
+      if os.fstat(f.fileno()).st_size:
+        self.data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+      else:
+        self.data = b''
+    self.count = len(self.data) // ENTRY.size
+
+  def key(self, i):
+    return KEY.unpack_from(self.data, i * ENTRY.size)[0]
+
+  def find(self, key):
+    """ The index of the first entry for key, or where it would go. """
+    low, high = 0, self.count
+    while low < high:
+      mid = (low + high) // 2
+      if self.key(mid) < key:
+        low = mid + 1
+      else:
+        high = mid
+    return low
+
+  def entries(self, board):
+    """ The (move, weight, learn) entries for board, most played first. """
+    rtn = []
+    i = self.find(board.zobrist)
+    while i < self.count:
+      key, code, weight, learn = ENTRY.unpack_from(self.data, i * ENTRY.size)
+      if key != board.zobrist:
+        break
+      move = decode_move(board, code)
+      if move is not None:
+        rtn.append((move, weight, learn))
+      i += 1
+    return rtn
+
+  def choose(self, board, rng = random):
+    """
+    A book move for board picked at random in proportion to the weights, or
+    None if the position isn't in the book.
+    """
+    entries = self.entries(board)
+    total = sum(weight for move, weight, learn in entries)
+    if not total:
+      return None
+    pick = rng.randrange(total)
+    for move, weight, learn in entries:
+      pick -= weight
+      if pick < 0:
+        return move
+
+  def close(self):
+    if self.data:
+      self.data.close()
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Build or look in an '
+                                   'opening book')
+  commands = parser.add_subparsers(dest = 'command')
+  build_parser = commands.add_parser('build', help = 'build a book from PGN '
+                                     'games and EPD bm moves')
+  build_parser.add_argument('book')
+  build_parser.add_argument('inputs', nargs = '+',
+                            help = 'PGN files, or EPD files ending .epd')
+  build_parser.add_argument('-p', '--plies', type = int, default = 20,
+                            help = 'moves of each game to keep')
+  probe_parser = commands.add_parser('probe', help = 'list the book moves '
+                                     'for a position')
+  probe_parser.add_argument('book')
+  probe_parser.add_argument('fen', nargs = '?', default = Board().fen())
+  args = parser.parse_args(argv)
+
+  if args.command == 'build':
+    count = build(book_games(args.inputs, args.plies), args.book)
+    print '%d entries written to %s' % (count, args.book)
+    return 0
+  book = Book(args.book)
+  board = Board.from_fen(args.fen)
+  for move, weight, learn in book.entries(board):
+    print '%-8s %d' % (board.san(move), weight)
+  book.close()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
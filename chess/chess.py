@@ -1,23 +1,73 @@
+import collections
+import random
+import re
+
 class Location(object):
+  """
+  A square of the board. There is only one Location for each of the 64
+  squares, Location(row, col) returns the shared one, so they are immutable
+  and can be compared by identity, hashed and passed around without copying.
+  """
+  __slots__ = ('row', 'col', 'index')
   row_range = range(8)
   col_range = range(8)
+  _squares = [None] * 64
 
-  def __init__(self, row = 0, col = 0):
-    if row not in self.row_range or col not in self.col_range:
+  def __new__(cls, row = 0, col = 0):
+    if not (0 <= row < 8 and 0 <= col < 8):
   	  raise Exception('Illegal location ' + str(row) + ', ' + str(col))
-    self.row = row
-    self.col = col
+    # Index into the 64 entry square array, row major from a1.
+    index = row * 8 + col
+    rtn = cls._squares[index]
+    if rtn is None:
+      rtn = object.__new__(cls)
+      object.__setattr__(rtn, 'row', row)
+      object.__setattr__(rtn, 'col', col)
+      object.__setattr__(rtn, 'index', index)
+      cls._squares[index] = rtn
+    return rtn
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Location is immutable')
+
+  def __reduce__(self):
+    # Unpickle through __new__ so copies in other processes are interned too
+    return (Location, (self.row, self.col))
+
+  @classmethod
+  def at(cls, index):
+    """ The Location for a square index. """
+    return cls._squares[index]
 
   @classmethod
   def in_range(cls, row, col):
-    return row in cls.row_range and col in cls.col_range
+    return 0 <= row < 8 and 0 <= col < 8
 
   def __eq__(self, other_location):
-    return self.row == other_location.row and self.col == other_location.col
+    return self is other_location
+
+  def __ne__(self, other_location):
+    return self is not other_location
+
+  def __hash__(self):
+    return self.index
 
   def __str__(self):
     return str(self.row) + ', ' + str(self.col)
 
+  def name(self):
+    """ The square's algebraic name, e.x. Location(0, 4) is e1. """
+    return 'abcdefgh'[self.col] + str(self.row + 1)
+
+  @classmethod
+  def from_name(cls, name):
+    """ The Location for an algebraic square name such as e1. """
+    return cls(int(name[1]) - 1, 'abcdefgh'.index(name[0]))
+
+for _index in range(64):
+  Location(_index // 8, _index % 8)
+del _index
+
 class Color(object):
   black = 'BLACK'
   white = 'WHITE'
@@ -28,7 +78,183 @@ class Color(object):
       return Color.white
     return Color.black
 
+class Castling(object):
+  """ Bits of Board.castling, set while that castle is still allowed. """
+  white_kingside = 1
+  white_queenside = 2
+  black_kingside = 4
+  black_queenside = 8
+
+  # (king square, rook square, color, right) for each castle
+  squares = [(4, 7, Color.white, white_kingside),
+             (4, 0, Color.white, white_queenside),
+             (60, 63, Color.black, black_kingside),
+             (60, 56, Color.black, black_queenside)]
+
+  # FEN letter for each right
+  letters = [('K', white_kingside), ('Q', white_queenside),
+             ('k', black_kingside), ('q', black_queenside)]
+
+def _castling_mask():
+  """ Castling rights kept when a piece moves from or to each square. """
+  mask = [15] * 64
+  for king_sq, rook_sq, clr, right in Castling.squares:
+    mask[king_sq] &= ~right
+    mask[rook_sq] &= ~right
+  return mask
+
+CASTLING_MASK = _castling_mask()
+
+# Zobrist keys, random 64 bit numbers that are xor'ed together to hash a
+# position. Seeded so hashes are the same from one run to the next.
+_zobrist_random = random.Random(20140101)
+ZOBRIST_PIECES = dict((letter, [_zobrist_random.getrandbits(64)
+                                for i in range(64)])
+                      for letter in 'PNBRQKpnbrqk')
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for i in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for i in range(8)]
+ZOBRIST_CASTLING[0] = 0
+
+# Evaluation. Each piece is worth its material plus a bonus for the square it
+# is on, with one set of values for the middlegame and one for the endgame.
+# The two are blended by how much material is left (the phase), see
+# Board.evaluate. Values are in centipawns.
+MIDDLEGAME_VALUES = {'P': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+ENDGAME_VALUES = {'P': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+# How much each piece counts toward the phase, which is MAX_PHASE with all
+# of them on the board and 0 with only kings and pawns
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+# Square bonuses for white, written as the board is printed: the first row is
+# the 8th rank. Only the king's differ between middlegame and endgame.
+PIECE_SQUARE_TABLES = {
+  'P': [  0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0],
+  'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50],
+  'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20],
+  'R': [  0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0],
+  'Q': [-20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20],
+}
+KING_MIDDLEGAME_TABLE = [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20]
+KING_ENDGAME_TABLE = [
+        -50, -40, -30, -20, -20, -30, -40, -50,
+        -30, -20, -10,   0,   0, -10, -20, -30,
+        -30, -10,  20,  30,  30,  20, -10, -30,
+        -30, -10,  30,  40,  40,  30, -10, -30,
+        -30, -10,  30,  40,  40,  30, -10, -30,
+        -30, -10,  20,  30,  30,  20, -10, -30,
+        -30, -30,   0,   0,   0,   0, -30, -30,
+        -50, -30, -30, -30, -30, -30, -30, -50]
+
+def _piece_square_values(values, king_table):
+  """
+  For each piece letter, its value on each square index from white's point
+  of view, so black's are negative and mirrored top to bottom.
+  """
+  rtn = {}
+  for letter, value in values.items():
+    table = king_table if letter == 'K' else PIECE_SQUARE_TABLES[letter]
+    rtn[letter] = [value + table[(7 - i // 8) * 8 + i % 8] for i in range(64)]
+    rtn[letter.lower()] = [-value - table[i] for i in range(64)]
+  return rtn
+
+MIDDLEGAME_SQUARES = _piece_square_values(MIDDLEGAME_VALUES,
+                                          KING_MIDDLEGAME_TABLE)
+ENDGAME_SQUARES = _piece_square_values(ENDGAME_VALUES, KING_ENDGAME_TABLE)
+PHASE_WEIGHTS.update([(letter.lower(), weight)
+                      for letter, weight in PHASE_WEIGHTS.items()])
+
+def _step_targets(deltas):
+  """ For each square index, the square indices one (row, col) step away. """
+  rtn = []
+  for index in range(64):
+    row, col = index // 8, index % 8
+    rtn.append([(row + r) * 8 + col + c for r, c in deltas
+                if Location.in_range(row + r, col + c)])
+  return rtn
+
+def _rays(directions):
+  """
+  For each square index, a list per direction of the square indices along that
+  direction out to the edge of the board, nearest first.
+  """
+  rtn = []
+  for index in range(64):
+    rays = []
+    for r_delta, c_delta in directions:
+      ray = []
+      r, c = index // 8 + r_delta, index % 8 + c_delta
+      while Location.in_range(r, c):
+        ray.append(r * 8 + c)
+        r += r_delta
+        c += c_delta
+      if ray:
+        rays.append(ray)
+    rtn.append(rays)
+  return rtn
+
+KNIGHT_STEPS = [(1, 2), (1, -2), (2, 1), (2, -1),
+                (-1, 2), (-1, -2), (-2, 1), (-2, -1)]
+KING_STEPS = [(1, -1), (1, 0), (1, 1), (0, 1),
+              (-1, 1), (-1, 0), (-1, -1), (0, -1)]
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+KNIGHT_TARGETS = _step_targets(KNIGHT_STEPS)
+KING_TARGETS = _step_targets(KING_STEPS)
+ROOK_RAYS = _rays(ROOK_DIRECTIONS)
+BISHOP_RAYS = _rays(BISHOP_DIRECTIONS)
+# Where a pawn of each color has to stand to attack a square
+PAWN_ATTACKERS = {Color.white: _step_targets([(-1, -1), (-1, 1)]),
+                  Color.black: _step_targets([(1, -1), (1, 1)])}
+
 class Piece(object):
+  __slots__ = ('location', 'color', 'name', 'letter', 'move_count')
+
   def __init__(self, location = Location(), color = Color.black,
                name = 'DEFAULT', letter = 'D'):
     self.location = location
@@ -37,18 +263,39 @@ class Piece(object):
     self.letter = letter
     self.move_count = 0
 
+  def iter_moves(self, board, captures = None):
+    """
+    Yields the Move objects this piece can make on board, captures and
+    promotions first. captures True yields only those, False only the rest.
+    """
+    return iter(())
+
+  def moves(self, board):
+    """ Returns the Move objects this piece can make on board. """
+    return list(self.iter_moves(board))
+
+  def iter_legal_moves(self, board):
+    """ Yields a new board for each move this piece can make, lazily. """
+    for move in self.iter_moves(board):
+      yield board.apply_move(move)
+
   def legal_moves(self, board):
-    return []
+    """ Returns a new board for each move this piece can make. """
+    return list(self.iter_legal_moves(board))
 
   def copy(self):
     p = self.__class__()
     p.color = self.color
     p.name = self.name
     p.letter = self.letter
-    p.location = Location(self.location.row, self.location.col)
+    p.location = self.location
     p.move_count = self.move_count
     return p
 
+  def attacked(self, board):
+    """ Returns true if an oppenent piece attacks this piece. """
+    return is_square_attacked(board, self.location, Color.opposite(self.color))
+
   def direction(self):
     """
     White starts at the 0th row and moves toward the 7th row, so
@@ -79,12 +326,233 @@ class Piece(object):
   def __eq__(self, p):
     return (self.color == p.color and self.name == p.name and
             self.letter == p.letter and self.location == p.location)
-      
+
+class Move(object):
+  """
+  A single move of the piece at start to end, optionally promoting to the
+  piece class promotion. en_passant and castle mark the two moves that
+  also move or take a piece on another square. Making a move does not change
+  it, what is needed to take it back goes in Board.history, so one Move can
+  be made on any number of boards.
+  """
+  __slots__ = ('start', 'end', 'promotion', 'en_passant', 'castle')
+
+  def __init__(self, start, end, promotion = None, en_passant = False,
+               castle = False):
+    self.start = start
+    self.end = end
+    self.promotion = promotion
+    self.en_passant = en_passant
+    self.castle = castle
+
+  def __eq__(self, move):
+    return (self.start == move.start and self.end == move.end and
+            self.promotion == move.promotion)
+
+  def __ne__(self, move):
+    return not self == move
+
+  def __str__(self):
+    rtn = str(self.start) + ' to ' + str(self.end)
+    if self.promotion:
+      rtn += ' promoting to ' + self.promotion.__name__
+    return rtn
+
+  def uci(self):
+    """ The move in coordinate notation, e.x. e2e4 or a7a8q. """
+    rtn = self.start.name() + self.end.name()
+    if self.promotion:
+      rtn += self.promotion().letter.lower()
+    return rtn
+
+class History(object):
+  """
+  The entries make_move adds to a Board, as a linked list newest first:
+  making a move puts a new History in front of the old one, and taking it
+  back returns to the parent. Neither changes a History, so a copied board
+  shares its history with the board it was copied from. board is the one
+  that made the move. Indexing and iterating run oldest first, like the
+  list this replaces.
+  """
+  __slots__ = ('entry', 'parent', 'length', 'board')
+
+  def __init__(self, entry = None, parent = None, board = None):
+    self.entry = entry
+    self.parent = parent
+    self.board = board
+    self.length = parent.length + 1 if parent is not None else 0
+
+  def newest(self, count):
+    """ Returns a list of up to count entries, newest first. """
+    rtn = []
+    node = self
+    while node.length and len(rtn) < count:
+      rtn.append(node.entry)
+      node = node.parent
+    return rtn
+
+  def __len__(self):
+    return self.length
+
+  def __iter__(self):
+    return reversed(self.newest(self.length))
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return list(self)[i]
+    if i < 0:
+      i += self.length
+    if not 0 <= i < self.length:
+      raise IndexError('history index out of range')
+    node = self
+    for j in range(self.length - 1 - i):
+      node = node.parent
+    return node.entry
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
 class Board(object):
-  def __init__(self):
-    self.turn = Color.white
-    self.pieces = self.reset_pieces()
-    self.history = []
+  def __init__(self, pieces = None):
+    """ A board with the pieces given, or the starting position if None. """
+    self._turn = Color.white
+    self.pieces = self.reset_pieces() if pieces is None else pieces
+    # Starts at 1 and goes up after each of black's moves
+    self.fullmove_number = 1
+    # A PositionCache to look moves and check up in, shared by copies
+    self.cache = None
+
+  @property
+  def pieces(self):
+    return self._pieces
+
+  @pieces.setter
+  def pieces(self, pieces):
+    """
+    Replaces every piece on the board. The square array (self.squares) is the
+    primary store for lookups, so it is rebuilt from the new pieces here.
+    Castling rights are given to unmoved kings and rooks on their starting
+    squares, and no en passant capture is possible.
+    """
+    self._pieces = list(pieces)
+    self.squares = [None] * 64
+    for piece in self._pieces:
+      self.squares[piece.location.index] = piece
+    self._castling = 0
+    for king_sq, rook_sq, clr, right in Castling.squares:
+      king, rook = self.squares[king_sq], self.squares[rook_sq]
+      if (king and rook and king.name == 'King' and rook.name == 'Rook' and
+          king.color == clr and rook.color == clr and
+          king.move_count == 0 and rook.move_count == 0):
+        self._castling |= right
+    self._en_passant = None
+    self.zobrist = self.compute_zobrist()
+    self.middlegame, self.endgame, self.phase = self.compute_evaluation()
+    # One entry per move made, see make_move
+    self.history = History()
+    # Moves since the last capture or pawn move
+    self.halfmove_clock = 0
+
+  @property
+  def turn(self):
+    return self._turn
+
+  @turn.setter
+  def turn(self, turn):
+    if turn != self._turn:
+      self.zobrist ^= ZOBRIST_BLACK_TO_MOVE
+    self._turn = turn
+
+  @property
+  def castling(self):
+    """ Bitmask of the Castling rights still available. """
+    return self._castling
+
+  @castling.setter
+  def castling(self, castling):
+    self.zobrist ^= ZOBRIST_CASTLING[self._castling] ^ ZOBRIST_CASTLING[castling]
+    self._castling = castling
+
+  @property
+  def en_passant(self):
+    """
+    The Location a pawn just skipped over by moving two, if an oppenent pawn is
+    next to it and so could capture en passant. Otherwise None.
+    """
+    return self._en_passant
+
+  @en_passant.setter
+  def en_passant(self, location):
+    if self._en_passant:
+      self.zobrist ^= ZOBRIST_EN_PASSANT[self._en_passant.col]
+    if location:
+      self.zobrist ^= ZOBRIST_EN_PASSANT[location.col]
+    self._en_passant = location
+
+  def compute_zobrist(self):
+    """
+    Hashes the position from scratch. Moves keep self.zobrist up to date
+    without needing this.
+    """
+    key = 0
+    for piece in self._pieces:
+      key ^= ZOBRIST_PIECES[piece.letter][piece.location.index]
+    if self._turn == Color.black:
+      key ^= ZOBRIST_BLACK_TO_MOVE
+    key ^= ZOBRIST_CASTLING[self._castling]
+    if self._en_passant:
+      key ^= ZOBRIST_EN_PASSANT[self._en_passant.col]
+    return key
+
+  def compute_evaluation(self):
+    """
+    The (middlegame score, endgame score, phase) of the position from
+    scratch, scores from white's point of view. Moves keep self.middlegame,
+    self.endgame and self.phase up to date without needing this.
+    """
+    middlegame = endgame = phase = 0
+    for piece in self._pieces:
+      middlegame += MIDDLEGAME_SQUARES[piece.letter][piece.location.index]
+      endgame += ENDGAME_SQUARES[piece.letter][piece.location.index]
+      phase += PHASE_WEIGHTS[piece.letter]
+    return middlegame, endgame, phase
+
+  def evaluate(self):
+    """
+    The material and piece square score in centipawns from the side to
+    move's point of view, blending the middlegame and endgame scores by the
+    phase. Kept up to date as moves are made, so this is constant time.
+    """
+    phase = min(self.phase, MAX_PHASE)
+    score = (self.middlegame * phase +
+             self.endgame * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if self._turn == Color.white else -score
+
+  def add_piece(self, piece, index = None):
+    """
+    Places a piece on the board, keeping the squares and pieces in sync.
+    index is where it goes in the piece list, the end if None.
+    """
+    if index is None:
+      self._pieces.append(piece)
+    else:
+      self._pieces.insert(index, piece)
+    self.squares[piece.location.index] = piece
+
+  def remove_piece(self, piece):
+    """
+    Takes a piece off the board, keeping the squares and pieces in sync.
+    Returns where it was in the piece list.
+    """
+    for i, p in enumerate(self._pieces):
+      if p is piece:
+        del self._pieces[i]
+        break
+    self.squares[piece.location.index] = None
+    return i
 
   def reset_pieces(self):
     pieces = []
@@ -120,10 +588,7 @@ class Board(object):
 
   def at_location(self, location):
     """ Returns what is at a specific location. """
-    for piece in self.pieces:
-      if piece.location == location:
-        return piece
-    return None
+    return self.squares[location.index]
 
   def check_legal(self):
      """ Maybe include this to see if the current board is legal or not?"""
@@ -136,36 +601,495 @@ class Board(object):
     and takes a start location and moves the piece at that location to the
     end location, capturing if necessary.
     """
+    return self.apply_move(Move(start_location, end_location))
+
+  def apply_move(self, move):
+    """ Returns a copy of the board with move made on it. """
     new_board = self.copy()
-    # Capture if a piece exists at end location
-    capture_piece = new_board.at_location(end_location)
-    if capture_piece:
-      new_board.pieces.remove(capture_piece)
-    # Move piece
-    move_piece = new_board.at_location(start_location)
-    move_piece.move_count += 1
-    move_piece.location = end_location
-    # Update turn and piece history
-    new_board.turn = Color.opposite(self.turn)
-    new_board.history.append(self.pieces)
+    new_board.make_move(move)
     return new_board
 
+  def make_move(self, move):
+    """
+    Makes move on this board in place, capturing if necessary. Like move this
+    does not check that it is legal. Undo it with unmake_move.
+
+    Appends (move, zobrist, castling, en passant, halfmove clock, captured
+    piece, its piece list index, promoted pawn, its piece list index,
+    middlegame, endgame, phase, captured move count, pawn move count) to
+    self.history, holding what the move can't be reversed from: the state
+    before it and the pieces it took off the board. unmake_move puts those
+    same pieces back, and a copied board rebuilds them from the entry.
+    """
+    squares = self.squares
+    start = move.start.index
+    end = move.end.index
+    piece = squares[start]
+    if move.en_passant:
+      captured = squares[move.start.row * 8 + move.end.col]
+    else:
+      captured = squares[end]
+    key = self.zobrist
+    middlegame = self.middlegame
+    endgame = self.endgame
+    phase = self.phase
+    captured_index = None
+    if captured:
+      captured_index = self.remove_piece(captured)
+      index = captured.location.index
+      key ^= ZOBRIST_PIECES[captured.letter][index]
+      middlegame -= MIDDLEGAME_SQUARES[captured.letter][index]
+      endgame -= ENDGAME_SQUARES[captured.letter][index]
+      phase -= PHASE_WEIGHTS[captured.letter]
+    entry = (move, self.zobrist, self._castling, self._en_passant,
+             self.halfmove_clock, captured, captured_index,
+             piece if move.promotion else None,
+             self.remove_piece(piece) if move.promotion else None,
+             self.middlegame, self.endgame, self.phase,
+             captured and captured.move_count, piece.move_count)
+    self.history = History(entry, self.history, self)
+    if captured or piece.name == 'Pawn':
+      self.halfmove_clock = 0
+    else:
+      self.halfmove_clock += 1
+    if self._turn == Color.black:
+      self.fullmove_number += 1
+    piece.move_count += 1
+    letter = piece.letter
+    key ^= ZOBRIST_PIECES[letter][start]
+    middlegame -= MIDDLEGAME_SQUARES[letter][start]
+    endgame -= ENDGAME_SQUARES[letter][start]
+    if move.promotion:
+      promoted = move.promotion(move.end, piece.color)
+      promoted.move_count = piece.move_count
+      self.add_piece(promoted)
+      letter = promoted.letter
+      phase += PHASE_WEIGHTS[letter] - PHASE_WEIGHTS[piece.letter]
+    else:
+      squares[start] = None
+      piece.location = move.end
+      squares[end] = piece
+    key ^= ZOBRIST_PIECES[letter][end]
+    middlegame += MIDDLEGAME_SQUARES[letter][end]
+    endgame += ENDGAME_SQUARES[letter][end]
+    if move.castle:
+      rook_start, rook_end = castle_rook_squares(start, end)
+      rook = squares[rook_start]
+      squares[rook_start] = None
+      rook.location = Location.at(rook_end)
+      rook.move_count += 1
+      squares[rook_end] = rook
+      letter = rook.letter
+      key ^= (ZOBRIST_PIECES[letter][rook_start] ^
+              ZOBRIST_PIECES[letter][rook_end])
+      middlegame += (MIDDLEGAME_SQUARES[letter][rook_end] -
+                     MIDDLEGAME_SQUARES[letter][rook_start])
+      endgame += (ENDGAME_SQUARES[letter][rook_end] -
+                  ENDGAME_SQUARES[letter][rook_start])
+    self.middlegame = middlegame
+    self.endgame = endgame
+    self.phase = phase
+    # Castling rights and en passant
+    castling = self._castling & CASTLING_MASK[start] & CASTLING_MASK[end]
+    if castling != self._castling:
+      key ^= ZOBRIST_CASTLING[self._castling] ^ ZOBRIST_CASTLING[castling]
+      self._castling = castling
+    if self._en_passant:
+      key ^= ZOBRIST_EN_PASSANT[self._en_passant.col]
+      self._en_passant = None
+    if piece.name == 'Pawn' and abs(end - start) == 16:
+      for col in (move.end.col - 1, move.end.col + 1):
+        if 0 <= col < 8:
+          other = squares[move.end.row * 8 + col]
+          if (other and other.name == 'Pawn' and
+              other.color != piece.color):
+            self._en_passant = Location((move.start.row + move.end.row) // 2,
+                                        move.end.col)
+            key ^= ZOBRIST_EN_PASSANT[move.end.col]
+            break
+    self._turn = Color.opposite(self._turn)
+    self.zobrist = key ^ ZOBRIST_BLACK_TO_MOVE
+
+  def unmake_move(self, move = None):
+    """
+    Takes back the last move made on this board, which is move if it is
+    given. Returns the move taken back.
+    """
+    history = self.history
+    if not history:
+      raise IndexError('no move to take back')
+    (move, zobrist, castling, en_passant, halfmove_clock, captured,
+     captured_index, pawn, pawn_index, self.middlegame, self.endgame,
+     self.phase, captured_count, pawn_count) = history.entry
+    self.history = history.parent
+    if history.board is not self:
+      # The move was made on the board this one was copied from, which may
+      # have put these pieces back and moved them since, so rebuild them
+      if captured:
+        captured = captured.copy()
+        captured.location = (Location(move.start.row, move.end.col)
+                             if move.en_passant else move.end)
+        captured.move_count = captured_count
+      if pawn:
+        pawn = pawn.copy()
+        pawn.location = move.start
+        pawn.move_count = pawn_count + 1
+    self._turn = Color.opposite(self._turn)
+    if self._turn == Color.black:
+      self.fullmove_number -= 1
+    self._castling = castling
+    self._en_passant = en_passant
+    self.zobrist = zobrist
+    self.halfmove_clock = halfmove_clock
+    if pawn:
+      self.remove_piece(self.squares[move.end.index])
+      self.add_piece(pawn, pawn_index)
+      pawn.move_count -= 1
+    else:
+      piece = self.squares[move.end.index]
+      piece.move_count -= 1
+      self.squares[move.end.index] = None
+      piece.location = move.start
+      self.squares[move.start.index] = piece
+    if move.castle:
+      rook_start, rook_end = castle_rook_squares(move.start.index,
+                                                 move.end.index)
+      rook = self.squares[rook_end]
+      self.squares[rook_end] = None
+      rook.location = Location.at(rook_start)
+      rook.move_count -= 1
+      self.squares[rook_start] = rook
+    if captured:
+      self.add_piece(captured, captured_index)
+    return move
+
+  def repetitions(self):
+    """
+    How many times the current position has occurred in this game, counting
+    this time. Positions before the last capture or pawn move can't come
+    again, so only those since are compared, by hash.
+    """
+    rtn = 1
+    for entry in self.history.newest(self.halfmove_clock)[1::2]:
+      if entry[1] == self.zobrist:
+        rtn += 1
+    return rtn
+
+  def is_threefold_repetition(self):
+    return self.repetitions() >= 3
+
+  def is_fifty_moves(self):
+    """ True once fifty moves each have passed with no capture or pawn move. """
+    return self.halfmove_clock >= 100
+
+  def king(self, color):
+    """ Returns the king of color, or None if it has no king. """
+    for piece in self._pieces:
+      if piece.name == 'King' and piece.color == color:
+        return piece
+    return None
+
+  def in_check(self):
+    """ Returns true if the side to move is in check. """
+    if self.cache is not None:
+      return self.cache.in_check(self)
+    king = self.king(self._turn)
+    return king is not None and king.in_check(self)
+
+  def pins(self, king):
+    """
+    Finds pieces pinned to king. Returns a dict from the square index of each
+    pinned piece to the set of square indices it may still move to, which are
+    those between the king and the pinning piece, the pinner included.
+    """
+    rtn = {}
+    squares = self.squares
+    # The pinning sliders are the oppenent's
+    upper = king.color == Color.black
+    for rays, sliders in ((ROOK_RAYS, ('R', 'Q') if upper else ('r', 'q')),
+                          (BISHOP_RAYS, ('B', 'Q') if upper else ('b', 'q'))):
+      for ray in rays[king.location.index]:
+        blocker = None
+        for j, i in enumerate(ray):
+          piece = squares[i]
+          if not piece:
+            continue
+          if blocker is None and piece.color == king.color:
+            blocker = i
+            continue
+          if blocker is not None and piece.letter in sliders:
+            rtn[blocker] = set(ray[:j + 1])
+          break
+    return rtn
+
+  def legal_moves(self):
+    """
+    Returns every legal Move for the side to move.
+
+    Checkers and pinned pieces are found once up front, so each piece's moves
+    can be filtered without playing them out: in double check only the king
+    may move, in single check other pieces must capture the checker or block
+    it, and pinned pieces must stay between their king and the pinner.
+    """
+    if self.cache is not None:
+      return list(self.cache.moves(self))
+    return list(self._iter_legal(self._legal_setup(), None))
+
+  def iter_legal_moves(self, captures_only = False):
+    """
+    Yields the same moves as legal_moves, but lazily and with every capture
+    and promotion before any other move, so a caller that stops early (a
+    search cutoff, or just asking whether any move exists) skips generating
+    the rest. captures_only stops after the captures and promotions.
+    """
+    setup = self._legal_setup()
+    for move in self._iter_legal(setup, True):
+      yield move
+    if not captures_only:
+      for move in self._iter_legal(setup, False):
+        yield move
+
+  def has_legal_move(self):
+    """ Returns true if the side to move has any legal move. """
+    if self.cache is not None:
+      return bool(self.cache.moves(self))
+    for move in self.iter_legal_moves():
+      return True
+    return False
+
+  def is_checkmate(self):
+    return self.in_check() and not self.has_legal_move()
+
+  def is_stalemate(self):
+    return not self.in_check() and not self.has_legal_move()
+
+  def _legal_setup(self):
+    """
+    Returns (king, checkers, block, pinned) for the side to move: the square
+    indices of pieces giving check, the squares a non king move must land on
+    to answer a single check (None when not in check) and pins().
+    """
+    king = self.king(self._turn)
+    if king is None:
+      return None, [], None, {}
+    king_index = king.location.index
+    checkers = square_attackers(self, king.location,
+                                Color.opposite(self._turn))
+    block = None
+    if checkers:
+      block = set(checkers)
+      for ray in ROOK_RAYS[king_index] + BISHOP_RAYS[king_index]:
+        if checkers[0] in ray:
+          block.update(ray[:ray.index(checkers[0])])
+          break
+    return king, checkers, block, self.pins(king)
+
+  def _iter_legal(self, setup, captures):
+    """ Legal moves from the pieces' iter_moves(board, captures). """
+    king, checkers, block, pinned = setup
+    color = self._turn
+    if king is not None:
+      for move in king.iter_moves(self, captures):
+        yield move
+      if len(checkers) > 1:
+        return
+    for piece in list(self._pieces):
+      if piece.color != color or piece is king:
+        continue
+      allowed = pinned.get(piece.location.index)
+      for move in piece.iter_moves(self, captures):
+        if king is None:
+          # For experimentation boards without a king have no checks or pins
+          yield move
+          continue
+        if move.en_passant:
+          # Taking en passant clears two squares at once, which can expose
+          # the king along the rank, so play it out to check.
+          self.make_move(move)
+          legal = not king.in_check(self)
+          self.unmake_move(move)
+          if legal:
+            yield move
+          continue
+        end = move.end.index
+        if block is not None and end not in block:
+          continue
+        if allowed is not None and end not in allowed:
+          continue
+        yield move
+
   def copy(self):
-    rtn = Board()
-    rtn.pieces = []
-    rtn.turn = self.turn
+    rtn = Board([piece.copy() for piece in self.pieces])
+    rtn._turn = self._turn
+    rtn._castling = self._castling
+    rtn._en_passant = self._en_passant
+    rtn.zobrist = self.zobrist
+    rtn.halfmove_clock = self.halfmove_clock
+    rtn.fullmove_number = self.fullmove_number
+    rtn.cache = self.cache
     rtn.history = self.history
-    for piece in self.pieces:
-      rtn.pieces.append(piece.copy())
     return rtn
 
+  @classmethod
+  def from_fen(cls, fen):
+    """
+    Builds a board from Forsyth-Edwards Notation. Kings and rooks that have
+    lost their castling rights, and pawns off their starting row, are given
+    a move_count of 1 so the board reads the same as one reached by moving.
+    Fields after the piece placement may be left off, as EPD does with the
+    move clocks, and default to white to move, no castling, no en passant
+    and the clocks of a new game.
+    """
+    fields = fen.split()
+    ranks = fields[0].split('/') if fields else []
+    if len(ranks) != 8:
+      raise Exception('Illegal FEN ' + fen)
+    pieces = []
+    for i, rank in enumerate(ranks):
+      row = 7 - i
+      col = 0
+      for letter in rank:
+        if letter.isdigit():
+          col += int(letter)
+          continue
+        color = Color.white if letter.isupper() else Color.black
+        piece = PIECES_BY_LETTER[letter.lower()](Location(row, col), color)
+        if piece.name != 'Pawn' or row != piece.row(1):
+          piece.move_count = 1
+        pieces.append(piece)
+        col += 1
+    castling = 0
+    rights = fields[2] if len(fields) > 2 else '-'
+    for letter, right in Castling.letters:
+      if letter in rights:
+        castling |= right
+    board = cls([])
+    squares = [None] * 64
+    for piece in pieces:
+      squares[piece.location.index] = piece
+    for king_sq, rook_sq, clr, right in Castling.squares:
+      if not castling & right:
+        continue
+      king, rook = squares[king_sq], squares[rook_sq]
+      if (king and rook and king.name == 'King' and rook.name == 'Rook' and
+          king.color == clr and rook.color == clr):
+        king.move_count = 0
+        rook.move_count = 0
+      else:
+        # The king or rook isn't home to castle with, so the right is bogus
+        castling &= ~right
+    board.pieces = pieces
+    board.castling = castling
+    if len(fields) > 1 and fields[1] == 'b':
+      board.turn = Color.black
+    # Only keep an en passant square a pawn could actually capture onto
+    if len(fields) > 3 and fields[3] != '-':
+      ep = Location.from_name(fields[3])
+      if any(p.name == 'Pawn' and p.color == board.turn and p.location.row ==
+             ep.row - p.direction() and abs(p.location.col - ep.col) == 1
+             for p in pieces):
+        board.en_passant = ep
+    if len(fields) > 5:
+      board.halfmove_clock = int(fields[4])
+      board.fullmove_number = int(fields[5])
+    return board
+
+  def fen(self):
+    """ The board in Forsyth-Edwards Notation. """
+    ranks = []
+    for row in (7, 6, 5, 4, 3, 2, 1, 0):
+      rank = ''
+      empty = 0
+      for piece in self.squares[row * 8:row * 8 + 8]:
+        if piece:
+          if empty:
+            rank += str(empty)
+            empty = 0
+          rank += piece.letter
+        else:
+          empty += 1
+      if empty:
+        rank += str(empty)
+      ranks.append(rank)
+    castling = ''.join(letter for letter, right in Castling.letters
+                       if self._castling & right)
+    return ' '.join(['/'.join(ranks),
+                     'w' if self._turn == Color.white else 'b',
+                     castling or '-',
+                     self._en_passant.name() if self._en_passant else '-',
+                     str(self.halfmove_clock), str(self.fullmove_number)])
+
+  def san(self, move):
+    """
+    The legal move in Standard Algebraic Notation, e.x. Nf3, exd5, O-O or
+    e8=Q#. The file or rank the piece moved from is added only when another
+    piece of the same kind could also move to the end square.
+    """
+    piece = self.squares[move.start.index]
+    if move.castle:
+      rtn = 'O-O' if move.end.col == 6 else 'O-O-O'
+    else:
+      capture = self.squares[move.end.index] or move.en_passant
+      if piece.name == 'Pawn':
+        rtn = move.start.name()[0] + 'x' if capture else ''
+      else:
+        rtn = piece.letter.upper()
+        others = [m.start for m in self.legal_moves()
+                  if m.end == move.end and m.start != move.start and
+                  self.squares[m.start.index].letter == piece.letter]
+        if others:
+          if all(other.col != move.start.col for other in others):
+            rtn += move.start.name()[0]
+          elif all(other.row != move.start.row for other in others):
+            rtn += move.start.name()[1]
+          else:
+            rtn += move.start.name()
+        if capture:
+          rtn += 'x'
+      rtn += move.end.name()
+      if move.promotion:
+        rtn += '=' + move.promotion().letter.upper()
+    self.make_move(move)
+    if self.in_check():
+      rtn += '+' if self.has_legal_move() else '#'
+    self.unmake_move()
+    return rtn
+
+  def parse_san(self, san):
+    """
+    The legal Move written as san in Standard Algebraic Notation. Check and
+    annotation marks are ignored, and the = before a promotion and 0-0 for
+    O-O are accepted. Raises ValueError if san isn't exactly one legal move.
+    """
+    text = san.rstrip('+#!?').replace('0', 'O')
+    moves = self.legal_moves()
+    if text in ('O-O', 'O-O-O'):
+      col = 6 if text == 'O-O' else 2
+      matches = [m for m in moves if m.castle and m.end.col == col]
+    else:
+      match = SAN_PATTERN.match(text)
+      if not match:
+        raise ValueError('Illegal move ' + san)
+      letter, file_, rank, end, promotion = match.groups()
+      letter = letter or 'P'
+      end = Location.from_name(end)
+      if promotion:
+        promotion = PIECES_BY_LETTER[promotion.lower()]
+      matches = [m for m in moves if m.end == end and
+                 m.promotion == promotion and not m.castle and
+                 self.squares[m.start.index].letter.upper() == letter and
+                 (not file_ or m.start.name()[0] == file_) and
+                 (not rank or m.start.name()[1] == rank)]
+    if len(matches) != 1:
+      raise ValueError('Illegal move ' + san)
+    return matches[0]
+
   def __str__(self):
     rtn = ""
     # Print board from top to bottom, high indicies first.
     for i in (7, 6, 5, 4, 3, 2, 1, 0):
       rtn += str(i+1) + ' '
-      for j in range(8):
-        piece = self.at_location(Location(i, j))
+      for piece in self.squares[i * 8:i * 8 + 8]:
         if piece:
           rtn += piece.letter
         else:
@@ -175,208 +1099,357 @@ class Board(object):
     return rtn
 
   def __eq__(self, board):
-    if len(self.pieces) != len(board.pieces):
+    if (board.turn != self.turn or board.castling != self.castling or
+        board.en_passant != self.en_passant):
       return False
-    for piece in self.pieces:
-      if piece not in board.pieces:
+    # Pieces on the same square already share a location, so only the kind of
+    # piece needs comparing.
+    for mine, theirs in zip(self.squares, board.squares):
+      if mine is None or theirs is None:
+        if mine is not theirs:
+          return False
+      elif (mine.color != theirs.color or mine.name != theirs.name or
+            mine.letter != theirs.letter):
         return False
-    if board.turn != self.turn:
-      return False
     return True
 
   def __hash__(self):
-    return str(self).__hash__()
+    return self.zobrist
+
+class PositionCache(object):
+  """
+  Remembers the legal moves and check of positions already seen, keyed by
+  Board.zobrist, for work that keeps coming back to the same positions.
+  Setting board.cache to one makes the board's legal_moves, in_check,
+  has_legal_move, is_checkmate and is_stalemate look there first;
+  iter_legal_moves stays lazy and uncached for search.
+
+  The cache holds at most max_entries positions and, if max_bytes is given,
+  roughly that many bytes, dropping the least recently used first. hits,
+  misses and evictions count what happened, see stats().
+  """
+  # Rough sizes, from sys.getsizeof on 64 bit CPython 2.7, of an entry with
+  # the OrderedDict's own links and key, and of each move it holds
+  ENTRY_BYTES = 320
+  MOVE_BYTES = 96
+
+  def __init__(self, max_entries = 1 << 16, max_bytes = None):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    # Zobrist key to [moves, in check], oldest used first
+    self.entries = collections.OrderedDict()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def _entry(self, board):
+    """ The entry for board, made the most recently used. """
+    key = board.zobrist
+    # Taking it out and putting it back moves it to the end
+    entry = self.entries.pop(key, None)
+    if entry is None:
+      entry = [None, None]
+      self.bytes += self.ENTRY_BYTES
+    self.entries[key] = entry
+    return entry
+
+  def _evict(self):
+    entries = self.entries
+    while entries and (len(entries) > self.max_entries or
+                       (self.max_bytes and self.bytes > self.max_bytes)):
+      key, (moves, check) = entries.popitem(last = False)
+      self.bytes -= self.ENTRY_BYTES + self.MOVE_BYTES * len(moves or ())
+      self.evictions += 1
+
+  def moves(self, board):
+    """ A tuple of board's legal moves. """
+    entry = self._entry(board)
+    if entry[0] is not None:
+      self.hits += 1
+      return entry[0]
+    self.misses += 1
+    moves = tuple(board._iter_legal(board._legal_setup(), None))
+    entry[0] = moves
+    self.bytes += self.MOVE_BYTES * len(moves)
+    self._evict()
+    return moves
+
+  def in_check(self, board):
+    """ True if the side to move on board is in check. """
+    entry = self._entry(board)
+    if entry[1] is not None:
+      self.hits += 1
+      return entry[1]
+    self.misses += 1
+    king = board.king(board.turn)
+    entry[1] = king is not None and king.in_check(board)
+    self._evict()
+    return entry[1]
+
+  def status(self, board):
+    """
+    'checkmate' or 'stalemate' if the side to move on board has no moves,
+    otherwise None. Repetitions and the fifty move rule depend on the game
+    rather than the position, so aren't cached.
+    """
+    if self.moves(board):
+      return None
+    return 'checkmate' if self.in_check(board) else 'stalemate'
+
+  def stats(self):
+    """ The counts and size of the cache as a dict. """
+    lookups = self.hits + self.misses
+    return {'entries': len(self.entries), 'bytes': self.bytes,
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+
+  def clear(self):
+    """ Forgets every position, keeping the counts. """
+    self.entries.clear()
+    self.bytes = 0
 
 class Pawn(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
     super(Pawn, self).__init__(location, color, 'Pawn', 'P' if color == Color.white else 'p')
 
-  def legal_moves(self, board):
-    rtn = []
-    col = self.location.col
-    # First move can go two
-    if (self.location.row == self.row(1) and
-        not board.at_location(Location(self.row(2),col)) and
-        not board.at_location(Location(self.row(3),col))):
-      rtn.append(board.move(self.location, Location(self.row(3), col)))
-    # Move forward one
+  def iter_moves(self, board, captures = None):
     row = self.location.row + self.direction()
-    col = self.location.col
-    if (Location.in_range(row, col) and
-        not board.at_location(Location(row, col))):
-      if row != self.row(7):
-        rtn.append(board.move(self.location, Location(row, col)))
-      else:
-        rtn.extend(self.pawn_upgrade(board, self.location,
-                                     Location(row, col)))
-    # Captures
-    for col_delta in [-1, 1]:
-      col = self.location.col + col_delta 
-      if Location.in_range(row, col):
+    if not Location.in_range(row, 0):
+      return
+    promoting = row == self.row(7)
+    if captures is not False:
+      # Captures
+      for col_delta in [-1, 1]:
+        col = self.location.col + col_delta
+        if not Location.in_range(row, col):
+          continue
         capture_piece = board.at_location(Location(row, col))
         if capture_piece and capture_piece.color != self.color:
-          if row != self.row(7):
-            rtn.append(board.move(self.location,
-                                  Location(row, col)))
+          if promoting:
+            for move in self.pawn_upgrade(self.location, Location(row, col)):
+              yield move
           else:
-            rtn.extend(self.pawn_upgrade(board, self.location,
-                                         Location(row, col)))
-      # En Passant
-      if self.location.row == self.row(4):
-        piece = board.at_location(Location(self.location.row, col))
-        if piece.name == Pawn.name and piece.move_count == 1:
-          new_board = board.move(self.location, Location(row, col))
-          captured_piece = new_board.at_location(Location(self.location.row, col))
-          new_board.piece.remove(captured_piece)
-          rtn.append(new_board) 
-    return rtn
+            yield Move(self.location, Location(row, col))
+      # En Passant, onto the square an oppenent pawn just skipped over
+      ep = board.en_passant
+      if (ep and ep.row == row and abs(ep.col - self.location.col) == 1 and
+          self.location.row == self.row(4)):
+        yield Move(self.location, ep, en_passant = True)
+    # Move forward one, promotions count with the captures
+    col = self.location.col
+    if board.at_location(Location(row, col)):
+      return
+    if promoting:
+      if captures is not False:
+        for move in self.pawn_upgrade(self.location, Location(row, col)):
+          yield move
+      return
+    if captures:
+      return
+    yield Move(self.location, Location(row, col))
+    # First move can go two
+    if (self.location.row == self.row(1) and
+        not board.at_location(Location(self.row(3),col))):
+      yield Move(self.location, Location(self.row(3), col))
 
-  def pawn_upgrade(self, board, old_location, new_location):
+  def pawn_upgrade(self, old_location, new_location):
     rtn = []
-    for piece in [Pawn, Bishop, Rook, Knight, Queen]:
-      new_board = board.move(old_location, new_location)
-      new_piece = new_board.at_location(new_location)
-      new_board.pieces.remove(new_piece)
-      new_board.pieces.append(piece(Location(new_location)))
-      rtn.append(new_board)
+    for piece in [Queen, Rook, Bishop, Knight]:
+      rtn.append(Move(old_location, new_location, piece))
     return rtn
 
 class Rook(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
   	super(Rook, self).__init__(location, color, 'Rook', 'R' if color == Color.white else 'r')
 
-  def legal_moves(self, board):
-    rtn = []
-    for r_delta, c_delta in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-      r = self.location.row + r_delta
-      c = self.location.col + c_delta
-      if Location.in_range(r, c):
-        piece = board.at_location(Location(r, c))
-        while not piece and Location.in_range(r, c):
-          rtn.append(board.move(self.location, Location(r, c)))
-          r += r_delta
-          c += c_delta
-          if Location.in_range(r, c):
-            piece = board.at_location(Location(r, c))
-          else:
-            piece = None
-        if piece and piece.color != self.color:
-          rtn.append(board.move(self.location, Location(r, c)))
-    return rtn
+  def iter_moves(self, board, captures = None):
+    return slide(self, board, ROOK_DIRECTIONS, captures)
 
 class Knight(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
     super(Knight, self).__init__(location, color, 'Knight', 'N' if color == Color.white else 'n')
 
-  def legal_moves(self, board):
-    rtn = []
-    for r_delta, c_delta in [(1, 2), (1, -2), (2, 1), (2, -1),
-                             (-1, 2), (-1, -2), (-2, 1), (-2, -1)]:
-      r = self.location.row + r_delta
-      c = self.location.col + c_delta
-      if Location.in_range(r, c):
-        piece = board.at_location(Location(r, c))
-        if not piece or piece.color != self.color:
-          rtn.append(board.move(self.location, Location(r, c)))
-    return rtn
+  def iter_moves(self, board, captures = None):
+    return step(self, board, KNIGHT_STEPS, captures)
 
 class Bishop(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
     super(Bishop, self).__init__(location, color, 'Bishop', 'B' if color == Color.white else 'b')
 
-  def legal_moves(self, board):
-    rtn = []
-    for r_delta, c_delta in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-      r = self.location.row + r_delta
-      c = self.location.col + c_delta
-      if Location.in_range(r, c):
-        piece = board.at_location(Location(r, c))
-        while not piece and Location.in_range(r, c):
-          rtn.append(board.move(self.location, Location(r, c)))
-          r += r_delta
-          c += c_delta
-          if Location.in_range(r, c):
-            piece = board.at_location(Location(r, c))
-          else:
-            piece = None
-        if piece and piece.color != self.color:
-          rtn.append(board.move(self.location, Location(r, c)))
-    return rtn
+  def iter_moves(self, board, captures = None):
+    return slide(self, board, BISHOP_DIRECTIONS, captures)
 
 class Queen(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
   	super(Queen, self).__init__(location, color, 'Queen', 'Q' if color == Color.white else 'q')
 
-  def legal_moves(self, board):
-    rtn = []
-    for r_delta, c_delta in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1),
-                             (-1, 1), (-1, -1)]:
-      r = self.location.row + r_delta
-      c = self.location.col + c_delta
-      if Location.in_range(r, c):
-        piece = board.at_location(Location(r, c))
-        while not piece and Location.in_range(r, c):
-          rtn.append(board.move(self.location, Location(r, c)))
-          r += r_delta
-          c += c_delta
-          if Location.in_range(r, c):
-            piece = board.at_location(Location(r, c))
-          else:
-            piece = None
-        if piece and piece.color != self.color:
-          rtn.append(board.move(self.location, Location(r, c)))
-    return rtn
+  def iter_moves(self, board, captures = None):
+    return slide(self, board, ROOK_DIRECTIONS + BISHOP_DIRECTIONS, captures)
 
 class King(Piece):
+  __slots__ = ()
+
   def __init__(self, location = Location(), color = Color.black):
   	super(King, self).__init__(location, color, 'King', 'K' if color == Color.white else 'k')
 
-  def legal_moves(self, board):
-    rtn = []
-    for r_delta, c_delta in [(1, -1), (1, 0), (1, 1), (0, 1),
-                             (-1, 1), (-1, 0), (-1, -1), (0, -1)]:
-      r = self.location.row + r_delta
-      c = self.location.col + c_delta
-      if Location.in_range(r, c):
-        piece = board.at_location(Location(r, c))
-        if not piece or piece.color != self.color:
-          new_board = board.move(self.location, Location(r, c))
-          new_king = new_board.at_location(Location(r, c))
-          if not new_king.in_check(new_board):
-            rtn.append(new_board)
-    # Castling (TODO)
-    #if self.move_count == 0:
-    #  for loc in [Location(self.row(0),0), Location(self.row(0),7)]:
-        
-    return rtn
+  def iter_moves(self, board, captures = None):
+    for move in step(self, board, KING_STEPS, captures):
+      # Try the move in place and take it back once checked
+      board.make_move(move)
+      safe = not self.in_check(board)
+      board.unmake_move(move)
+      if safe:
+        yield move
+    if captures:
+      return
+    # Castling, the king may not castle out of, through or into check
+    for king_sq, rook_sq, clr, right in Castling.squares:
+      if (clr != self.color or not board.castling & right or
+          self.location.index != king_sq):
+        continue
+      step_ = 1 if rook_sq > king_sq else -1
+      if any(board.squares[i] for i in range(king_sq + step_, rook_sq, step_)):
+        continue
+      enemy = Color.opposite(self.color)
+      if (self.in_check(board) or
+          any(is_square_attacked(board, Location(self.row(0), i % 8), enemy)
+              for i in (king_sq + step_, king_sq + 2 * step_))):
+        continue
+      yield Move(self.location,
+                 Location(self.row(0), self.location.col + 2 * step_),
+                 castle = True)
 
   def in_check(self, board):
-    """ Returns true if this king is in check.
-
-    Contruct the moves of all oppenent pieces and see if king
-    is stolen, if so return true (don't construct other king's moves,
-    as that would infinite loop, instead check his position manually).
-    """
-    oppenent_pieces = [x for x in board.pieces if (x.color != self.color and
-                                                   x.name != self.name)]
-    moves = []
-    for p in oppenent_pieces:
-      moves.extend(p.legal_moves(board))
-
-    for move in moves:
-      if not len([1 for x in move.pieces if (x.color == self.color and
-                                             x.name == self.name)]):
-        return True
-
-    # For experimentation it can be helpful to have 0 or multiple kings
-    oppenent_kings = [x for x in board.pieces if (x.color != self.color and
-                                                 x.name == self.name)]
-    for oppenent_king in oppenent_kings:
-      if (abs(oppenent_king.location.row - self.location.row) < 2 and
-          abs(oppenent_king.location.col - self.location.col) < 2):
-        return True
-    
-    return False
+    """ Returns true if this king is in check. """
+    return self.attacked(board)
+
+def step(piece, board, deltas, captures = None):
+  """
+  Moves for a piece that steps once by each (row, col) delta onto a square
+  that is empty or holds an oppenent's piece. captures is as in iter_moves.
+  """
+  for r_delta, c_delta in deltas:
+    r = piece.location.row + r_delta
+    c = piece.location.col + c_delta
+    if Location.in_range(r, c):
+      other = board.at_location(Location(r, c))
+      if other:
+        if other.color != piece.color and captures is not False:
+          yield Move(piece.location, Location(r, c))
+      elif not captures:
+        yield Move(piece.location, Location(r, c))
+
+def slide(piece, board, directions, captures = None):
+  """
+  Moves for a piece that slides any distance along each (row, col) direction
+  until it is blocked, capturing the blocking piece if it is an oppenent's.
+  captures is as in iter_moves.
+  """
+  for r_delta, c_delta in directions:
+    r = piece.location.row + r_delta
+    c = piece.location.col + c_delta
+    while Location.in_range(r, c):
+      other = board.at_location(Location(r, c))
+      if other:
+        if other.color != piece.color and captures is not False:
+          yield Move(piece.location, Location(r, c))
+        break
+      if not captures:
+        yield Move(piece.location, Location(r, c))
+      r += r_delta
+      c += c_delta
+
+# Piece letter, from file, from rank, end square and promotion of a SAN move
+SAN_PATTERN = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])=?([QRBN])?$')
+
+PIECES_BY_LETTER = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook,
+                    'q': Queen, 'k': King}
+
+def castle_rook_squares(king_start, king_end):
+  """ The square indices a rook castling with the king moves from and to. """
+  if king_end > king_start:
+    return king_end + 1, king_end - 1
+  return king_end - 2, king_end + 1
+
+def square_attackers(board, square, by_color):
+  """
+  Like is_square_attacked, but returns the square indices of every piece of
+  by_color attacking square.
+  """
+  rtn = []
+  squares = board.squares
+  index = square.index
+  white = by_color == Color.white
+  pawn, knight, king = ('P', 'N', 'K') if white else ('p', 'n', 'k')
+  rook, bishop, queen = ('R', 'B', 'Q') if white else ('r', 'b', 'q')
+  for targets, letter in ((KNIGHT_TARGETS, knight), (KING_TARGETS, king),
+                          (PAWN_ATTACKERS[by_color], pawn)):
+    for i in targets[index]:
+      piece = squares[i]
+      if piece and piece.letter == letter:
+        rtn.append(i)
+  for rays, slider in ((ROOK_RAYS, rook), (BISHOP_RAYS, bishop)):
+    for ray in rays[index]:
+      for i in ray:
+        piece = squares[i]
+        if piece:
+          if piece.letter == slider or piece.letter == queen:
+            rtn.append(i)
+          break
+  return rtn
+
+def is_square_attacked(board, square, by_color):
+  """
+  Returns true if any piece of by_color attacks the Location square.
+
+  Rather than generating the attacker's moves this looks outward from the
+  square: a knight a knight's jump away, a pawn or king one step away, or a
+  rook, bishop or queen at the end of an open line all attack it.
+  """
+  squares = board.squares
+  index = square.index
+  white = by_color == Color.white
+  pawn, knight, king = ('P', 'N', 'K') if white else ('p', 'n', 'k')
+  rook, bishop, queen = ('R', 'B', 'Q') if white else ('r', 'b', 'q')
+  for i in KNIGHT_TARGETS[index]:
+    piece = squares[i]
+    if piece and piece.letter == knight:
+      return True
+  for i in PAWN_ATTACKERS[by_color][index]:
+    piece = squares[i]
+    if piece and piece.letter == pawn:
+      return True
+  for i in KING_TARGETS[index]:
+    piece = squares[i]
+    if piece and piece.letter == king:
+      return True
+  for ray in ROOK_RAYS[index]:
+    for i in ray:
+      piece = squares[i]
+      if piece:
+        if piece.letter == rook or piece.letter == queen:
+          return True
+        break
+  for ray in BISHOP_RAYS[index]:
+    for i in ray:
+      piece = squares[i]
+      if piece:
+        if piece.letter == bishop or piece.letter == queen:
+          return True
+        break
+  return False
 
 if __name__ == "__main__":
   b = Board()
@@ -0,0 +1,165 @@
+"""
+Runs perft or search over every position of an EPD file.
+
+Each EPD line is the first four fields of a FEN followed by operations, such
+as 'D1 20 ;D2 400' for perft counts or 'bm Nf3; id "test 1";' for the best
+move. The file is read a line at a time and, with -j, handed to a pool a few
+positions ahead of the results, so files of any size run in fixed memory.
+A line is written for each position as soon as it is done.
+
+  python epd.py perftsuite.epd -d 3       # check each position's D<n> counts
+  python epd.py tests.epd -t 1 -j 4       # search each, check bm and am
+"""
+import argparse
+import itertools
+import sys
+import time
+
+from chess import Board
+
+
+def parse_epd(line):
+  """
+  Splits an EPD line into a Board and a dict of its operations, from opcode
+  to operand with any quotes taken off. The hmvc and fmvn operations set the
+  board's move clocks.
+  """
+  fields = line.split(None, 4)
+  board = Board.from_fen(' '.join(fields[:4]))
+  operations = {}
+  for operation in (fields[4] if len(fields) > 4 else '').split(';'):
+    operation = operation.strip()
+    if not operation:
+      continue
+    parts = operation.split(None, 1)
+    operations[parts[0]] = parts[1].strip('"') if len(parts) > 1 else ''
+  if 'hmvc' in operations:
+    board.halfmove_clock = int(operations['hmvc'])
+  if 'fmvn' in operations:
+    board.fullmove_number = int(operations['fmvn'])
+  return board, operations
+
+
+def read_epd(lines):
+  """ Yields the positions of an EPD file, skipping blanks and # comments. """
+  for line in lines:
+    line = line.strip()
+    if line and not line.startswith('#'):
+      yield line
+
+
+def perft_task(board, operations, depth):
+  """
+  Checks the perft counts given by the D<n> operations, up to depth.
+  Returns (passed, description).
+  """
+  from perft import perft
+  rtn = []
+  passed = True
+  for d in range(1, depth + 1):
+    if 'D%d' % d not in operations:
+      continue
+    expected = int(operations['D%d' % d])
+    nodes = perft(board, d)
+    rtn.append('D%d %d' % (d, nodes))
+    if nodes != expected:
+      passed = False
+      rtn[-1] += ' expected %d' % expected
+  return passed, ' '.join(rtn)
+
+
+def search_task(board, operations, depth, max_time, max_nodes):
+  """
+  Searches board and checks the move found against the bm (best move) and
+  am (avoid move) operations, given in SAN or coordinate notation. Returns
+  (passed, description), positions with neither pass.
+  """
+  from search import Searcher
+  def moves(operand):
+    rtn = []
+    for name in operand.split():
+      try:
+        rtn.append(board.parse_san(name).uci())
+      except ValueError:
+        rtn.append(name)
+    return rtn
+  best = moves(operations.get('bm', ''))
+  avoid = moves(operations.get('am', ''))
+  result = Searcher().search(board, depth, max_time, max_nodes)
+  move = result.move.uci() if result and result.move else '-'
+  passed = (not best or move in best) and move not in avoid
+  return passed, 'move %s %s' % (move, result)
+
+
+def _run_task(line, func, args):
+  """ Runs in a worker: parses line and calls func, adding the id. """
+  board, operations = parse_epd(line)
+  passed, text = func(board, operations, *args)
+  return operations.get('id', ''), passed, text
+
+
+def analyze(lines, func, args = (), jobs = None, window = None):
+  """
+  Calls func(board, operations, *args) on each EPD position in lines, as
+  parse_epd splits it, and yields (number, id, passed, description) as each
+  finishes, number counting positions from 1. With jobs the positions run
+  across that many processes, at most window at a time, and finish out of
+  order. func must be a module level function.
+  """
+  positions = read_epd(lines)
+  if jobs:
+    from parallel import bounded_imap
+    results = bounded_imap(_run_task, positions, (func, args), jobs, window)
+  else:
+    results = enumerate(itertools.imap(lambda line: _run_task(line, func, args),
+                                       positions))
+  for i, (name, passed, text) in results:
+    yield i + 1, name, passed, text
+
+
+def run(lines, func, args = (), jobs = None, out = sys.stdout):
+  """
+  Writes a line per position of lines as it finishes and a summary at the
+  end. Returns the number of positions that failed.
+  """
+  start = time.time()
+  count = failed = 0
+  for number, name, passed, text in analyze(lines, func, args, jobs):
+    count += 1
+    if not passed:
+      failed += 1
+    out.write('%6d %-20s %-4s %s\n' % (number, name, 'ok' if passed else 'FAIL',
+                                       text))
+    out.flush()
+  elapsed = time.time() - start
+  out.write('%d positions %d failed %.2fs %.1f positions/sec\n' %
+            (count, failed, elapsed, count / max(elapsed, 1e-9)))
+  return failed
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Run the positions of an '
+                                   'EPD file through perft or search')
+  parser.add_argument('file', help = 'EPD file, or - for standard input')
+  parser.add_argument('-d', '--depth', type = int,
+                      help = 'perft depth, or search depth with -t or -n')
+  parser.add_argument('-t', '--time', type = float,
+                      help = 'search each position for this many seconds')
+  parser.add_argument('-n', '--nodes', type = int,
+                      help = 'search each position for this many nodes')
+  parser.add_argument('-j', '--jobs', type = int,
+                      help = 'number of processes to spread positions across')
+  args = parser.parse_args(argv)
+
+  if args.time or args.nodes:
+    func, task_args = search_task, (args.depth or 64, args.time, args.nodes)
+  else:
+    func, task_args = perft_task, (args.depth or 3,)
+  if args.file == '-':
+    return 1 if run(sys.stdin, func, task_args, args.jobs) else 0
+  with open(args.file) as lines:
+    return 1 if run(lines, func, task_args, args.jobs) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
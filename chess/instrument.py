@@ -0,0 +1,196 @@
+"""
+Counts the calls, time and allocations of the move generator's functions.
+
+enable() replaces each function in TARGETS with a wrapper that counts how
+often it is called, the time spent in it, callees included, and how many
+Boards, Moves and Pieces are created meanwhile. disable() puts the original
+functions back, so there is no cost at all when it isn't on.
+
+  import instrument
+  instrument.enable()
+  perft(board, 4)
+  instrument.disable()
+  instrument.report()
+
+perft.py and search.py take --profile to print the report at the end of a
+run and --profile-json to write it as JSON.
+"""
+import json
+import sys
+import time
+import types
+
+import chess
+from chess import Board, Move, Piece, Pawn, Knight, Bishop, Rook, Queen, King
+
+PIECE_CLASSES = [Pawn, Knight, Bishop, Rook, Queen, King]
+
+# (class or module, function name) of what is counted
+TARGETS = ([(Board, name) for name in ('copy', 'move', 'apply_move',
+                                        'make_move', 'unmake_move',
+                                        'at_location', 'legal_moves',
+                                        'in_check')] +
+           [(cls, name) for cls in PIECE_CLASSES
+            for name in ('iter_moves', 'legal_moves')] +
+           [(King, 'in_check'), (chess, 'is_square_attacked')])
+
+# The constructors counted as allocations
+ALLOCATING = [Board, Move, Piece]
+
+# Function name to [calls, seconds, allocations]
+stats = {}
+# Class name to instances created
+allocations = {}
+_allocated = [0]
+_originals = []
+
+
+def _name(owner, name):
+  return '%s.%s' % (owner.__name__, name)
+
+
+def _timed_generator(generator, counts):
+  """ Passes on generator's items, adding the time spent making each. """
+  while True:
+    start = time.time()
+    before = _allocated[0]
+    try:
+      item = next(generator)
+    except StopIteration:
+      return
+    finally:
+      counts[1] += time.time() - start
+      counts[2] += _allocated[0] - before
+    yield item
+
+
+def _wrap(function, counts):
+  def wrapper(*args, **kwargs):
+    counts[0] += 1
+    start = time.time()
+    before = _allocated[0]
+    try:
+      rtn = function(*args, **kwargs)
+    finally:
+      counts[1] += time.time() - start
+      counts[2] += _allocated[0] - before
+    if isinstance(rtn, types.GeneratorType):
+      # The work happens as it is iterated, so time that too
+      return _timed_generator(rtn, counts)
+    return rtn
+  wrapper.__name__ = function.__name__
+  wrapper.__doc__ = function.__doc__
+  return wrapper
+
+
+def _counting_init(init):
+  def __init__(self, *args, **kwargs):
+    name = self.__class__.__name__
+    allocations[name] = allocations.get(name, 0) + 1
+    _allocated[0] += 1
+    init(self, *args, **kwargs)
+  return __init__
+
+
+def _replace(owner, name, new):
+  """ Sets owner.name to new, remembering how to put it back. """
+  own = name in owner.__dict__
+  _originals.append((owner, name, owner.__dict__.get(name), own))
+  setattr(owner, name, new)
+
+
+def enabled():
+  return bool(_originals)
+
+
+def enable(targets = TARGETS):
+  """ Starts counting the functions in targets, and clears the counts. """
+  if enabled():
+    disable()
+  reset()
+  for cls in ALLOCATING:
+    _replace(cls, '__init__', _counting_init(cls.__dict__['__init__']))
+  for owner, name in targets:
+    counts = stats.setdefault(_name(owner, name), [0, 0.0, 0])
+    # getattr on a class gives an unbound method in Python 2, so look the
+    # function up along the class's bases
+    if isinstance(owner, type):
+      function = next(base.__dict__[name] for base in owner.__mro__
+                      if name in base.__dict__)
+    else:
+      function = getattr(owner, name)
+    _replace(owner, name, _wrap(function, counts))
+
+
+def disable():
+  """ Puts back every original function. The counts are kept. """
+  while _originals:
+    owner, name, original, own = _originals.pop()
+    if own:
+      setattr(owner, name, original)
+    else:
+      delattr(owner, name)
+
+
+def reset():
+  stats.clear()
+  allocations.clear()
+  _allocated[0] = 0
+
+
+def results():
+  """ The counts as a dict, which is what the JSON report holds. """
+  return {
+    'functions': dict((name, {'calls': calls, 'seconds': seconds,
+                              'allocations': allocated})
+                      for name, (calls, seconds, allocated) in stats.items()),
+    'allocations': dict(allocations),
+  }
+
+
+def report(out = sys.stdout):
+  """
+  Writes a table of the counted functions, slowest first. Times include the
+  functions they call, counted or not, so they overlap.
+  """
+  out.write('%-26s %10s %10s %10s %12s\n' % ('function', 'calls', 'seconds',
+                                             'us/call', 'allocations'))
+  for name, (calls, seconds, allocated) in sorted(
+      stats.items(), key = lambda item: -item[1][1]):
+    if calls:
+      out.write('%-26s %10d %10.3f %10.2f %12d\n' % (
+        name, calls, seconds, seconds * 1e6 / calls, allocated))
+  for name, count in sorted(allocations.items()):
+    out.write('%-26s %10d created\n' % (name, count))
+
+
+def dump_json(path):
+  with open(path, 'w') as f:
+    json.dump(results(), f, indent = 2, sort_keys = True)
+
+
+def add_arguments(parser):
+  """ Adds --profile and --profile-json to a command line parser. """
+  parser.add_argument('--profile', action = 'store_true',
+                      help = 'count calls, time and allocations of the move '
+                      'generator and print them at the end; with more than '
+                      'one process only the first is counted')
+  parser.add_argument('--profile-json', metavar = 'PATH',
+                      help = 'write the counts as JSON to PATH')
+
+
+def start(args):
+  """ Enables counting if args asks for it. """
+  if args.profile or args.profile_json:
+    enable()
+
+
+def finish(args, out = sys.stdout):
+  """ Stops counting and writes the report args asks for. """
+  if not enabled():
+    return
+  disable()
+  if args.profile:
+    report(out)
+  if args.profile_json:
+    dump_json(args.profile_json)
@@ -0,0 +1,382 @@
+"""
+Plays two search configurations against each other to measure which is
+stronger.
+
+Each opening position is played twice, once with each configuration as
+white. Games run across a process pool, each move searched within a node,
+time or depth limit, and are appended to a PGN file as they finish. After
+each game the score so far is given as an Elo difference with a 95% error
+margin. With an SPRT (sequential probability ratio test) the match stops as
+soon as the results favour one of its two Elo bounds strongly enough.
+
+  python match.py nodes=2000 nodes=500 -g 200 -o games.pgn -j 4
+  python match.py new:nodes=2000,tt=20 old:nodes=2000 --sprt 0 10 -k book.bin
+"""
+import argparse
+import itertools
+import math
+import random
+import sys
+import time
+
+from chess import Board, Color
+
+# Elo bounds, alpha and beta of the default SPRT
+SPRT_DEFAULTS = (0.0, 10.0, 0.05, 0.05)
+# A game still going after this many plies is a draw
+MAX_PLIES = 400
+
+
+class Config(object):
+  """ The search limits of one side, per move. """
+  def __init__(self, name, depth = 64, nodes = None, time = None,
+               tt_size = 1 << 16):
+    self.name = name
+    self.depth = depth
+    self.nodes = nodes
+    self.time = time
+    self.tt_size = tt_size
+
+  @classmethod
+  def parse(cls, text):
+    """
+    A Config from 'name:key=value,...', the keys being depth, nodes, time
+    and tt (log 2 of the table size). The name is optional and defaults to
+    the text.
+    """
+    name, sep, options = text.rpartition(':')
+    rtn = cls(name or options)
+    for option in options.split(','):
+      if not option:
+        continue
+      key, sep, value = option.partition('=')
+      if key == 'depth':
+        rtn.depth = int(value)
+      elif key == 'nodes':
+        rtn.nodes = int(value)
+      elif key == 'time':
+        rtn.time = float(value)
+      elif key == 'tt':
+        rtn.tt_size = 1 << int(value)
+      else:
+        raise ValueError('Unknown option %s in %s' % (key, text))
+    if rtn.depth == 64 and not rtn.nodes and not rtn.time:
+      raise ValueError('No depth, nodes or time limit in ' + text)
+    return rtn
+
+  def __str__(self):
+    return self.name
+
+
+def insufficient_material(board):
+  """ True if neither side has the pieces left to mate. """
+  rest = [p for p in board.pieces if p.name != 'King']
+  return not rest or (len(rest) == 1 and rest[0].name in ('Knight', 'Bishop'))
+
+
+def play_game(fen, white, black, max_plies = MAX_PLIES):
+  """
+  Plays a game from fen between the white and black Configs. Returns
+  (result, sans, termination), result being '1-0', '0-1' or '1/2-1/2' and
+  sans the moves played.
+  """
+  from search import Searcher
+  board = Board.from_fen(fen)
+  searchers = {Color.white: (white, Searcher(white.tt_size)),
+               Color.black: (black, Searcher(black.tt_size))}
+  sans = []
+  while True:
+    if not board.has_legal_move():
+      if board.in_check():
+        return ('0-1' if board.turn == Color.white else '1-0', sans,
+                'checkmate')
+      return '1/2-1/2', sans, 'stalemate'
+    if board.is_threefold_repetition():
+      return '1/2-1/2', sans, 'repetition'
+    if board.is_fifty_moves():
+      return '1/2-1/2', sans, 'fifty moves'
+    if insufficient_material(board):
+      return '1/2-1/2', sans, 'insufficient material'
+    if len(sans) >= max_plies:
+      return '1/2-1/2', sans, 'move limit'
+    config, searcher = searchers[board.turn]
+    move = searcher.search(board, config.depth, config.time,
+                           config.nodes).move
+    sans.append(board.san(move))
+    board.make_move(move)
+
+
+def _play_task(task, max_plies):
+  """ Runs in a worker: plays one game of a match. """
+  fen, first_white, first, second = task
+  white, black = (first, second) if first_white else (second, first)
+  return play_game(fen, white, black, max_plies)
+
+
+def pgn(tags, sans, result):
+  """ A game as PGN text, tags being (name, value) pairs in order. """
+  lines = ['[%s "%s"]' % (name, value) for name, value in tags]
+  fen = dict(tags).get('FEN')
+  board = Board.from_fen(fen) if fen else Board()
+  number, black = board.fullmove_number, board.turn == Color.black
+  words = []
+  for ply, san in enumerate(sans):
+    if not black:
+      words.append('%d.' % number)
+    elif ply == 0:
+      words.append('%d...' % number)
+    words.append(san)
+    if black:
+      number += 1
+    black = not black
+  words.append(result)
+  # Lines of movetext are kept under 80 characters
+  text, line = [], ''
+  for word in words:
+    if line and len(line) + 1 + len(word) > 79:
+      text.append(line)
+      line = word
+    else:
+      line = line + ' ' + word if line else word
+  text.append(line)
+  return '\n'.join(lines) + '\n\n' + '\n'.join(text) + '\n\n'
+
+
+def elo(score):
+  """ The Elo difference a score fraction between 0 and 1 corresponds to. """
+  score = min(max(score, 1e-6), 1 - 1e-6)
+  return 400 * math.log10(score / (1 - score))
+
+
+def expected_score(difference):
+  """ The score fraction expected of a player difference Elo stronger. """
+  return 1 / (1 + 10 ** (-difference / 400.0))
+
+
+def elo_margin(wins, draws, losses):
+  """
+  Returns (elo, margin), the Elo difference the results give and half the
+  width of its 95% confidence interval. The margin is infinite with fewer
+  than two games or no spread in the results.
+  """
+  games = wins + draws + losses
+  if not games:
+    return 0.0, float('inf')
+  score = (wins + draws / 2.0) / games
+  variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+              losses * score ** 2) / games
+  if games < 2 or not variance:
+    return elo(score), float('inf')
+  error = 1.96 * math.sqrt(variance / games)
+  return elo(score), (elo(score + error) - elo(score - error)) / 2
+
+
+class SPRT(object):
+  """
+  A sequential probability ratio test of whether the first configuration
+  is elo0 (H0) or elo1 (H1) Elo stronger, with false positive and negative
+  rates alpha and beta. The log likelihood ratio is worked out with the
+  normal approximation to the game scores.
+  """
+  def __init__(self, elo0, elo1, alpha = 0.05, beta = 0.05):
+    self.elo0, self.elo1 = elo0, elo1
+    self.lower = math.log(beta / (1 - alpha))
+    self.upper = math.log((1 - beta) / alpha)
+
+  def llr(self, wins, draws, losses):
+    games = wins + draws + losses
+    if not games:
+      return 0.0
+    score = (wins + draws / 2.0) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+                losses * score ** 2) / games
+    if not variance:
+      # Every game went the same way, so take the widest spread a game's
+      # score can have rather than divide by nothing
+      variance = 0.25
+    s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+    return games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+  def status(self, wins, draws, losses):
+    """ 'H1' or 'H0' once accepted, otherwise None. """
+    llr = self.llr(wins, draws, losses)
+    if llr >= self.upper:
+      return 'H1'
+    if llr <= self.lower:
+      return 'H0'
+    return None
+
+
+def read_openings(lines):
+  """ The FEN of each position in lines of FEN or EPD. """
+  from epd import parse_epd, read_epd
+  rtn = []
+  for line in read_epd(lines):
+    if len(line.split()) >= 6 and ';' not in line:
+      rtn.append(Board.from_fen(line).fen())
+    else:
+      rtn.append(parse_epd(line)[0].fen())
+  return rtn
+
+
+def book_openings(path, count, plies = 8, seed = 0):
+  """
+  count positions reached by playing up to plies random book moves from
+  the starting position, weighted by how often each was played.
+  """
+  from book import Book
+  book = Book(path)
+  rng = random.Random(seed)
+  rtn = []
+  try:
+    for i in range(count):
+      board = Board()
+      for ply in range(plies):
+        move = book.choose(board, rng)
+        if move is None:
+          break
+        board.make_move(move)
+      rtn.append(board.fen())
+  finally:
+    book.close()
+  return rtn
+
+
+def games(openings, first, second, count):
+  """
+  Yields the (fen, first is white, first, second) of each game, going round
+  the openings and playing each with both colors.
+  """
+  for i in range(count):
+    yield openings[i // 2 % len(openings)], i % 2 == 0, first, second
+
+
+def play_match(openings, first, second, count, jobs = None, window = None,
+               max_plies = MAX_PLIES):
+  """
+  Plays count games between the first and second Configs and yields
+  (number, first is white, result, sans, termination) for each as it
+  finishes, number counting games from 1. With jobs the games are played
+  across that many processes and finish out of order. Closing the
+  generator stops the games still being played.
+  """
+  tasks = games(openings, first, second, count)
+  if jobs:
+    from parallel import bounded_imap
+    results = bounded_imap(_play_task, tasks, (max_plies,), jobs, window)
+  else:
+    results = enumerate(itertools.imap(
+      lambda task: _play_task(task, max_plies), tasks))
+  for i, (result, sans, termination) in results:
+    yield i + 1, i % 2 == 0, result, sans, termination
+
+
+def run(openings, first, second, count, jobs = None, out = sys.stdout,
+        pgn_out = None, sprt = None, max_plies = MAX_PLIES):
+  """
+  Plays a match, writing a line for each game as it finishes and each
+  game's PGN to pgn_out. Stops early once sprt, an SPRT, decides. Returns
+  the first configuration's (wins, draws, losses).
+  """
+  start = time.time()
+  wins = draws = losses = 0
+  matches = play_match(openings, first, second, count, jobs,
+                       max_plies = max_plies)
+  try:
+    for number, first_white, result, sans, termination in matches:
+      if result == '1/2-1/2':
+        draws += 1
+      elif (result == '1-0') == first_white:
+        wins += 1
+      else:
+        losses += 1
+      if pgn_out is not None:
+        white, black = (first, second) if first_white else (second, first)
+        fen = openings[(number - 1) // 2 % len(openings)]
+        tags = [('Event', '%s vs %s' % (first, second)), ('Round', number),
+                ('White', white), ('Black', black), ('Result', result),
+                ('Termination', termination)]
+        if fen != Board().fen():
+          tags += [('SetUp', '1'), ('FEN', fen)]
+        pgn_out.write(pgn(tags, sans, result))
+        pgn_out.flush()
+      difference, margin = elo_margin(wins, draws, losses)
+      line = '%5d %-7s %-22s +%d =%d -%d elo %.1f +- %.1f' % (
+        number, result, termination, wins, draws, losses, difference, margin)
+      decision = None
+      if sprt is not None:
+        decision = sprt.status(wins, draws, losses)
+        line += ' llr %.2f (%.2f, %.2f)' % (sprt.llr(wins, draws, losses),
+                                            sprt.lower, sprt.upper)
+      out.write(line + '\n')
+      out.flush()
+      if decision:
+        out.write('SPRT accepts %s: %s is %g Elo stronger\n' % (
+          decision, first, sprt.elo1 if decision == 'H1' else sprt.elo0))
+        break
+  finally:
+    matches.close()
+  elapsed = max(time.time() - start, 1e-9)
+  difference, margin = elo_margin(wins, draws, losses)
+  total = wins + draws + losses
+  out.write('%s vs %s: %d games +%d =%d -%d elo %.1f +- %.1f %.2fs '
+            '%.2f games/sec\n' % (first, second, total, wins, draws, losses,
+                                  difference, margin, elapsed,
+                                  total / elapsed))
+  return wins, draws, losses
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Play two search '
+                                   'configurations against each other')
+  parser.add_argument('first', help = 'name:options of the first, e.x. '
+                      'new:nodes=2000,tt=18; options are depth, nodes, time '
+                      'and tt (log 2 of the table size)')
+  parser.add_argument('second', help = 'options of the second')
+  parser.add_argument('-g', '--games', type = int, default = 100)
+  parser.add_argument('-o', '--pgn', help = 'file to append the games to')
+  parser.add_argument('-e', '--openings',
+                      help = 'file of FEN or EPD positions to start from')
+  parser.add_argument('-k', '--book', help = 'opening book to pick starting '
+                      'positions from')
+  parser.add_argument('-p', '--book-plies', type = int, default = 8)
+  parser.add_argument('-s', '--seed', type = int, default = 0)
+  parser.add_argument('-m', '--max-plies', type = int, default = MAX_PLIES,
+                      help = 'draw games still going after this many plies')
+  parser.add_argument('--sprt', type = float, nargs = 2,
+                      metavar = ('ELO0', 'ELO1'),
+                      help = 'stop once an SPRT of ELO0 against ELO1 decides')
+  parser.add_argument('--alpha', type = float, default = SPRT_DEFAULTS[2])
+  parser.add_argument('--beta', type = float, default = SPRT_DEFAULTS[3])
+  parser.add_argument('-j', '--jobs', type = int,
+                      help = 'number of processes to play games across')
+  args = parser.parse_args(argv)
+
+  try:
+    first, second = Config.parse(args.first), Config.parse(args.second)
+  except ValueError as e:
+    parser.error(str(e))
+  if args.openings:
+    with open(args.openings) as lines:
+      openings = read_openings(lines)
+  elif args.book:
+    openings = book_openings(args.book, (args.games + 1) // 2,
+                             args.book_plies, args.seed)
+  else:
+    openings = [Board().fen()]
+  if not openings:
+    parser.error('no opening positions')
+  sprt = SPRT(args.sprt[0], args.sprt[1], args.alpha, args.beta) \
+         if args.sprt else None
+  pgn_out = open(args.pgn, 'a') if args.pgn else None
+  try:
+    run(openings, first, second, args.games, args.jobs, pgn_out = pgn_out,
+        sprt = sprt, max_plies = args.max_plies)
+  finally:
+    if pgn_out is not None:
+      pgn_out.close()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
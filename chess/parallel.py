@@ -0,0 +1,145 @@
+"""
+Spreads work on the moves below a Board across a pool of processes.
+
+Positions are sent to the workers as FEN strings, which are a few dozen bytes
+and rebuild into a Board without any of the parent's history. Work is handed
+out one task at a time so long subtrees don't hold up a whole batch, and the
+results are put back in move order so the output doesn't depend on which
+worker finished first.
+"""
+import multiprocessing
+import threading
+
+from chess import Board
+from perft import perft
+
+
+def split(board, ply = 1):
+  """
+  The positions ply moves below board, as a list of (root index, moves, fen)
+  where root index is the index of the first move in board.legal_moves() and
+  moves are the Moves leading there.
+  """
+  rtn = []
+  def walk(path, depth):
+    if depth == 0:
+      rtn.append((path[0][0], [m for i, m in path], board.fen()))
+      return
+    for i, move in enumerate(board.legal_moves()):
+      board.make_move(move)
+      walk(path + [(i, move)], depth - 1)
+      board.unmake_move(move)
+  walk([], ply)
+  return rtn
+
+
+def _call(task):
+  """ Runs in a worker: rebuilds the board and calls func on it. """
+  index, func, fen, args = task
+  return index, func(Board.from_fen(fen), *args)
+
+
+def map_positions(func, fens, args = (), processes = None):
+  """
+  Calls func(board, *args) on a Board built from each FEN in fens across a
+  process pool and returns the results in the same order as fens. func must
+  be a module level function so it can be pickled.
+  """
+  tasks = [(i, func, fen, args) for i, fen in enumerate(fens)]
+  results = [None] * len(tasks)
+  pool = multiprocessing.Pool(processes)
+  try:
+    for i, result in pool.imap_unordered(_call, tasks):
+      results[i] = result
+  finally:
+    pool.close()
+    pool.join()
+  return results
+
+
+def _apply(task):
+  """ Runs in a worker: calls func on one item of bounded_imap. """
+  index, func, item, args = task
+  return index, func(item, *args)
+
+
+def bounded_imap(func, items, args = (), processes = None, window = None):
+  """
+  Calls func(item, *args) for each of items across a process pool and yields
+  (index, result) pairs in the order they finish, index being the item's
+  position in items. items may be any iterable, such as the lines of a file:
+  at most window items (four per process by default) are read ahead of the
+  results taken, so memory stays bounded however many there are.
+  """
+  pool = multiprocessing.Pool(processes)
+  if window is None:
+    window = 4 * pool._processes
+  slots = threading.Semaphore(window)
+  state = {'stop': False}
+  def tasks():
+    # Runs on the pool's task feeding thread, which waits here for a slot
+    for i, item in enumerate(items):
+      slots.acquire()
+      if state['stop']:
+        return
+      yield (i, func, item, args)
+  try:
+    for rtn in pool.imap_unordered(_apply, tasks()):
+      slots.release()
+      yield rtn
+  finally:
+    # Let the feeding thread out of its wait if the caller stopped early
+    state['stop'] = True
+    slots.release()
+    pool.terminate()
+    pool.join()
+
+
+def map_root_moves(board, func, args = (), processes = None):
+  """
+  Calls func(board_after_move, *args) for every legal move from board across
+  a process pool. Returns a list of (move, result) in board.legal_moves()
+  order. Search can use this to look at each root move in its own process.
+  """
+  moves = board.legal_moves()
+  fens = []
+  for move in moves:
+    board.make_move(move)
+    fens.append(board.fen())
+    board.unmake_move(move)
+  return zip(moves, map_positions(func, fens, args, processes))
+
+
+def parallel_divide(board, depth, processes = None, split_ply = 1,
+                    cache = False):
+  """
+  divide() across a process pool. With split_ply above 1 the tree is cut
+  deeper into more, smaller tasks, which keeps all the workers busy when
+  there are only a few root moves. cache gives each task its own
+  transposition cache. Returns (move, nodes) pairs sorted like divide().
+  """
+  if depth <= split_ply:
+    split_ply = max(depth - 1, 1)
+  moves = board.legal_moves()
+  tasks = split(board, split_ply)
+  counts = map_positions(_perft_task, [fen for i, path, fen in tasks],
+                         (depth - split_ply, cache), processes)
+  totals = [0] * len(moves)
+  for (index, path, fen), nodes in zip(tasks, counts):
+    totals[index] += nodes
+  rtn = zip(moves, totals)
+  rtn.sort(key = lambda x: x[0].uci())
+  return rtn
+
+
+def parallel_perft(board, depth, processes = None, split_ply = 1,
+                   cache = False):
+  """ perft() across a process pool, see parallel_divide. """
+  if depth == 0:
+    return 1
+  return sum(nodes for move, nodes in
+             parallel_divide(board, depth, processes, split_ply, cache))
+
+
+def _perft_task(board, depth, cache):
+  return perft(board, depth, {} if cache else None)
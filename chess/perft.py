@@ -0,0 +1,185 @@
+"""
+Perft, the count of leaf nodes in the legal move tree, used both to check
+move generation against published counts and to time it.
+
+  python perft.py                    # every standard position to depth 3
+  python perft.py -d 4 -p kiwipete   # one position, deeper
+  python perft.py --divide -d 3 -p initial
+  python perft.py --cache            # reuse counts of transposed positions
+  python perft.py -d 5 -j 8          # split the tree across 8 processes
+  python perft.py -d 4 --bitboard    # count with bitboard.Position instead
+
+The run exits non zero if any count differs from the known one, so it can be
+used as a gate for changes to Board.move or the pieces' moves.
+"""
+import argparse
+import sys
+import time
+
+from chess import Board
+import instrument
+
+# (name, fen, node counts for depth 1, 2, ...)
+POSITIONS = [
+  ('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+   [20, 400, 8902, 197281, 4865609]),
+  ('kiwipete',
+   'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+   [48, 2039, 97862, 4085603]),
+  ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+   [14, 191, 2812, 43238, 674624]),
+  ('promotions',
+   'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+   [6, 264, 9467, 422333]),
+  ('talkchess', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+   [44, 1486, 62379, 2103487]),
+  ('middlegame',
+   'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+   [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(board, depth, cache = None):
+  """
+  Counts the leaf nodes of the legal move tree depth plies below board.
+  Moves are made and unmade in place, so board is left as it was.
+
+  cache is an optional dict used as a transposition table, keyed on the
+  position's Zobrist hash and the remaining depth.
+  """
+  if depth == 0:
+    return 1
+  if cache is not None:
+    key = (board.zobrist, depth)
+    if key in cache:
+      return cache[key]
+  moves = board.legal_moves()
+  if depth == 1:
+    nodes = len(moves)
+  else:
+    nodes = 0
+    for move in moves:
+      board.make_move(move)
+      nodes += perft(board, depth - 1, cache)
+      board.unmake_move(move)
+  if cache is not None:
+    cache[key] = nodes
+  return nodes
+
+
+def divide(board, depth, cache = None):
+  """
+  Perft split by root move. Returns a list of (move, nodes) sorted by the
+  move's coordinate notation, for finding which move a wrong count is under.
+  """
+  rtn = []
+  for move in board.legal_moves():
+    board.make_move(move)
+    rtn.append((move, perft(board, depth - 1, cache)))
+    board.unmake_move(move)
+  rtn.sort(key = lambda x: x[0].uci())
+  return rtn
+
+
+def run(positions, depth, use_cache = False, out = sys.stdout, jobs = None,
+        bitboard = False):
+  """
+  Runs perft on each (name, fen, counts) position up to depth and writes a
+  line per position with nodes, time and nodes per second. Returns the number
+  of counts that differed from the known ones. jobs runs each position
+  across that many processes, and bitboard counts with bitboard.Position.
+  """
+  mismatches = 0
+  total_nodes = 0
+  total_time = 0.0
+  for name, fen, counts in positions:
+    board = Board.from_fen(fen)
+    cache = {} if use_cache else None
+    d = min(depth, len(counts))
+    start = time.time()
+    if bitboard:
+      from bitboard import Position
+      nodes = Position.from_board(board).perft(d)
+    elif jobs:
+      from parallel import parallel_perft
+      nodes = parallel_perft(board, d, jobs, split_ply = 2, cache = use_cache)
+    else:
+      nodes = perft(board, d, cache)
+    elapsed = time.time() - start
+    total_nodes += nodes
+    total_time += elapsed
+    status = 'ok' if nodes == counts[d - 1] else 'MISMATCH expected %d' % counts[d - 1]
+    if nodes != counts[d - 1]:
+      mismatches += 1
+    out.write('%-12s depth %d %10d nodes %8.2fs %9.0f nodes/sec  %s\n' %
+              (name, d, nodes, elapsed, nodes / max(elapsed, 1e-9), status))
+  out.write('%-12s         %10d nodes %8.2fs %9.0f nodes/sec  %d mismatches\n' %
+            ('total', total_nodes, total_time,
+             total_nodes / max(total_time, 1e-9), mismatches))
+  return mismatches
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Perft benchmark for chess.py')
+  parser.add_argument('-d', '--depth', type = int, default = 3)
+  parser.add_argument('-p', '--position', action = 'append',
+                      help = 'name of a standard position, or a FEN string. '
+                      'May be repeated, defaults to every standard position.')
+  parser.add_argument('--divide', action = 'store_true',
+                      help = 'print the node count under each root move')
+  parser.add_argument('--cache', action = 'store_true',
+                      help = 'cache counts of transposed positions by hash')
+  parser.add_argument('-j', '--jobs', type = int,
+                      help = 'number of processes to split the tree across')
+  parser.add_argument('--bitboard', action = 'store_true',
+                      help = 'count with the bitboard move generator')
+  instrument.add_arguments(parser)
+  args = parser.parse_args(argv)
+  if args.bitboard and (args.cache or args.jobs or args.divide):
+    parser.error('--bitboard does not support --cache, --jobs or --divide')
+  instrument.start(args)
+  try:
+    return _main(args)
+  finally:
+    instrument.finish(args)
+
+
+def _main(args):
+  positions = []
+  names = dict((p[0], p) for p in POSITIONS)
+  for position in args.position or [p[0] for p in POSITIONS]:
+    if position in names:
+      positions.append(names[position])
+    else:
+      positions.append((position, position, []))
+
+  if args.divide:
+    for name, fen, counts in positions:
+      total = 0
+      for move, nodes in divide(Board.from_fen(fen), args.depth,
+                                {} if args.cache else None):
+        print '%s: %d' % (move.uci(), nodes)
+        total += nodes
+      print '%s total: %d' % (name, total)
+    return 0
+
+  # Positions given as FEN have no known counts, so count them but don't
+  # compare.
+  unknown = [p for p in positions if not p[2]]
+  for name, fen, counts in unknown:
+    board = Board.from_fen(fen)
+    if args.bitboard:
+      from bitboard import Position
+      nodes = Position.from_board(board).perft(args.depth)
+    else:
+      nodes = perft(board, args.depth)
+    print '%s depth %d: %d nodes' % (name, args.depth, nodes)
+  known = [p for p in positions if p[2]]
+  if known and run(known, args.depth, args.cache, jobs = args.jobs,
+                   bitboard = args.bitboard):
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Replays the games of a PGN file through Board, to check the move generator
+against real games.
+
+The file is read a line at a time and split into games as it goes, so it
+can be any size. Each game's moves are parsed from SAN against the legal
+moves of the position and made, and any move that isn't legal is reported
+with the game and position it came in. With -j the games are spread across
+processes, a few at a time ahead of the results.
+
+  python pgn.py games.pgn            # replay every game
+  python pgn.py games.pgn -j 4 -n 1000
+"""
+import argparse
+import itertools
+import re
+import sys
+import time
+
+from chess import Board
+
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+# Comments, variation brackets, NAGs and everything else split on spaces
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|[^\s(){};]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+
+def read_games(lines):
+  """
+  Yields (tags, movetext) for each game in the lines of a PGN file, where
+  tags is a dict of the tag pairs and movetext the text of the moves.
+  """
+  tags = {}
+  movetext = []
+  in_comment = False
+  for line in lines:
+    stripped = line.strip()
+    if in_comment:
+      movetext.append(line)
+      in_comment = _ends_in_comment(line, True)
+    elif stripped.startswith('['):
+      if movetext:
+        yield tags, ''.join(movetext)
+        tags = {}
+        movetext = []
+      match = TAG_PATTERN.match(stripped)
+      if match:
+        tags[match.group(1)] = match.group(2).replace('\\"', '"')
+    elif stripped.startswith('%'):
+      # An escaped line, which PGN readers skip
+      continue
+    elif stripped or movetext:
+      movetext.append(line)
+      in_comment = _ends_in_comment(line, False)
+  if tags or ''.join(movetext).strip():
+    yield tags, ''.join(movetext)
+
+
+def _ends_in_comment(line, in_comment):
+  """ Whether a { comment is still open at the end of line. """
+  for c in line:
+    if in_comment:
+      in_comment = c != '}'
+    elif c == '{':
+      in_comment = True
+    elif c == ';':
+      break
+  return in_comment
+
+
+def san_moves(movetext):
+  """
+  The SAN moves of the main line of movetext, without move numbers,
+  comments, NAGs, variations or the result.
+  """
+  rtn = []
+  depth = 0
+  for token in TOKEN_PATTERN.findall(movetext):
+    if token == '(':
+      depth += 1
+    elif token == ')':
+      depth -= 1
+    elif depth or token[0] in '{;$' or token in RESULTS:
+      continue
+    else:
+      token = MOVE_NUMBER_PATTERN.sub('', token)
+      if token:
+        rtn.append(token)
+  return rtn
+
+
+def start_board(tags):
+  """ The board a game starts from, given by its FEN tag if it has one. """
+  if 'FEN' in tags:
+    return Board.from_fen(tags['FEN'])
+  return Board()
+
+
+def replay(game):
+  """
+  Plays the moves of a (tags, movetext) game on a board. Returns (plies,
+  error), where error is None if every move was legal and otherwise the
+  (ply, san, fen) of the first that wasn't.
+  """
+  tags, movetext = game
+  board = start_board(tags)
+  for ply, san in enumerate(san_moves(movetext)):
+    try:
+      move = board.parse_san(san)
+    except ValueError:
+      return ply, (ply, san, board.fen())
+    board.make_move(move)
+  return len(board.history), None
+
+
+def replay_games(lines, jobs = None, window = None, limit = None):
+  """
+  Replays the games in the lines of a PGN file and yields (number, plies,
+  error) for each as it finishes, number counting games from 1 and
+  plies and error as replay returns them. With jobs the games are replayed
+  across that many processes and finish out of order. limit stops after
+  that many games.
+  """
+  games = read_games(lines)
+  if limit:
+    games = itertools.islice(games, limit)
+  if jobs:
+    from parallel import bounded_imap
+    results = bounded_imap(replay, games, (), jobs, window)
+  else:
+    results = enumerate(itertools.imap(replay, games))
+  for i, (plies, error) in results:
+    yield i + 1, plies, error
+
+
+def run(lines, jobs = None, limit = None, out = sys.stdout):
+  """
+  Replays the games in lines, writing a line for each with an illegal move
+  and a summary with games and plies per second. Returns the number of games
+  with an illegal move.
+  """
+  start = time.time()
+  games = plies = illegal = 0
+  for number, game_plies, error in replay_games(lines, jobs, limit = limit):
+    games += 1
+    plies += game_plies
+    if error:
+      illegal += 1
+      ply, san, fen = error
+      out.write('game %d ply %d: illegal move %s in %s\n' %
+                (number, ply + 1, san, fen))
+      out.flush()
+  elapsed = max(time.time() - start, 1e-9)
+  out.write('%d games %d plies %.2fs %.1f games/sec %.0f plies/sec '
+            '%d with illegal moves\n' % (games, plies, elapsed,
+                                         games / elapsed, plies / elapsed,
+                                         illegal))
+  return illegal
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Replay the games of a PGN '
+                                   'file and check every move is legal')
+  parser.add_argument('file', help = 'PGN file, or - for standard input')
+  parser.add_argument('-j', '--jobs', type = int,
+                      help = 'number of processes to spread games across')
+  parser.add_argument('-n', '--limit', type = int,
+                      help = 'stop after this many games')
+  args = parser.parse_args(argv)
+  if args.file == '-':
+    return 1 if run(sys.stdin, args.jobs, args.limit) else 0
+  with open(args.file) as lines:
+    return 1 if run(lines, args.jobs, args.limit) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Encodes positions as stacks of 8x8 feature planes in NumPy arrays, for
+training and scoring models in batches.
+
+Each position is PLANES planes of 8 rows by 8 columns, row 0 being the 1st
+rank and column 0 the a file:
+
+  0-11   one per piece, white's PNBRQK then black's pnbrqk, 1 where it stands
+  12     all 1 if white is to move
+  13-16  all 1 if white kingside, white queenside, black kingside or black
+         queenside castling is still allowed
+
+Positions are given as Boards or FEN strings. Each batch is turned into one
+byte per square and set in the array with a few whole array operations, so
+nothing loops over squares in Python. to_npy writes into a memory mapped
+.npy file so datasets can be larger than memory.
+
+  python planes.py positions.fen out.npy     # one FEN per line
+"""
+import argparse
+import itertools
+import re
+import sys
+
+import numpy as np
+
+from chess import Board, Castling, Color
+
+PIECE_LETTERS = 'PNBRQKpnbrqk'
+SIDE_PLANE = 12
+CASTLING_PLANE = 13
+PLANES = 17
+
+# The piece plane for each letter's byte, -1 for empty squares
+LETTER_PLANES = np.full(256, -1, np.int8)
+for _plane, _letter in enumerate(PIECE_LETTERS):
+  LETTER_PLANES[ord(_letter)] = _plane
+del _plane, _letter
+
+# Castling bits in plane order
+CASTLING_BITS = np.array([Castling.white_kingside, Castling.white_queenside,
+                          Castling.black_kingside, Castling.black_queenside])
+
+_DIGIT_PATTERN = re.compile('[1-8]')
+
+
+def _expand(match):
+  return '.' * int(match.group())
+
+
+def squares(position):
+  """
+  Returns (letters, white to move, castling) for a Board or FEN string,
+  where letters is 64 bytes, a piece letter or '.' for each square index.
+  """
+  if isinstance(position, Board):
+    letters = bytearray(b'.' * 64)
+    for piece in position.pieces:
+      letters[piece.location.index] = ord(piece.letter)
+    return (bytes(letters), position.turn == Color.white, position.castling)
+  fields = position.split()
+  # FEN lists ranks from the 8th down, square indices count from the 1st
+  ranks = [_DIGIT_PATTERN.sub(_expand, rank)
+           for rank in reversed(fields[0].split('/'))]
+  letters = ''.join(ranks)
+  if len(ranks) != 8 or len(letters) != 64:
+    raise ValueError('Illegal FEN ' + position)
+  castling = 0
+  rights = fields[2] if len(fields) > 2 else '-'
+  for letter, right in Castling.letters:
+    if letter in rights:
+      castling |= right
+  # As in Board.from_fen, a right with no king and rook home to use it is
+  # dropped
+  for king_sq, rook_sq, clr, right in Castling.squares:
+    king, rook = ('K', 'R') if clr == Color.white else ('k', 'r')
+    if letters[king_sq] != king or letters[rook_sq] != rook:
+      castling &= ~right
+  return (letters.encode('ascii'), len(fields) < 2 or fields[1] == 'w',
+          castling)
+
+
+def encode_into(positions, out, start = 0):
+  """
+  Fills out[start:start + len(positions)] with the planes of a list of
+  Boards or FEN strings. out is an array of shape (N, PLANES, 8, 8) of any
+  number type.
+  """
+  count = len(positions)
+  if not count:
+    return
+  letters, white, castling = zip(*[squares(p) for p in positions])
+  codes = np.frombuffer(b''.join(letters), np.uint8).reshape(count, 64)
+  planes = LETTER_PLANES[codes]
+  batch = out[start:start + count]
+  batch[...] = 0
+  index, square = np.nonzero(planes >= 0)
+  batch[index, planes[index, square], square // 8, square % 8] = 1
+  batch[:, SIDE_PLANE] = np.array(white, bool)[:, None, None]
+  rights = (np.array(castling)[:, None] & CASTLING_BITS) != 0
+  batch[:, CASTLING_PLANE:] = rights[:, :, None, None]
+
+
+def encode(positions, out = None, dtype = np.uint8, chunk = 4096):
+  """
+  The planes of positions, any iterable of Boards or FEN strings, as an
+  array of shape (N, PLANES, 8, 8). With out, the positions are written into
+  its first rows, chunk at a time, and out is returned; there must be room
+  for them all.
+  """
+  if out is None:
+    positions = list(positions)
+    out = np.empty((len(positions), PLANES, 8, 8), dtype)
+  fill(positions, out, chunk)
+  return out
+
+
+def fill(positions, out, chunk = 4096):
+  """
+  Writes positions, any iterable of Boards or FEN strings, into the first
+  rows of out a chunk at a time, so they needn't all be in memory at once.
+  Returns how many were written.
+  """
+  positions = iter(positions)
+  count = 0
+  while True:
+    batch = list(itertools.islice(positions, chunk))
+    if not batch:
+      return count
+    if count + len(batch) > len(out):
+      raise ValueError('More than %d positions' % len(out))
+    encode_into(batch, out, count)
+    count += len(batch)
+
+
+def to_npy(positions, path, count, dtype = np.uint8, chunk = 4096):
+  """
+  Writes the planes of count positions, any iterable of Boards or FEN
+  strings, to a .npy file at path through a memory map, so only chunk
+  positions are in memory at a time. Returns the memory mapped array, which
+  np.load(path, mmap_mode = 'r') opens again later.
+  """
+  out = np.lib.format.open_memmap(path, mode = 'w+', dtype = dtype,
+                                  shape = (count, PLANES, 8, 8))
+  written = fill(positions, out, chunk)
+  if written != count:
+    raise ValueError('Expected %d positions, got %d' % (count, written))
+  out.flush()
+  return out
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Write the feature planes '
+                                   'of a file of FEN strings to a .npy file')
+  parser.add_argument('fens', help = 'file with one FEN per line')
+  parser.add_argument('out', help = '.npy file to write')
+  args = parser.parse_args(argv)
+  with open(args.fens) as lines:
+    count = sum(1 for line in lines if line.strip())
+  with open(args.fens) as lines:
+    to_npy((line for line in lines if line.strip()), args.out, count)
+  print '%d positions written to %s' % (count, args.out)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
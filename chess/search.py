@@ -0,0 +1,379 @@
+"""
+Alpha-beta search over Board.
+
+Searcher.search runs iterative deepening negamax with a transposition table,
+MVV-LVA and killer move ordering and a capture only quiescence search at the
+leaves. It stops at whichever of a depth, time or node budget runs out first
+and reports the best move, score, principal variation and nodes per second.
+
+  python search.py [fen] [-d depth] [-t seconds] [-n nodes]
+"""
+import argparse
+import time
+
+from chess import Board
+import instrument
+from tablebase import LOSS, WIN, Tablebase
+
+MATE = 100000
+# Scores beyond this are mates, and carry the distance to mate in plies
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+
+# Rough piece values for ordering captures, the evaluation is Board.evaluate
+PIECE_VALUES = {'Pawn': 100, 'Knight': 320, 'Bishop': 330, 'Rook': 500,
+                'Queen': 900, 'King': 0}
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def evaluate(board):
+  """
+  Material and piece square score in centipawns from the side to move's
+  point of view, which the board keeps up to date as moves are made.
+  """
+  return board.evaluate()
+
+
+def to_table(score, ply):
+  """
+  Mate scores count plies from the root, the table stores them counted from
+  the position instead so they stay right wherever it is reached.
+  """
+  if score > MATE_BOUND:
+    return score + ply
+  if score < -MATE_BOUND:
+    return score - ply
+  return score
+
+
+def from_table(score, ply):
+  if score > MATE_BOUND:
+    return score - ply
+  if score < -MATE_BOUND:
+    return score + ply
+  return score
+
+
+def tablebase_score(found, ply):
+  """ The search score of a tablebase (result, plies) found at ply. """
+  result, plies = found
+  if result == WIN:
+    return MATE - ply - plies
+  if result == LOSS:
+    return -MATE + ply + plies
+  return 0
+
+
+def move_key(move):
+  """ A small hashable stand in for a move, kept in the tables. """
+  return (move.start.index, move.end.index, move.promotion)
+
+
+class TranspositionTable(object):
+  """
+  A fixed size table of search results indexed by the low bits of the
+  position's Zobrist key. Each slot holds one entry, which a new result
+  replaces if it is for the same position, comes from a newer search, or
+  searched at least as deep.
+  """
+  def __init__(self, size = 1 << 16):
+    # Round down to a power of two so the index is a mask
+    bits = max(size, 1).bit_length() - 1
+    self.mask = (1 << bits) - 1
+    self.entries = [None] * (1 << bits)
+    self.generation = 0
+
+  def new_search(self):
+    """ Marks entries stored so far as old, so they are replaced first. """
+    self.generation += 1
+
+  def probe(self, key):
+    """ Returns (depth, score, flag, move key) for key, or None. """
+    entry = self.entries[key & self.mask]
+    if entry is not None and entry[0] == key:
+      return entry[1:5]
+    return None
+
+  def store(self, key, depth, score, flag, best):
+    index = key & self.mask
+    entry = self.entries[index]
+    if (entry is None or entry[0] == key or entry[5] != self.generation or
+        depth >= entry[1]):
+      self.entries[index] = (key, depth, score, flag, best, self.generation)
+
+  def clear(self):
+    self.entries = [None] * len(self.entries)
+
+
+class SearchResult(object):
+  def __init__(self, move, score, depth, nodes, elapsed, pv):
+    self.move = move
+    self.score = score
+    self.depth = depth
+    self.nodes = nodes
+    self.elapsed = elapsed
+    self.pv = pv
+
+  def nps(self):
+    return self.nodes / max(self.elapsed, 1e-9)
+
+  def __str__(self):
+    return 'depth %d score %d nodes %d nps %.0f pv %s' % (
+      self.depth, self.score, self.nodes, self.nps(),
+      ' '.join(m.uci() for m in self.pv))
+
+
+class Searcher(object):
+  def __init__(self, tt_size = 1 << 16, evaluate = evaluate,
+               tablebase = None):
+    self.table = TranspositionTable(tt_size)
+    self.evaluate = evaluate
+    # A tablebase.Tablebase to look up positions with few pieces in
+    self.tablebase = tablebase
+    # How many nodes to search between checks of the clock
+    self.check_every = 1024
+
+  def search(self, board, max_depth = 64, max_time = None, max_nodes = None,
+             callback = None):
+    """
+    Searches board by iterative deepening until max_depth is done, max_time
+    seconds pass or max_nodes nodes are searched. Returns the SearchResult of
+    the deepest iteration that finished (depth 1 always finishes).
+    callback, if given, is called with each iteration's SearchResult.
+    """
+    self.nodes = 0
+    self.start = time.time()
+    self.deadline = self.start + max_time if max_time else None
+    self.max_nodes = max_nodes
+    self.stopped = False
+    # The first iteration always finishes so there is a move to return
+    self.can_stop = False
+    self.next_check = self.check_every
+    self.killers = [[None, None] for i in range(max_depth + 64)]
+    self.table.new_search()
+
+    result = None
+    for depth in range(1, max_depth + 1):
+      self.pv = [[] for i in range(max_depth + 64)]
+      score = self.negamax(board, depth, -INFINITY, INFINITY, 0)
+      if self.stopped and result is not None:
+        break
+      pv = self.pv[0]
+      result = SearchResult(pv[0] if pv else None, score, depth, self.nodes,
+                            time.time() - self.start, pv)
+      self.can_stop = True
+      if callback:
+        callback(result)
+      if self.stopped or abs(score) > MATE_BOUND:
+        break
+    return result
+
+  def out_of_budget(self):
+    # Quiescence counts nodes too, so the count can step past a multiple of
+    # check_every between calls
+    if not self.can_stop or self.nodes < self.next_check:
+      return False
+    self.next_check = self.nodes + self.check_every
+    if ((self.max_nodes and self.nodes >= self.max_nodes) or
+        (self.deadline and time.time() >= self.deadline)):
+      self.stopped = True
+    return self.stopped
+
+  def order(self, board, moves, best, ply):
+    """
+    Sorts moves best first: the table's move, then captures by most valuable
+    victim and least valuable attacker, then killers.
+    """
+    squares = board.squares
+    killers = self.killers[ply]
+    def score(move):
+      key = move_key(move)
+      if key == best:
+        return 1000000
+      victim = squares[move.end.index]
+      if victim or move.en_passant or move.promotion:
+        value = PIECE_VALUES[victim.name] if victim else 100
+        if move.promotion:
+          value += PIECE_VALUES[move.promotion.__name__]
+        return 100000 + value * 10 - PIECE_VALUES[squares[move.start.index].name]
+      if key == killers[0]:
+        return 90000
+      if key == killers[1]:
+        return 80000
+      return 0
+    moves.sort(key = score, reverse = True)
+    return moves
+
+  def negamax(self, board, depth, alpha, beta, ply):
+    self.nodes += 1
+    self.pv[ply] = []
+    if self.out_of_budget():
+      return 0
+    if ply > 0 and (board.is_fifty_moves() or board.repetitions() > 1):
+      # A repeat of an earlier position can be repeated again for a draw
+      return 0
+    if ply > 0 and self.tablebase is not None and len(board.pieces) <= 3:
+      found = self.tablebase.probe(board)
+      if found is not None:
+        return tablebase_score(found, ply)
+    if depth <= 0:
+      return self.quiesce(board, alpha, beta, ply)
+
+    original_alpha = alpha
+    entry = self.table.probe(board.zobrist)
+    best = None
+    if entry is not None:
+      entry_depth, entry_score, flag, best = entry
+      entry_score = from_table(entry_score, ply)
+      if entry_depth >= depth and ply > 0:
+        if (flag == EXACT or (flag == LOWER and entry_score >= beta) or
+            (flag == UPPER and entry_score <= alpha)):
+          return entry_score
+
+    moves = board.legal_moves()
+    if not moves:
+      return -MATE + ply if board.in_check() else 0
+
+    best_score = -INFINITY
+    best_key = None
+    for move in self.order(board, moves, best, ply):
+      capture = board.squares[move.end.index] or move.en_passant
+      board.make_move(move)
+      score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+      board.unmake_move(move)
+      if self.stopped:
+        return 0
+      if score > best_score:
+        best_score = score
+        best_key = move_key(move)
+        if score > alpha:
+          alpha = score
+          self.pv[ply] = [move] + self.pv[ply + 1]
+      if alpha >= beta:
+        if not capture:
+          killers = self.killers[ply]
+          if killers[0] != best_key:
+            killers[1] = killers[0]
+            killers[0] = best_key
+        break
+
+    if best_score <= original_alpha:
+      flag = UPPER
+    elif best_score >= beta:
+      flag = LOWER
+    else:
+      flag = EXACT
+    self.table.store(board.zobrist, depth, to_table(best_score, ply), flag,
+                     best_key)
+    return best_score
+
+  def quiesce(self, board, alpha, beta, ply):
+    """ Searches captures and promotions until the position is quiet. """
+    stand_pat = self.evaluate(board)
+    if stand_pat >= beta:
+      return stand_pat
+    if stand_pat > alpha:
+      alpha = stand_pat
+    moves = list(board.iter_legal_moves(captures_only = True))
+    for move in self.order(board, moves, None, ply):
+      self.nodes += 1
+      board.make_move(move)
+      score = -self.quiesce(board, -beta, -alpha, ply + 1)
+      board.unmake_move(move)
+      if score >= beta:
+        return score
+      if score > alpha:
+        alpha = score
+    return alpha
+
+
+def _search_child(task, depth, tt_size):
+  """
+  Runs in a worker: replays the moves of task from its FEN, so the board has
+  the history repetitions are found in, and searches the position reached.
+  """
+  fen, path = task
+  board = Board.from_fen(fen)
+  for uci in path:
+    board.make_move([m for m in board.legal_moves() if m.uci() == uci][0])
+  # Searcher.negamax scores these draws one ply below the root
+  if board.is_fifty_moves() or board.repetitions() > 1:
+    return 0, 0, []
+  result = Searcher(tt_size).search(board, max_depth = depth)
+  return result.score, result.nodes, result.pv
+
+
+def parallel_search(board, depth, processes = None, tt_size = 1 << 16):
+  """
+  Searches each root move to depth - 1 in its own process with a full window
+  and returns the SearchResult for the best. Ties go to the earliest move in
+  board.legal_moves(), so the result does not depend on scheduling.
+  """
+  from parallel import bounded_imap
+  start = time.time()
+  # Only positions since the last capture or pawn move can come again, so
+  # each child is sent the position then and the moves made since
+  back = min(board.halfmove_clock, len(board.history))
+  earlier = board.copy()
+  for i in range(back):
+    earlier.unmake_move()
+  path = [entry[0].uci() for entry in reversed(board.history.newest(back))]
+  moves = board.legal_moves()
+  tasks = [(earlier.fen(), path + [move.uci()]) for move in moves]
+  results = [None] * len(moves)
+  for i, result in bounded_imap(_search_child, tasks,
+                                (max(depth - 1, 1), tt_size), processes):
+    results[i] = result
+  best = None
+  nodes = 0
+  for move, (score, child_nodes, pv) in zip(moves, results):
+    nodes += child_nodes
+    # The child's mate distances count from one ply below the root
+    score = from_table(-score, 1)
+    if best is None or score > best[1]:
+      best = (move, score, pv)
+  if best is None:
+    return None
+  move, score, pv = best
+  return SearchResult(move, score, depth, nodes, time.time() - start,
+                      [move] + pv)
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Search a chess position')
+  parser.add_argument('fen', nargs = '?', default = Board().fen())
+  parser.add_argument('-d', '--depth', type = int, default = 64)
+  parser.add_argument('-t', '--time', type = float, default = 5.0,
+                      help = 'seconds to search for')
+  parser.add_argument('-n', '--nodes', type = int)
+  parser.add_argument('-b', '--tablebases',
+                      help = 'directory of endgame tables to look up')
+  parser.add_argument('-k', '--book', help = 'opening book to play from')
+  instrument.add_arguments(parser)
+  args = parser.parse_args(argv)
+  instrument.start(args)
+  try:
+    _main(args)
+  finally:
+    instrument.finish(args)
+
+
+def _main(args):
+  board = Board.from_fen(args.fen)
+  if args.book:
+    from book import Book
+    move = Book(args.book).choose(board)
+    if move is not None:
+      print 'book move %s' % move.uci()
+      return
+  def report(result):
+    print result
+  tablebase = Tablebase(args.tablebases) if args.tablebases else None
+  Searcher(tablebase = tablebase).search(board, args.depth, args.time,
+                                         args.nodes, report)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,324 @@
+"""
+Endgame tablebases for king and queen, king and rook, and king and pawn
+against a lone king.
+
+Each table is worked out backwards from the checkmates using the moves of
+chess.py (retrograde analysis) and written to a binary file named for its
+material, e.x. KQK.tb, with one byte per position:
+
+  0         a draw, or a position that can't occur
+  1 - 127   the side to move mates in that many plies
+  128 + n   the side to move is mated in n plies
+
+Positions are stored with the stronger side as white. Without a pawn, the
+board is turned or mirrored so the white king is in the a1-d1-d4 triangle,
+which leaves 10 of its 64 squares; with a pawn, only mirrored left to right,
+leaving 32. Tablebase.probe reads the files through mmap.
+
+  python tablebase.py                    # build every table
+  python tablebase.py KRK -o tables/
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from chess import Board, Color, King, Location, Pawn, Queen, Rook
+
+WIN, DRAW, LOSS = 1, 0, -1
+SIGNATURES = ('KQK', 'KRK', 'KPK')
+PIECES = {'Q': Queen, 'R': Rook, 'P': Pawn}
+# Tables the positions after a promotion are found in
+PROMOTIONS = {Queen: 'KQK', Rook: 'KRK'}
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'tablebases')
+
+def _transpose(sq):
+  return (sq & 7) << 3 | sq >> 3
+
+def _symmetries():
+  """ The eight ways to turn or mirror the board, as square permutations. """
+  rtn = []
+  for transpose in (False, True):
+    for files in (0, 7):
+      for ranks in (0, 56):
+        rtn.append([(_transpose(sq) if transpose else sq) ^ files ^ ranks
+                    for sq in range(64)])
+  return rtn
+
+# Squares the white king is moved into, and its index among them
+TRIANGLE = [0, 1, 2, 3, 9, 10, 11, 18, 19, 27]
+HALF = [sq for sq in range(64) if sq & 7 < 4]
+
+def _reductions(targets, symmetries):
+  """ For each square, a symmetry that takes it to one of targets. """
+  return [[s for s in symmetries if s[sq] in targets][0] for sq in range(64)]
+
+PIECE_REDUCTIONS = _reductions(TRIANGLE, _symmetries())
+PAWN_REDUCTIONS = _reductions(HALF, [range(64), [sq ^ 7 for sq in range(64)]])
+
+
+class Table(object):
+  """ The layout of the positions of one material signature. """
+  def __init__(self, signature):
+    self.signature = signature
+    self.piece = PIECES[signature[1]]
+    if self.piece is Pawn:
+      self.kings, self.reductions = HALF, PAWN_REDUCTIONS
+    else:
+      self.kings, self.reductions = TRIANGLE, PIECE_REDUCTIONS
+    self.king_index = dict((sq, i) for i, sq in enumerate(self.kings))
+    self.size = 2 * len(self.kings) * 64 * 64
+
+  def index(self, weak_to_move, strong_king, weak_king, piece):
+    """
+    The index of a position, given by the square indices of the pieces with
+    the stronger side as white.
+    """
+    s = self.reductions[strong_king]
+    return (((weak_to_move * len(self.kings) +
+              self.king_index[s[strong_king]]) * 64 + s[weak_king]) * 64 +
+            s[piece])
+
+  def position(self, index):
+    """ (weak to move, strong king, weak king, piece) at index. """
+    index, piece = divmod(index, 64)
+    index, weak_king = divmod(index, 64)
+    weak_to_move, king = divmod(index, len(self.kings))
+    return weak_to_move, self.kings[king], weak_king, piece
+
+  def board(self, weak_to_move, strong_king, weak_king, piece):
+    """
+    A Board for a position, or None if it can't occur: two pieces on a
+    square, kings next to each other, a pawn on the first or last rank or
+    the side not to move in check.
+    """
+    if len(set([strong_king, weak_king, piece])) < 3:
+      return None
+    if (abs(strong_king // 8 - weak_king // 8) <= 1 and
+        abs(strong_king % 8 - weak_king % 8) <= 1):
+      return None
+    if self.piece is Pawn and piece // 8 in (0, 7):
+      return None
+    pieces = [King(Location.at(strong_king), Color.white),
+              self.piece(Location.at(piece), Color.white),
+              King(Location.at(weak_king), Color.black)]
+    for p in pieces:
+      # Kings and rooks here have moved, so can't castle
+      if p.name != 'Pawn':
+        p.move_count = 1
+    board = Board(pieces)
+    if pieces[0 if weak_to_move else 2].in_check(board):
+      return None
+    board.turn = Color.black if weak_to_move else Color.white
+    return board
+
+
+def encode(result, plies):
+  if result == WIN:
+    return plies
+  if result == LOSS:
+    return 128 + plies
+  return 0
+
+
+def decode(value):
+  """ (result, plies) for the side to move from a stored byte. """
+  if value == 0:
+    return DRAW, 0
+  if value < 128:
+    return WIN, value
+  return LOSS, value - 128
+
+
+def generate(signature, directory = DEFAULT_DIRECTORY, tables = None):
+  """
+  Works out the table for signature and writes it to directory, building
+  any table it promotes into first. Returns the table as a bytearray.
+
+  Every legal position's moves are generated once, recording which
+  positions each can be reached from. Starting from the checkmates, a
+  position with a move to one the opponent loses in n plies is a win in
+  n + 1, and a position whose moves all reach ones the opponent wins, the
+  slowest in n plies, is a loss in n + 1. Positions never reached that way
+  are draws.
+  """
+  tables = tables if tables is not None else {}
+  table = Table(signature)
+  values = bytearray(table.size)
+  # How many moves from each position don't yet lead to an opponent's win
+  pending = [0] * table.size
+  parents = [None] * table.size
+  # resolved[n] lists the (index, result) found to be decided in n plies
+  resolved = [[]]
+  def resolve(index, result, plies):
+    while len(resolved) <= plies:
+      resolved.append([])
+    resolved[plies].append((index, result))
+
+  for index in range(table.size):
+    weak_to_move, strong_king, weak_king, piece = table.position(index)
+    board = table.board(weak_to_move, strong_king, weak_king, piece)
+    if board is None:
+      continue
+    moves = board.legal_moves()
+    if not moves:
+      if board.in_check():
+        values[index] = encode(LOSS, 0)
+        resolve(index, LOSS, 0)
+      continue
+    pending[index] = len(moves)
+    for move in moves:
+      start, end = move.start.index, move.end.index
+      if move.promotion:
+        promoted = PROMOTIONS.get(move.promotion)
+        if promoted is None:
+          # A bishop or knight can't mate alone
+          continue
+        if promoted not in tables:
+          tables[promoted] = generate(promoted, directory, tables)
+        other = Table(promoted)
+        result, plies = decode(tables[promoted][
+          other.index(1, strong_king, weak_king, end)])
+        if result != DRAW:
+          # Found as though the position after were decided in plies
+          resolve(-index - 1, result, plies)
+        continue
+      if weak_to_move:
+        if end == piece:
+          # Taking the last piece leaves a draw
+          continue
+        child = table.index(0, strong_king, end, piece)
+      elif start == strong_king:
+        child = table.index(1, end, weak_king, piece)
+      else:
+        child = table.index(1, strong_king, weak_king, end)
+      if parents[child] is None:
+        parents[child] = []
+      parents[child].append(index)
+
+  plies = 0
+  while plies < len(resolved):
+    for index, result in resolved[plies]:
+      if index < 0:
+        # A promotion, its parent is the position it was made from
+        above = [-index - 1]
+      else:
+        above = parents[index] or []
+      for parent in above:
+        if values[parent] or not pending[parent]:
+          continue
+        if result == LOSS:
+          values[parent] = encode(WIN, plies + 1)
+          resolve(parent, WIN, plies + 1)
+        else:
+          pending[parent] -= 1
+          if not pending[parent]:
+            values[parent] = encode(LOSS, plies + 1)
+            resolve(parent, LOSS, plies + 1)
+    plies += 1
+
+  if directory:
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    with open(os.path.join(directory, signature + '.tb'), 'wb') as f:
+      f.write(values)
+  return values
+
+
+def signature(board):
+  """
+  Returns (signature, flipped) for a board's material, such as ('KQK',
+  False), flipped being true if the stronger side is black. None if it
+  isn't one of SIGNATURES.
+  """
+  white = sorted(p.letter for p in board.pieces if p.color == Color.white)
+  black = sorted(p.letter.upper() for p in board.pieces
+                 if p.color == Color.black)
+  if black == ['K']:
+    name, flipped = 'K' + ''.join(l for l in white if l != 'K') + 'K', False
+  elif white == ['K']:
+    name, flipped = 'K' + ''.join(l for l in black if l != 'K') + 'K', True
+  else:
+    return None
+  if name not in SIGNATURES:
+    return None
+  return name, flipped
+
+
+class Tablebase(object):
+  """ Looks positions up in the table files of a directory. """
+  def __init__(self, directory = DEFAULT_DIRECTORY):
+    self.directory = directory
+    self.tables = {}
+    self.files = []
+
+  def table(self, name):
+    """ The memory mapped file and Table for name, or None if missing. """
+    if name not in self.tables:
+      path = os.path.join(self.directory, name + '.tb')
+      self.tables[name] = None
+      if os.path.exists(path):
+        with open(path, 'rb') as f:
+          data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.files.append(data)
+        self.tables[name] = (data, Table(name))
+    return self.tables[name]
+
+  def probe(self, board):
+    """
+    Returns (result, plies) for the side to move on board: WIN, DRAW or LOSS
+    and the plies to mate. None if the board's material has no table.
+    """
+    found = signature(board)
+    if found is None:
+      return None
+    name, flipped = found
+    entry = self.table(name)
+    if entry is None:
+      return None
+    data, table = entry
+    strong = Color.black if flipped else Color.white
+    # Flipping the board top to bottom swaps the colors
+    flip = 56 if flipped else 0
+    squares = {}
+    for piece in board.pieces:
+      if piece.name == 'King':
+        squares[piece.color == strong] = piece.location.index ^ flip
+      else:
+        squares[None] = piece.location.index ^ flip
+    index = table.index(int(board.turn != strong), squares[True],
+                        squares[False], squares[None])
+    return decode(ord(data[index]))
+
+  def close(self):
+    for data in self.files:
+      data.close()
+    self.files = []
+    self.tables = {}
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Build endgame tablebases')
+  parser.add_argument('signatures', nargs = '*', default = SIGNATURES,
+                      help = 'tables to build, from ' + ', '.join(SIGNATURES))
+  parser.add_argument('-o', '--directory', default = DEFAULT_DIRECTORY)
+  args = parser.parse_args(argv)
+  tables = {}
+  for name in args.signatures:
+    if name not in SIGNATURES:
+      parser.error('no table for ' + name)
+    start = time.time()
+    if name not in tables:
+      tables[name] = generate(name, args.directory, tables)
+    values = tables[name]
+    wins = sum(1 for v in values if 0 < v < 128)
+    longest = max(v for v in values if v < 128)
+    print '%s: %d positions, %d wins, longest mate %d plies, %.1fs' % (
+      name, len(values), wins, longest, time.time() - start)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,138 @@
+from bitboard import *
+from chess import Board, Location, Color, Pawn, Knight, Bishop, Rook, Queen, King
+import random
+import unittest
+
+def piece_moves(board):
+  """ Boards reachable by the pieces of the side to move in board. """
+  rtn = []
+  for piece in board.pieces:
+    if piece.color == board.turn:
+      rtn.extend(piece.legal_moves(board))
+  return rtn
+
+def position_moves(pos):
+  rtn = []
+  for move in pos.legal_moves():
+    pos.make_move(move)
+    rtn.append(pos.to_board())
+    pos.unmake_move(move)
+  return rtn
+
+class TestPosition(unittest.TestCase):
+  def test_round_trip(self):
+    b = Board()
+    pos = Position.from_board(b)
+    self.assertEqual(pos.to_board(), b)
+    self.assertEqual(pos.castling, 15)
+    self.assertEqual(bin(pos.occupancy[WHITE]).count('1'), 16)
+
+  def test_to_board_bogus_castling(self):
+    pos = Position.from_board(Board.from_fen('4k3/8/8/8/8/8/8/4K2N w - - 0 1'))
+    pos.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE
+    self.assertEqual(pos.to_board().castling, 0)
+
+  def test_same_moves_as_pieces(self):
+    b = Board()
+    self.assertEqual(set(position_moves(Position.from_board(b))),
+                     set(piece_moves(b)))
+    b = b.move(Location(0, 6), Location(2, 5))
+    b = b.move(Location(6, 3), Location(5, 3))
+    b = b.move(Location(1, 4), Location(2, 4))
+    self.assertEqual(set(position_moves(Position.from_board(b))),
+                     set(piece_moves(b)))
+
+  def test_same_moves_as_pieces_open_board(self):
+    b = Board()
+    b.pieces = [King(Location(0, 0), Color.white),
+                Queen(Location(3, 3), Color.white),
+                Rook(Location(2, 6), Color.white),
+                Bishop(Location(1, 5), Color.white),
+                Knight(Location(5, 1), Color.white),
+                King(Location(7, 7), Color.black),
+                Rook(Location(6, 3), Color.black),
+                Pawn(Location(4, 4), Color.black)]
+    self.assertEqual(set(position_moves(Position.from_board(b))),
+                     set(piece_moves(b)))
+
+  def test_make_unmake_restores(self):
+    pos = Position.from_board(Board())
+    before = (list(pos.bitboards), list(pos.mailbox), pos.castling,
+              pos.en_passant, pos.side)
+    for move in pos.legal_moves():
+      pos.make_move(move)
+      for reply in pos.legal_moves():
+        pos.make_move(reply)
+        pos.unmake_move(reply)
+      pos.unmake_move(move)
+    self.assertEqual((pos.bitboards, pos.mailbox, pos.castling,
+                      pos.en_passant, pos.side), before)
+
+  def test_perft_initial(self):
+    pos = Position.from_board(Board())
+    self.assertEqual([pos.perft(d) for d in range(4)], [1, 20, 400, 8902])
+
+  def test_perft_pins_and_checks(self):
+    pos = Position.from_board(Board.from_fen(
+      'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'))
+    self.assertEqual([pos.perft(d) for d in range(1, 4)], [48, 2039, 97862])
+    # En passant can uncover a check along the rank
+    pos = Position.from_board(Board.from_fen(
+      '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'))
+    self.assertEqual([pos.perft(d) for d in range(1, 4)], [14, 191, 2812])
+
+  def test_no_castling_into_check(self):
+    pos = Position.from_board(Board.from_fen('4k1r1/8/8/8/8/8/8/R3K2R w KQ - 0 1'))
+    moves = [move_name(m) for m in pos.legal_moves()]
+    self.assertFalse('e1g1' in moves)
+    self.assertTrue('e1c1' in moves)
+
+  def test_castling_and_en_passant(self):
+    b = Board()
+    b.pieces = [King(Location(0, 4), Color.white),
+                Rook(Location(0, 0), Color.white),
+                Rook(Location(0, 7), Color.white),
+                Pawn(Location(4, 4), Color.white),
+                King(Location(7, 4), Color.black),
+                Pawn(Location(6, 3), Color.black)]
+    b.turn = Color.black
+    pos = Position.from_board(b)
+    push = make_move_code(51, 35, 0, DOUBLE_PUSH)
+    self.assertTrue(push in pos.legal_moves())
+    pos.make_move(push)
+    moves = [move_name(m) for m in pos.legal_moves()]
+    self.assertTrue('e5d6' in moves)
+    self.assertTrue('e1g1' in moves)
+    self.assertTrue('e1c1' in moves)
+    pos.make_move(make_move_code(36, 43, 0, EN_PASSANT))
+    self.assertEqual(pos.mailbox[35], -1)
+    self.assertEqual(pos.mailbox[43], PAWN)
+
+  def test_board_legal_moves_match(self):
+    """ Board.legal_moves agrees with the bitboard generator on random games. """
+    rng = random.Random(7)
+    letters = dict((cls, 'pnbrqk'[i]) for i, cls in enumerate(PIECE_CLASSES))
+    for game in range(6):
+      b = Board()
+      for ply in range(120):
+        moves = b.legal_moves()
+        names = set(move_name(make_move_code(m.start.index, m.end.index))
+                    + (letters[m.promotion] if m.promotion else '')
+                    for m in moves)
+        pos = Position.from_board(b)
+        self.assertEqual(names, set(move_name(m) for m in pos.legal_moves()))
+        if not moves:
+          break
+        b.make_move(rng.choice(moves))
+
+  def test_in_check(self):
+    b = Board()
+    b.pieces = [King(Location(0, 4), Color.white),
+                King(Location(7, 4), Color.black),
+                Rook(Location(5, 4), Color.black)]
+    pos = Position.from_board(b)
+    self.assertTrue(pos.in_check())
+    self.assertTrue(all(move_end(m) & 7 != 4 for m in pos.legal_moves()))
+
+if __name__ == "__main__":
+  unittest.main()
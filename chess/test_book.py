@@ -0,0 +1,74 @@
+from book import *
+from chess import Board, Location, Move
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+GAMES = '''[Event "1"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 1-0
+
+[Event "2"]
+
+1. e4 c5 2. Nf3 d6 0-1
+
+[Event "3"]
+
+1. d4 d5 2. c4 e6 1/2-1/2
+
+[Event "4"]
+
+1. e4 e5 2. Nf3 Nf6 *
+'''
+
+class TestBook(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    pgn = os.path.join(self.directory, 'games.pgn')
+    with open(pgn, 'w') as f:
+      f.write(GAMES)
+    epd = os.path.join(self.directory, 'tests.epd')
+    with open(epd, 'w') as f:
+      f.write('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - bm O-O;\n')
+    self.path = os.path.join(self.directory, 'book.bin')
+    self.count = build(book_games([pgn, epd], 3), self.path)
+    self.book = Book(self.path)
+
+  def tearDown(self):
+    self.book.close()
+    shutil.rmtree(self.directory)
+
+  def test_entries(self):
+    self.assertEqual(self.count, 9)
+    self.assertEqual(os.path.getsize(self.path), 16 * 9)
+    board = Board()
+    self.assertEqual([(m.uci(), w) for m, w, l in self.book.entries(board)],
+                     [('e2e4', 3), ('d2d4', 1)])
+    board.make_move(board.parse_san('e4'))
+    self.assertEqual([(m.uci(), w) for m, w, l in self.book.entries(board)],
+                     [('e7e5', 2), ('c7c5', 1)])
+    board.make_move(board.parse_san('h5'))
+    self.assertEqual(self.book.entries(board), [])
+
+  def test_castling(self):
+    board = Board.from_fen('r3k2r/8/8/8/8/8/8/R3K2R w KQkq -')
+    move = board.parse_san('O-O')
+    self.assertEqual(encode_move(move), encode_move(
+      Move(Location(0, 4), Location(0, 7))))
+    self.assertEqual([m for m, w, l in self.book.entries(board)], [move])
+
+  def test_sorted(self):
+    keys = [self.book.key(i) for i in range(self.book.count)]
+    self.assertEqual(keys, sorted(keys))
+
+  def test_choose(self):
+    rng = random.Random(1)
+    picks = set(self.book.choose(Board(), rng).uci() for i in range(50))
+    self.assertEqual(picks, set(['e2e4', 'd2d4']))
+    self.assertEqual(self.book.choose(Board.from_fen('8/8/8/8/8/8/8/K6k w')),
+                     None)
+
+if __name__ == "__main__":
+  unittest.main()
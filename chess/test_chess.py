@@ -1,6 +1,30 @@
 from chess import *
+import pickle
+import random
+import timeit
 import unittest
 
+class TestLocation(unittest.TestCase):
+  def test_interned(self):
+    self.assertTrue(Location(3, 4) is Location(3, 4))
+    self.assertTrue(Location.at(28) is Location(3, 4))
+    self.assertTrue(Location.from_name('e4') is Location(3, 4))
+    self.assertTrue(pickle.loads(pickle.dumps(Location(3, 4), 2)) is
+                    Location(3, 4))
+    self.assertEqual(len(set([Location(3, 4), Location(3, 4)])), 1)
+
+  def test_immutable(self):
+    with self.assertRaises(AttributeError):
+      Location(3, 4).row = 5
+    with self.assertRaises(Exception):
+      Location(8, 0)
+
+  def test_copy_shares_location(self):
+    p = Knight(Location(2, 2), Color.white)
+    self.assertTrue(p.copy().location is p.location)
+    with self.assertRaises(AttributeError):
+      p.extra = 1
+
 class TestBoard(unittest.TestCase):
   def test_equals(self):
     a = Board()
@@ -13,54 +37,584 @@ class TestBoard(unittest.TestCase):
     b.turn = Color.black
     self.assertFalse(a == b)
 
+  def test_at_location(self):
+    b = Board()
+    self.assertEqual(b.at_location(Location(0, 4)).name, 'King')
+    self.assertEqual(b.at_location(Location(6, 0)).letter, 'p')
+    self.assertEqual(b.at_location(Location(4, 4)), None)
+
+  def test_move_updates_squares(self):
+    b = Board()
+    new_b = b.move(Location(0, 1), Location(2, 2))
+    self.assertEqual(new_b.at_location(Location(0, 1)), None)
+    self.assertEqual(new_b.at_location(Location(2, 2)).name, 'Knight')
+    self.assertEqual(len(new_b.pieces), 32)
+    # The original board is untouched
+    self.assertEqual(b.at_location(Location(0, 1)).name, 'Knight')
+    self.assertEqual(b.at_location(Location(2, 2)), None)
+
+  def test_capture_removes_piece(self):
+    b = Board()
+    b.pieces = [Rook(Location(0, 0), Color.white),
+                Rook(Location(0, 5), Color.black)]
+    new_b = b.move(Location(0, 0), Location(0, 5))
+    self.assertEqual(len(new_b.pieces), 1)
+    self.assertEqual(new_b.at_location(Location(0, 5)).color, Color.white)
+
+  def test_make_unmake_move(self):
+    b = Board()
+    b.pieces = [Rook(Location(0, 0), Color.white),
+                Knight(Location(0, 5), Color.black),
+                Pawn(Location(6, 1), Color.white)]
+    before = b.copy()
+    move = Move(Location(0, 0), Location(0, 5))
+    b.make_move(move)
+    self.assertEqual(b.history[-1][5].name, 'Knight')
+    self.assertEqual(b.at_location(Location(0, 5)).name, 'Rook')
+    self.assertEqual(b.turn, Color.black)
+    b.unmake_move(move)
+    self.assertEqual(b, before)
+    self.assertEqual([p.name for p in b.pieces], ['Rook', 'Knight', 'Pawn'])
+
+    move = Move(Location(6, 1), Location(7, 1), Queen)
+    b.make_move(move)
+    self.assertEqual(b.at_location(Location(7, 1)).letter, 'Q')
+    b.unmake_move(move)
+    self.assertEqual(b, before)
+    self.assertEqual(b.at_location(Location(6, 1)).move_count, 0)
+
+  def test_moves_match_legal_moves(self):
+    b = Board()
+    for piece in b.pieces:
+      self.assertEqual(set(piece.legal_moves(b)),
+                       set(b.apply_move(m) for m in piece.moves(b)))
+
+  def test_zobrist(self):
+    a = Board()
+    b = Board()
+    self.assertEqual(a.zobrist, b.zobrist)
+    self.assertEqual(hash(a), hash(a.zobrist))
+    b.turn = Color.black
+    self.assertNotEqual(a.zobrist, b.zobrist)
+    b.turn = Color.white
+    self.assertEqual(a.zobrist, b.zobrist)
+
+    # Transpositions hash the same, and match a hash from scratch
+    a = a.move(Location(0, 1), Location(2, 2)).move(Location(7, 1), Location(5, 2))
+    a = a.move(Location(0, 6), Location(2, 5))
+    b = b.move(Location(0, 6), Location(2, 5)).move(Location(7, 1), Location(5, 2))
+    b = b.move(Location(0, 1), Location(2, 2))
+    self.assertEqual(a.zobrist, b.zobrist)
+    self.assertEqual(a.zobrist, a.compute_zobrist())
+
+  def test_zobrist_castling_and_en_passant(self):
+    b = Board()
+    rook_out = b.move(Location(0, 7), Location(2, 7))
+    rook_back = rook_out.move(Location(7, 1), Location(5, 2))
+    rook_back = rook_back.move(Location(2, 7), Location(0, 7))
+    self.assertEqual(rook_back.castling, Castling.white_queenside |
+                     Castling.black_kingside | Castling.black_queenside)
+    self.assertEqual(rook_back.zobrist, rook_back.compute_zobrist())
+
+    b.pieces = [Pawn(Location(1, 3), Color.white),
+                Pawn(Location(3, 4), Color.black)]
+    pushed = b.move(Location(1, 3), Location(3, 3))
+    self.assertEqual(pushed.en_passant, Location(2, 3))
+    self.assertEqual(pushed.zobrist, pushed.compute_zobrist())
+    stepped = b.move(Location(1, 3), Location(2, 3))
+    self.assertEqual(stepped.en_passant, None)
+
+  def test_zobrist_unmake(self):
+    b = Board()
+    key = b.zobrist
+    for piece in list(b.pieces):
+      for move in piece.moves(b):
+        b.make_move(move)
+        self.assertEqual(b.zobrist, b.compute_zobrist())
+        b.unmake_move(move)
+    self.assertEqual(b.zobrist, key)
+
+  def test_fen(self):
+    self.assertEqual(Board.from_fen(Board().fen()), Board())
+    fen = 'r3k2r/8/8/3pP3/8/8/8/R3K2R w Kq d6 0 1'
+    b = Board.from_fen(fen)
+    self.assertEqual(b.fen(), fen)
+    self.assertEqual(b.castling,
+                     Castling.white_kingside | Castling.black_queenside)
+    self.assertEqual(b.en_passant, Location(5, 3))
+    # No pawn can take en passant, so the square is dropped
+    b = Board.from_fen('4k3/8/8/3p4/8/8/8/4K3 w - d6 0 1')
+    self.assertEqual(b.en_passant, None)
+    self.assertEqual(Location.from_name('e4'), Location(3, 4))
+    self.assertEqual(Location(3, 4).name(), 'e4')
+
+  def test_fen_clocks(self):
+    fen = 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8'
+    b = Board.from_fen(fen)
+    self.assertEqual((b.halfmove_clock, b.fullmove_number), (1, 8))
+    self.assertEqual(b.fen(), fen)
+    b = b.move(Location(0, 1), Location(2, 2))
+    self.assertEqual(b.fen().split()[1:], ['b', 'KQ', '-', '2', '8'])
+    b = Board()
+    for start, end in (('e2', 'e4'), ('e7', 'e5'), ('g1', 'f3')):
+      b = b.move(Location.from_name(start), Location.from_name(end))
+    self.assertEqual(b.fen(),
+                     'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2')
+    # EPD leaves the clocks off
+    b = Board.from_fen('4k3/8/8/8/8/8/8/4K3 b -')
+    self.assertEqual(b.fen(), '4k3/8/8/8/8/8/8/4K3 b - - 0 1')
+    with self.assertRaises(Exception):
+      Board.from_fen('4k3/8/8 w - - 0 1')
+
+  def test_fen_bogus_castling(self):
+    # No rook on h1, then a knight there, then a black rook
+    for fen in ('4k3/8/8/8/8/8/8/4K3 w K - 0 1',
+                '4k3/8/8/8/8/8/8/4K2N w K - 0 1',
+                '4k3/8/8/8/8/8/8/4K2r w K - 0 1'):
+      b = Board.from_fen(fen)
+      self.assertEqual(b.castling, 0)
+      self.assertFalse(any(m.castle for m in b.legal_moves()))
+      self.assertEqual(b.fen().split()[2], '-')
+    # Rights that can be used are kept
+    b = Board.from_fen('r3k3/8/8/8/8/8/8/4K2N w Kq - 0 1')
+    self.assertEqual(b.castling, Castling.black_queenside)
+
+class TestEvaluate(unittest.TestCase):
+  def test_symmetric(self):
+    b = Board()
+    self.assertEqual(b.evaluate(), 0)
+    self.assertEqual(b.phase, MAX_PHASE)
+    b = b.move(Location(1, 4), Location(3, 4))
+    # Black to move, and white's pawn is better placed
+    self.assertTrue(b.evaluate() < 0)
+
+  def test_incremental_matches_scratch(self):
+    rng = random.Random(3)
+    for game in range(4):
+      b = Board()
+      for ply in range(150):
+        self.assertEqual((b.middlegame, b.endgame, b.phase),
+                         b.compute_evaluation())
+        moves = b.legal_moves()
+        if not moves:
+          break
+        b.make_move(rng.choice(moves))
+      while b.history:
+        b.unmake_move()
+        self.assertEqual((b.middlegame, b.endgame, b.phase),
+                         b.compute_evaluation())
+      self.assertEqual(b.evaluate(), 0)
+
+  def test_tapered(self):
+    # With only kings and pawns left the king is scored for the endgame,
+    # where it belongs in the centre
+    center = Board.from_fen('8/8/8/4k3/8/8/8/K7 w - - 0 1')
+    self.assertEqual(center.phase, 0)
+    self.assertTrue(center.evaluate() < 0)
+    self.assertEqual(center.evaluate(),
+                     ENDGAME_SQUARES['K'][0] + ENDGAME_SQUARES['k'][36])
+
+class TestSan(unittest.TestCase):
+  def test_round_trip(self):
+    for fen in ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                '4k3/8/8/2N1N3/8/2N1N3/8/4K3 w - - 0 1'):
+      b = Board.from_fen(fen)
+      for move in b.legal_moves():
+        self.assertEqual(b.parse_san(b.san(move)), move)
+
+  def test_san(self):
+    b = Board.from_fen('4k3/8/8/2N1N3/8/2N1N3/8/4K3 w - - 0 1')
+    names = set(b.san(m) for m in b.legal_moves())
+    self.assertTrue(set(['Ncd5', 'N3c4', 'Nb5']) <= names)
+    b = Board.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+    self.assertEqual(b.san(b.parse_san('Ra8')), 'Ra8#')
+    b = Board.from_fen('r3k2r/8/8/8/8/8/1p6/R3K2R b KQkq - 0 1')
+    self.assertEqual(b.san(b.parse_san('0-0-0')), 'O-O-O')
+    self.assertEqual(b.san(b.parse_san('bxa1Q')), 'bxa1=Q+')
+    self.assertEqual(b.parse_san('b1=N').promotion, Knight)
+    for bad in ('Ke3', 'Nf3', 'b1', 'xyz'):
+      with self.assertRaises(ValueError):
+        b.parse_san(bad)
+
+class TestHistory(unittest.TestCase):
+  def test_undo_restores_clocks(self):
+    b = Board()
+    before = b.copy()
+    moves = [Move(Location(0, 6), Location(2, 5)),
+             Move(Location(6, 4), Location(4, 4)),
+             Move(Location(2, 5), Location(4, 4))]
+    for move in moves:
+      b.make_move(move)
+    self.assertEqual((b.halfmove_clock, b.fullmove_number), (0, 2))
+    self.assertEqual(len(b.history), 3)
+    for move in reversed(moves):
+      self.assertTrue(b.unmake_move() is move)
+    self.assertEqual(b, before)
+    self.assertEqual((b.halfmove_clock, b.fullmove_number, b.history),
+                     (0, 1, []))
+
+  def test_threefold_repetition(self):
+    b = Board()
+    shuffle = [Move(Location(0, 6), Location(2, 5)),
+               Move(Location(7, 6), Location(5, 5)),
+               Move(Location(2, 5), Location(0, 6)),
+               Move(Location(5, 5), Location(7, 6))]
+    for move in shuffle * 2:
+      self.assertFalse(b.is_threefold_repetition())
+      b.make_move(move)
+    self.assertEqual(b.repetitions(), 3)
+    self.assertTrue(b.is_threefold_repetition())
+    self.assertEqual(b.halfmove_clock, 8)
+    self.assertFalse(b.is_fifty_moves())
+
+  def test_copy_has_its_own_history(self):
+    b = Board()
+    b.pieces = [Rook(Location(0, 0), Color.white),
+                Knight(Location(0, 5), Color.black)]
+    move = Move(Location(0, 0), Location(0, 5))
+    b.make_move(move)
+    c = b.copy()
+    c.unmake_move()
+    self.assertEqual(len(b.history), 1)
+    self.assertEqual(len(b.pieces), 1)
+    self.assertEqual(len(c.pieces), 2)
+    # The same Move can be made on both
+    c.make_move(move)
+    self.assertEqual(c, b)
+    self.assertFalse(c.history[0][5] is b.history[0][5])
+
+  def test_copy_unmakes_after_original_moves_on(self):
+    b = Board.from_fen('4k3/8/8/8/8/8/2p5/R3K3 w - - 0 1')
+    b.make_move(Move(Location(0, 0), Location(1, 2)))
+    c = b.copy()
+    # The original puts the pawn back and pushes it before the copy unmakes
+    b.unmake_move()
+    b.make_move(Move(Location(0, 4), Location(0, 3)))
+    b.make_move(Move(Location(1, 2), Location(0, 2), Queen))
+    c.unmake_move()
+    self.assertEqual(c.fen(), '4k3/8/8/8/8/8/2p5/R3K3 w - - 0 1')
+    pawn = c.squares[Location(1, 2).index]
+    self.assertEqual((pawn.location, pawn.move_count), (Location(1, 2), 1))
+
+  def test_copy_time_independent_of_history(self):
+    def copy_time(board):
+      return min(timeit.repeat(board.copy, number = 200, repeat = 5))
+    b = Board()
+    short = copy_time(b)
+    shuffle = [Move(Location(0, 6), Location(2, 5)),
+               Move(Location(7, 6), Location(5, 5)),
+               Move(Location(2, 5), Location(0, 6)),
+               Move(Location(5, 5), Location(7, 6))]
+    for move in shuffle * 500:
+      b.make_move(move)
+    self.assertEqual(len(b.history), 2000)
+    self.assertTrue(b.copy().history is b.history)
+    self.assertTrue(copy_time(b) < 3 * short)
+
 class TestPawn(unittest.TestCase):
   def test_basic_move(self):
     b = Board()
-    p = Pawn(Location(2, 2))
+    p = Pawn(Location(2, 2), Color.white)
     b.pieces = [p]
     test_moves = p.legal_moves(b)
 
     new_b = Board()
-    new_b.pieces = [Pawn(Location(3, 2))]
+    new_b.pieces = [Pawn(Location(3, 2), Color.white)]
+    new_b.turn = Color.black
     actual_moves = [new_b]
 
     self.assertEqual(set(test_moves), set(actual_moves))
 
   def test_blocked_move(self):
     b = Board()
-    black_pawn = Pawn(Location(2, 2), Color.black)
-    white_pawn = Pawn(Location(3, 2), Color.white)
-    b.pieces = [black_pawn, white_pawn]
-    test_moves = black_pawn.legal_moves(b)
+    white_pawn = Pawn(Location(2, 2), Color.white)
+    black_pawn = Pawn(Location(3, 2), Color.black)
+    b.pieces = [white_pawn, black_pawn]
+    test_moves = white_pawn.legal_moves(b)
 
     actual_moves = []
 
-    print test_moves[0]
-
     self.assertEqual(set(test_moves), set(actual_moves))
 
   def test_first_move(self):
     b = Board()
-    p = Pawn(Location(1, 2))
+    p = Pawn(Location(1, 2), Color.white)
     b.pieces = [p]
     test_moves = p.legal_moves(b)
 
     new_b1 = Board()
-    new_b1.pieces = [Pawn(Location(3, 2))]
+    new_b1.pieces = [Pawn(Location(3, 2), Color.white)]
+    new_b1.turn = Color.black
     new_b2 = Board()
-    new_b2.pieces = [Pawn(Location(2, 2))]
+    new_b2.pieces = [Pawn(Location(2, 2), Color.white)]
+    new_b2.turn = Color.black
     actual_moves = [new_b1, new_b2]
 
     self.assertEqual(set(test_moves), set(actual_moves))
 
 #  def test_edge(self):
 
-#  def test_capture(self):
+  def test_capture(self):
+    b = Board()
+    p = Pawn(Location(2, 2), Color.white)
+    b.pieces = [p, Pawn(Location(3, 2), Color.black),
+                Knight(Location(3, 3), Color.black),
+                Knight(Location(3, 1), Color.white)]
+    self.assertEqual([str(m.end) for m in p.moves(b)], ['3, 3'])
 
-#  def test_upgrade(self):
+  def test_upgrade(self):
+    b = Board()
+    p = Pawn(Location(6, 2), Color.white)
+    b.pieces = [p]
+    test_moves = p.moves(b)
+    self.assertEqual(set(m.promotion for m in test_moves),
+                     set([Queen, Rook, Bishop, Knight]))
+    new_b = b.apply_move(test_moves[0])
+    self.assertEqual(new_b.at_location(Location(7, 2)).color, Color.white)
 
 #  def test_upgrade_capture(self):
 
 
+class TestKing(unittest.TestCase):
+  def test_in_check(self):
+    b = Board()
+    king = King(Location(0, 4), Color.white)
+    b.pieces = [king, Rook(Location(5, 4), Color.black)]
+    self.assertTrue(king.in_check(b))
+    b.pieces = [king, Rook(Location(5, 4), Color.black),
+                Pawn(Location(1, 4), Color.white)]
+    self.assertFalse(king.in_check(b))
+    b.pieces = [king, Knight(Location(2, 5), Color.black)]
+    self.assertTrue(king.in_check(b))
+    b.pieces = [king, Pawn(Location(1, 3), Color.black)]
+    self.assertTrue(king.in_check(b))
+    b.pieces = [king, Pawn(Location(1, 3), Color.white)]
+    self.assertFalse(king.in_check(b))
+    b.pieces = [king, Queen(Location(3, 7), Color.black)]
+    self.assertTrue(king.in_check(b))
+    b.pieces = [king, King(Location(1, 5), Color.black)]
+    self.assertTrue(king.in_check(b))
+
+  def test_is_square_attacked(self):
+    b = Board()
+    self.assertTrue(is_square_attacked(b, Location(2, 0), Color.white))
+    self.assertTrue(is_square_attacked(b, Location(5, 7), Color.black))
+    self.assertFalse(is_square_attacked(b, Location(3, 0), Color.white))
+    self.assertFalse(is_square_attacked(b, Location(2, 0), Color.black))
+
+  def test_no_moves_into_check(self):
+    b = Board()
+    king = King(Location(0, 0), Color.white)
+    b.pieces = [king, Rook(Location(7, 1), Color.black)]
+    self.assertEqual(sorted(str(m.end) for m in king.moves(b)), ['1, 0'])
+
+class TestLegalMoves(unittest.TestCase):
+  def ends(self, moves):
+    return sorted(str(m.start) + ' -> ' + str(m.end) for m in moves)
+
+  def test_initial(self):
+    self.assertEqual(len(Board().legal_moves()), 20)
+
+  def test_pinned_piece(self):
+    b = Board()
+    b.pieces = [King(Location(0, 4), Color.white),
+                Rook(Location(1, 4), Color.white),
+                Queen(Location(6, 4), Color.black),
+                King(Location(7, 0), Color.black)]
+    rook_moves = [m for m in b.legal_moves() if m.start == Location(1, 4)]
+    self.assertEqual(sorted(str(m.end) for m in rook_moves),
+                     ['2, 4', '3, 4', '4, 4', '5, 4', '6, 4'])
+
+  def test_block_or_capture_check(self):
+    b = Board()
+    b.pieces = [King(Location(0, 0), Color.white),
+                Knight(Location(1, 2), Color.white),
+                Rook(Location(4, 0), Color.black),
+                King(Location(7, 7), Color.black)]
+    self.assertEqual(self.ends(b.legal_moves()),
+                     ['0, 0 -> 0, 1', '0, 0 -> 1, 1', '1, 2 -> 2, 0'])
+
+  def test_double_check(self):
+    b = Board()
+    b.pieces = [King(Location(0, 4), Color.white),
+                Queen(Location(0, 0), Color.white),
+                Rook(Location(5, 4), Color.black),
+                Knight(Location(2, 3), Color.black),
+                King(Location(7, 7), Color.black)]
+    self.assertTrue(all(m.start == Location(0, 4) for m in b.legal_moves()))
+
+  def test_castling(self):
+    b = Board()
+    b.pieces = [King(Location(0, 4), Color.white),
+                Rook(Location(0, 0), Color.white),
+                Rook(Location(0, 7), Color.white),
+                King(Location(7, 4), Color.black)]
+    castles = [m for m in b.legal_moves() if m.castle]
+    self.assertEqual(sorted(str(m.end) for m in castles), ['0, 2', '0, 6'])
+    kingside = [m for m in castles if m.end == Location(0, 6)][0]
+    b.make_move(kingside)
+    self.assertEqual(b.at_location(Location(0, 5)).name, 'Rook')
+    self.assertEqual(b.castling, 0)
+    self.assertEqual(b.zobrist, b.compute_zobrist())
+    b.unmake_move(kingside)
+    self.assertEqual(b.at_location(Location(0, 7)).name, 'Rook')
+    self.assertEqual(b.castling,
+                     Castling.white_kingside | Castling.white_queenside)
+
+    # Not through an attacked square
+    b.pieces = b.pieces + [Rook(Location(5, 5), Color.black)]
+    castles = [m for m in b.legal_moves() if m.castle]
+    self.assertEqual(sorted(str(m.end) for m in castles), ['0, 2'])
+
+  def test_en_passant(self):
+    b = Board()
+    b.pieces = [King(Location(0, 0), Color.white),
+                Pawn(Location(4, 4), Color.white),
+                Pawn(Location(6, 3), Color.black),
+                King(Location(7, 7), Color.black)]
+    b.turn = Color.black
+    b = b.move(Location(6, 3), Location(4, 3))
+    captures = [m for m in b.legal_moves() if m.en_passant]
+    self.assertEqual(len(captures), 1)
+    b.make_move(captures[0])
+    self.assertEqual(b.at_location(Location(4, 3)), None)
+    self.assertEqual(b.at_location(Location(5, 3)).letter, 'P')
+    self.assertEqual(len(b.pieces), 3)
+
+  def test_en_passant_exposing_king(self):
+    b = Board()
+    b.pieces = [King(Location(4, 0), Color.white),
+                Pawn(Location(4, 4), Color.white),
+                Pawn(Location(6, 3), Color.black),
+                Rook(Location(4, 7), Color.black),
+                King(Location(7, 7), Color.black)]
+    b.turn = Color.black
+    b = b.move(Location(6, 3), Location(4, 3))
+    self.assertEqual([m for m in b.legal_moves() if m.en_passant], [])
+
+  def test_iter_captures_first(self):
+    b = Board.from_fen(
+      'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+    moves = list(b.iter_legal_moves())
+    self.assertEqual(sorted(moves, key = Move.uci),
+                     sorted(b.legal_moves(), key = Move.uci))
+    tactical = [bool(b.squares[m.end.index] or m.en_passant or m.promotion)
+             for m in moves]
+    self.assertEqual(tactical, sorted(tactical, reverse = True))
+    captures = list(b.iter_legal_moves(captures_only = True))
+    self.assertEqual(len(captures), tactical.count(True))
+
+  def test_search_while_iterating(self):
+    # Captured pieces come back as the same objects, so moves the generator
+    # has yet to yield still refer to pieces on the board
+    def perft(board, depth):
+      if depth == 0:
+        return 1
+      nodes = 0
+      for move in board.iter_legal_moves():
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(move)
+      return nodes
+    b = Board.from_fen(
+      'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+    self.assertEqual(perft(b, 3), 97862)
+
+  def test_checkmate_and_stalemate(self):
+    b = Board.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+    self.assertTrue(b.has_legal_move())
+    self.assertFalse(b.is_checkmate())
+    b.make_move(Move(Location(0, 0), Location(7, 0)))
+    self.assertTrue(b.is_checkmate())
+    self.assertFalse(b.is_stalemate())
+    b = Board.from_fen('k7/2Q5/1K6/8/8/8/8/8 b - - 0 1')
+    self.assertTrue(b.is_stalemate())
+    self.assertFalse(b.has_legal_move())
+
+class TestPositionCache(unittest.TestCase):
+  def test_same_moves(self):
+    b = Board()
+    b.cache = PositionCache()
+    for uci in ('e2e4', 'e7e5', 'g1f3', 'b8c6'):
+      moves = b.legal_moves()
+      b.cache = None
+      self.assertEqual(moves, b.legal_moves())
+      b.cache = PositionCache()
+      b.make_move([m for m in moves if m.uci() == uci][0])
+
+  def test_hits(self):
+    cache = PositionCache()
+    b = Board()
+    b.cache = cache
+    b.legal_moves()
+    self.assertEqual((cache.hits, cache.misses), (0, 1))
+    # The same position reached another way is a hit
+    for uci in ('g1f3', 'g8f6', 'f3g1', 'f6g8'):
+      b.make_move([m for m in b.legal_moves() if m.uci() == uci][0])
+    self.assertEqual(cache.misses, 4)
+    self.assertEqual(cache.hits, 1)
+    # The moves returned are the caller's to change
+    b.legal_moves().pop()
+    self.assertEqual(len(b.legal_moves()), 20)
+    self.assertFalse(b.in_check())
+    self.assertFalse(b.in_check())
+    stats = cache.stats()
+    self.assertEqual((stats['entries'], stats['hits'], stats['misses']),
+                     (4, 4, 5))
+    self.assertEqual(b.copy().cache, cache)
+
+  def test_status(self):
+    cache = PositionCache()
+    b = Board.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+    b.cache = cache
+    self.assertEqual(cache.status(b), None)
+    b.make_move(Move(Location(0, 0), Location(7, 0)))
+    self.assertEqual(cache.status(b), 'checkmate')
+    self.assertTrue(b.is_checkmate())
+    self.assertFalse(b.is_stalemate())
+    b = Board.from_fen('k7/2Q5/1K6/8/8/8/8/8 b - - 0 1')
+    b.cache = cache
+    self.assertEqual(cache.status(b), 'stalemate')
+    self.assertTrue(b.is_stalemate())
+
+  def test_eviction(self):
+    cache = PositionCache(max_entries = 2)
+    b = Board()
+    b.cache = cache
+    first = b.zobrist
+    for move in b.legal_moves()[:3]:
+      b.make_move(move)
+      b.legal_moves()
+      b.unmake_move()
+    self.assertEqual(len(cache.entries), 2)
+    self.assertEqual(cache.evictions, 2)
+    self.assertFalse(first in cache.entries)
+    # Looking a position up makes it the last to go
+    cache = PositionCache(max_entries = 2)
+    b.cache = cache
+    moves = b.legal_moves()
+    b.make_move(moves[0])
+    b.legal_moves()
+    b.unmake_move()
+    b.legal_moves()
+    b.make_move(moves[1])
+    b.legal_moves()
+    self.assertTrue(first in cache.entries)
+
+  def test_byte_budget(self):
+    size = PositionCache.ENTRY_BYTES + 20 * PositionCache.MOVE_BYTES
+    cache = PositionCache(max_bytes = 2 * size)
+    b = Board()
+    b.cache = cache
+    for move in b.legal_moves()[:5]:
+      b.make_move(move)
+      b.legal_moves()
+      b.unmake_move()
+      self.assertTrue(cache.bytes <= 2 * size)
+    self.assertTrue(cache.evictions >= 3)
+    cache.clear()
+    self.assertEqual((len(cache.entries), cache.bytes), (0, 0))
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,40 @@
+from epd import *
+from StringIO import StringIO
+import unittest
+
+SUITE = '''# a comment
+rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - ;D1 20 ;D2 400 ;id "initial"
+
+8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - ;D1 14 ;D2 191 ;id "endgame"
+8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - ;D1 14 ;D2 190 ;id "wrong"
+'''
+
+class TestEpd(unittest.TestCase):
+  def test_parse_epd(self):
+    board, operations = parse_epd(
+      '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - bm a1a8; id "mate 1"; hmvc 3;')
+    self.assertEqual(operations, {'bm': 'a1a8', 'id': 'mate 1', 'hmvc': '3'})
+    self.assertEqual(board.fen(), '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 3 1')
+
+  def test_analyze(self):
+    results = list(analyze(StringIO(SUITE), perft_task, (2,)))
+    self.assertEqual([(n, name, passed) for n, name, passed, text in results],
+                     [(1, 'initial', True), (2, 'endgame', True),
+                      (3, 'wrong', False)])
+    self.assertEqual(results[2][3], 'D1 14 D2 191 expected 190')
+
+  def test_analyze_in_pool(self):
+    results = analyze(StringIO(SUITE), perft_task, (2,), jobs = 2)
+    self.assertEqual(sorted((n, passed) for n, name, passed, text in results),
+                     [(1, True), (2, True), (3, False)])
+
+  def test_search_task(self):
+    out = StringIO()
+    failed = run(StringIO('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - bm Ra8#;\n'
+                          '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - am a1a8;\n'),
+                 search_task, (3, None, None), out = out)
+    self.assertEqual(failed, 1)
+    self.assertTrue('2 positions 1 failed' in out.getvalue())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,58 @@
+from instrument import *
+from chess import Board, Pawn
+from perft import perft
+import json
+import os
+import tempfile
+import unittest
+from StringIO import StringIO
+
+class TestInstrument(unittest.TestCase):
+  def tearDown(self):
+    disable()
+
+  def test_counts_perft(self):
+    enable()
+    self.assertEqual(perft(Board(), 2), 400)
+    disable()
+    functions = results()['functions']
+    self.assertEqual(functions['Board.legal_moves']['calls'], 21)
+    self.assertEqual(functions['Board.make_move']['calls'], 20)
+    self.assertTrue(functions['Pawn.iter_moves']['calls'] > 0)
+    self.assertTrue(functions['Board.legal_moves']['seconds'] > 0)
+    self.assertEqual(results()['allocations']['Move'], 420)
+
+  def test_disable_restores(self):
+    copy = Board.__dict__['copy']
+    enable()
+    self.assertTrue(enabled())
+    self.assertNotEqual(Board.__dict__['copy'], copy)
+    self.assertTrue('legal_moves' in Pawn.__dict__)
+    disable()
+    self.assertFalse(enabled())
+    self.assertEqual(Board.__dict__['copy'], copy)
+    self.assertFalse('legal_moves' in Pawn.__dict__)
+    # Counting stops once disabled
+    perft(Board(), 1)
+    self.assertEqual(results()['functions']['Board.legal_moves']['calls'], 0)
+
+  def test_report_and_json(self):
+    enable()
+    Board().copy()
+    disable()
+    out = StringIO()
+    report(out)
+    self.assertTrue('Board.copy' in out.getvalue())
+    handle, path = tempfile.mkstemp(suffix = '.json')
+    os.close(handle)
+    try:
+      dump_json(path)
+      with open(path) as f:
+        data = json.load(f)
+    finally:
+      os.remove(path)
+    self.assertEqual(data['functions']['Board.copy']['calls'], 1)
+    self.assertEqual(data['allocations']['Board'], 2)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,95 @@
+from match import *
+from chess import Board
+from pgn import read_games, replay
+import unittest
+from StringIO import StringIO
+
+# White mates with Qa8
+MATE_IN_ONE = '6k1/8/6K1/8/8/8/8/7Q w - - 0 1'
+
+class TestConfig(unittest.TestCase):
+  def test_parse(self):
+    config = Config.parse('new:nodes=500,depth=3,tt=10')
+    self.assertEqual(config.name, 'new')
+    self.assertEqual((config.nodes, config.depth, config.tt_size),
+                     (500, 3, 1024))
+    self.assertEqual(Config.parse('time=0.5').name, 'time=0.5')
+    self.assertRaises(ValueError, Config.parse, 'fast')
+    self.assertRaises(ValueError, Config.parse, 'speed=3')
+
+class TestElo(unittest.TestCase):
+  def test_elo(self):
+    self.assertAlmostEqual(elo(0.5), 0)
+    self.assertAlmostEqual(elo(0.75), 190.85, places = 1)
+    self.assertAlmostEqual(expected_score(elo(0.64)), 0.64)
+
+  def test_margin(self):
+    difference, margin = elo_margin(60, 20, 20)
+    self.assertTrue(difference > 0)
+    self.assertTrue(difference - margin > 0)
+    # More games, narrower margin
+    self.assertTrue(elo_margin(600, 200, 200)[1] < margin)
+    self.assertEqual(elo_margin(1, 0, 0)[1], float('inf'))
+
+  def test_sprt(self):
+    sprt = SPRT(0, 10)
+    self.assertEqual(sprt.status(10, 10, 10), None)
+    self.assertEqual(sprt.status(700, 200, 500), 'H1')
+    self.assertEqual(sprt.status(500, 200, 700), 'H0')
+
+class TestGames(unittest.TestCase):
+  def test_mate(self):
+    first = Config('one', depth = 2)
+    result, sans, termination = play_game(MATE_IN_ONE, first, first)
+    self.assertEqual((result, termination), ('1-0', 'checkmate'))
+    self.assertEqual(len(sans), 1)
+
+  def test_move_limit(self):
+    first = Config('one', depth = 1)
+    result, sans, termination = play_game(Board().fen(), first, first, 6)
+    self.assertEqual((result, len(sans), termination),
+                     ('1/2-1/2', 6, 'move limit'))
+
+  def test_insufficient_material(self):
+    self.assertTrue(insufficient_material(
+      Board.from_fen('8/8/4k3/8/8/2KN4/8/8 w - - 0 1')))
+    self.assertFalse(insufficient_material(Board.from_fen(MATE_IN_ONE)))
+
+  def test_pgn_replays(self):
+    fen = Board.from_fen('r1bqkbnr/pppppppp/2n5/8/4P3/8/PPPP1PPP/RNBQKBNR '
+                         'b KQkq - 1 2').fen()
+    first = Config('one', depth = 1)
+    result, sans, termination = play_game(fen, first, first, 9)
+    text = pgn([('White', 'one'), ('FEN', fen)], sans, result)
+    self.assertTrue('2... ' in text)
+    games = list(read_games(StringIO(text)))
+    self.assertEqual(len(games), 1)
+    self.assertEqual(replay(games[0]), (9, None))
+
+  def test_run(self):
+    out, games = StringIO(), StringIO()
+    first, second = Config('first', depth = 2), Config('second', depth = 2)
+    wins, draws, losses = run([MATE_IN_ONE], first, second, 4, out = out,
+                              pgn_out = games)
+    # Whoever has the queen mates at once
+    self.assertEqual((wins, draws, losses), (2, 0, 2))
+    self.assertEqual(len(list(read_games(StringIO(games.getvalue())))), 4)
+
+  def test_run_stops_on_sprt(self):
+    out = StringIO()
+    first, second = Config('first', depth = 2), Config('second', depth = 2)
+    # Each side wins the game it has the queen in, so they come out even
+    # and the test soon decides they are no more than 400 Elo apart
+    wins, draws, losses = run([MATE_IN_ONE], first, second, 100, out = out,
+                              sprt = SPRT(400, 800))
+    self.assertTrue(wins + draws + losses < 100)
+    self.assertTrue('SPRT accepts' in out.getvalue())
+
+  def test_parallel(self):
+    first = Config('one', depth = 2)
+    results = list(play_match([MATE_IN_ONE], first, first, 4, jobs = 2))
+    self.assertEqual(sorted(number for number, w, r, s, t in results),
+                     [1, 2, 3, 4])
+
+if __name__ == "__main__":
+  unittest.main()
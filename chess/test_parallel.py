@@ -0,0 +1,55 @@
+from parallel import *
+from perft import POSITIONS, divide
+from chess import Board
+import unittest
+
+def count_moves(board):
+  return len(board.legal_moves())
+
+def square(x):
+  return x * x
+
+class TestParallel(unittest.TestCase):
+  def test_parallel_perft(self):
+    board = Board()
+    self.assertEqual(parallel_perft(board, 3, 2), 8902)
+    self.assertEqual(parallel_perft(board, 3, 2, split_ply = 2), 8902)
+    self.assertEqual(board, Board())
+
+  def test_parallel_divide_matches_divide(self):
+    name, fen, counts = POSITIONS[1]
+    board = Board.from_fen(fen)
+    self.assertEqual([(m.uci(), n) for m, n in parallel_divide(board, 2, 2)],
+                     [(m.uci(), n) for m, n in divide(board, 2)])
+
+  def test_map_root_moves(self):
+    results = map_root_moves(Board(), count_moves, processes = 2)
+    self.assertEqual(len(results), 20)
+    self.assertTrue(all(count == 20 for move, count in results))
+
+  def test_bounded_imap(self):
+    read = []
+    def items():
+      for i in range(50):
+        read.append(i)
+        yield i
+    results = bounded_imap(square, items(), processes = 2, window = 4)
+    first = next(results)
+    # Only a window's worth of items are read ahead of the results taken
+    self.assertTrue(len(read) <= 5)
+    self.assertEqual(sorted([first] + list(results)),
+                     [(i, i * i) for i in range(50)])
+
+  def test_bounded_imap_stops_early(self):
+    results = bounded_imap(square, xrange(10 ** 9), processes = 2, window = 4)
+    self.assertEqual(len([r for r, _ in zip(results, range(10))]), 10)
+    results.close()
+
+  def test_split(self):
+    tasks = split(Board(), 2)
+    self.assertEqual(len(tasks), 400)
+    self.assertEqual(tasks[0][0], 0)
+    self.assertEqual(tasks[-1][0], 19)
+
+if __name__ == "__main__":
+  unittest.main()
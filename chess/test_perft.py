@@ -0,0 +1,43 @@
+from perft import *
+from chess import Board
+import unittest
+
+class TestPerft(unittest.TestCase):
+  def test_standard_positions(self):
+    for name, fen, counts in POSITIONS:
+      board = Board.from_fen(fen)
+      self.assertEqual(perft(board, 2), counts[1], name)
+      self.assertEqual(board.fen(), fen)
+
+  def test_depth_three(self):
+    name, fen, counts = POSITIONS[0]
+    self.assertEqual(perft(Board.from_fen(fen), 3), counts[2])
+
+  def test_cache(self):
+    name, fen, counts = POSITIONS[1]
+    cache = {}
+    self.assertEqual(perft(Board.from_fen(fen), 2, cache), counts[1])
+    self.assertTrue((Board.from_fen(fen).zobrist, 2) in cache)
+
+  def test_divide(self):
+    split = divide(Board(), 2)
+    self.assertEqual(len(split), 20)
+    self.assertEqual(sum(nodes for move, nodes in split), 400)
+    self.assertEqual(split[0][0].uci(), 'a2a3')
+
+  def test_run_reports_mismatch(self):
+    class Sink(object):
+      def write(self, text):
+        pass
+    name, fen, counts = POSITIONS[0]
+    self.assertEqual(run([(name, fen, counts)], 2, out = Sink()), 0)
+    self.assertEqual(run([(name, fen, [20, 401])], 2, out = Sink()), 1)
+
+  def test_run_bitboard(self):
+    class Sink(object):
+      def write(self, text):
+        pass
+    self.assertEqual(run(POSITIONS, 3, out = Sink(), bitboard = True), 0)
+
+if __name__ == "__main__":
+  unittest.main()
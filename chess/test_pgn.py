@@ -0,0 +1,56 @@
+from pgn import *
+from StringIO import StringIO
+import unittest
+
+GAMES = '''[Event "Casual"]
+[White "A"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 {The Morphy
+[defence]} 4. Ba4 Nf6 5. O-O Be7 (5... b5 6. Bb3) 6. Re1 $1 b5 7. Bb3 d6
+8. c3 O-O 9. h3 1-0
+
+[Event "From a position"]
+[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"]
+[SetUp "1"]
+
+1. e4 Kd7 2. e5 Ke6 3. Ke2 Kxe5 *
+
+[Event "Illegal"]
+
+1. e4 e5 2. Ke3 *
+'''
+
+class TestPgn(unittest.TestCase):
+  def test_read_games(self):
+    games = list(read_games(StringIO(GAMES)))
+    self.assertEqual(len(games), 3)
+    self.assertEqual(games[0][0]['White'], 'A')
+    self.assertEqual(games[1][0]['SetUp'], '1')
+
+  def test_san_moves(self):
+    tags, movetext = next(read_games(StringIO(GAMES)))
+    moves = san_moves(movetext)
+    self.assertEqual(moves[:4], ['e4', 'e5', 'Nf3', 'Nc6'])
+    self.assertEqual(moves[8:12], ['O-O', 'Be7', 'Re1', 'b5'])
+    self.assertEqual(len(moves), 17)
+
+  def test_replay(self):
+    results = list(replay_games(StringIO(GAMES)))
+    self.assertEqual(results[0], (1, 17, None))
+    self.assertEqual(results[1], (2, 6, None))
+    self.assertEqual(results[2][:2], (3, 2))
+    self.assertEqual(results[2][2][:2], (2, 'Ke3'))
+
+  def test_replay_in_pool(self):
+    results = sorted(replay_games(StringIO(GAMES), jobs = 2))
+    self.assertEqual([r[:2] for r in results], [(1, 17), (2, 6), (3, 2)])
+
+  def test_run(self):
+    out = StringIO()
+    self.assertEqual(run(StringIO(GAMES), out = out), 1)
+    self.assertTrue('game 3 ply 3: illegal move Ke3' in out.getvalue())
+    self.assertTrue('3 games 25 plies' in out.getvalue())
+
+if __name__ == "__main__":
+  unittest.main()
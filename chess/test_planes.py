@@ -0,0 +1,73 @@
+from chess import Board, Location
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+  import numpy as np
+  from planes import *
+except ImportError:
+  np = None
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+@unittest.skipIf(np is None, 'needs numpy')
+class TestPlanes(unittest.TestCase):
+  def test_initial(self):
+    planes = encode([Board()])
+    self.assertEqual(planes.shape, (1, PLANES, 8, 8))
+    self.assertEqual(planes[0, :12].sum(), 32)
+    # White pawns fill the 2nd rank, the black king is on e8
+    self.assertEqual(planes[0, 0, 1].tolist(), [1] * 8)
+    self.assertEqual(planes[0, 11, 7, 4], 1)
+    self.assertEqual(planes[0, SIDE_PLANE].min(), 1)
+    self.assertEqual(planes[0, CASTLING_PLANE:].min(), 1)
+
+  def test_boards_and_fens_match(self):
+    board = Board.from_fen(KIWIPETE)
+    board = board.move(Location(0, 0), Location(0, 1))
+    fens = [Board().fen(), KIWIPETE, board.fen(), '8/8/8/8/8/8/8/K6k b - -']
+    boards = [Board.from_fen(fen) for fen in fens]
+    self.assertTrue((encode(fens) == encode(boards)).all())
+    planes = encode(fens)
+    self.assertEqual(planes[2, SIDE_PLANE].max(), 0)
+    self.assertEqual(planes[2, CASTLING_PLANE:, 0, 0].tolist(), [1, 0, 1, 1])
+    self.assertEqual(planes[3, :12].sum(), 2)
+
+  def test_fen_bogus_castling(self):
+    # Rights need the king and rook on their squares: none, all, then only
+    # black's kingside
+    fens = ['4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1',
+            'r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1',
+            '1r2k2r/8/8/8/8/8/8/R4K1R w KQkq - 0 1']
+    planes = encode(fens)
+    boards = [Board.from_fen(fen) for fen in fens]
+    self.assertTrue((planes == encode(boards)).all())
+    self.assertEqual(planes[:, CASTLING_PLANE:, 0, 0].tolist(),
+                     [[0, 0, 0, 0], [1, 1, 1, 1], [0, 0, 1, 0]])
+
+  def test_fill_in_chunks(self):
+    fens = [Board().fen(), KIWIPETE] * 5
+    out = np.ones((12, PLANES, 8, 8), np.float32)
+    self.assertEqual(fill(iter(fens), out, chunk = 3), 10)
+    self.assertTrue((out[:10] == encode(fens)).all())
+    self.assertEqual(out[10:].min(), 1)
+    with self.assertRaises(ValueError):
+      fill(fens * 2, out)
+
+  def test_to_npy(self):
+    directory = tempfile.mkdtemp()
+    try:
+      path = os.path.join(directory, 'planes.npy')
+      fens = (KIWIPETE for i in range(7))
+      to_npy(fens, path, 7, chunk = 2)
+      planes = np.load(path, mmap_mode = 'r')
+      self.assertEqual(planes.shape, (7, PLANES, 8, 8))
+      self.assertTrue((planes == encode([KIWIPETE])).all())
+      del planes
+    finally:
+      shutil.rmtree(directory)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,77 @@
+from search import *
+from chess import Board
+import unittest
+
+class TestSearch(unittest.TestCase):
+  def test_mate_in_one(self):
+    board = Board.from_fen('6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+    result = Searcher().search(board, max_depth = 3)
+    self.assertEqual(result.move.uci(), 'a1a8')
+    self.assertEqual(result.score, MATE - 1)
+    self.assertEqual(board.fen(), '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1')
+
+  def test_mate_in_two(self):
+    board = Board.from_fen('k7/8/2K5/8/8/8/8/6R1 w - - 0 1')
+    result = Searcher().search(board, max_depth = 4)
+    self.assertEqual(result.score, MATE - 3)
+    self.assertEqual(len(result.pv), 3)
+
+  def test_takes_free_queen(self):
+    board = Board.from_fen('4k3/8/8/3q4/8/2N5/8/4K3 w - - 0 1')
+    result = Searcher().search(board, max_depth = 2)
+    self.assertEqual(result.move.uci(), 'c3d5')
+
+  def test_node_budget(self):
+    searcher = Searcher()
+    searcher.check_every = 64
+    result = searcher.search(Board(), max_depth = 10, max_nodes = 2000)
+    self.assertTrue(result.move is not None)
+    self.assertTrue(searcher.nodes < 2000 + 64)
+    self.assertTrue(result.depth < 10)
+
+  def test_stalemate_is_a_draw(self):
+    board = Board.from_fen('k7/8/1Q6/8/8/8/8/7K b - - 0 1')
+    result = Searcher().search(board, max_depth = 2)
+    self.assertEqual(result.move, None)
+    self.assertEqual(result.score, 0)
+
+  def test_transposition_table_replacement(self):
+    table = TranspositionTable(4)
+    table.store(1, 5, 10, EXACT, None)
+    self.assertEqual(table.probe(1), (5, 10, EXACT, None))
+    self.assertEqual(table.probe(5), None)
+    # Shallower results don't replace deeper ones from the same search
+    table.store(5, 2, 20, EXACT, None)
+    self.assertEqual(table.probe(1), (5, 10, EXACT, None))
+    table.new_search()
+    table.store(5, 2, 20, EXACT, None)
+    self.assertEqual(table.probe(5), (2, 20, EXACT, None))
+
+  def test_parallel_search(self):
+    board = Board.from_fen('4k3/8/8/3q4/8/2N5/8/4K3 w - - 0 1')
+    result = parallel_search(board, 2, 2)
+    self.assertEqual(result.move.uci(), 'c3d5')
+
+  def test_parallel_search_mate_distance(self):
+    # Scholar's mate, Qxf7#
+    fen = ('r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - '
+           '4 4')
+    expected = Searcher().search(Board.from_fen(fen), max_depth = 2)
+    result = parallel_search(Board.from_fen(fen), 2, 2)
+    self.assertEqual(expected.score, MATE - 1)
+    self.assertEqual((result.move.uci(), result.score),
+                     (expected.move.uci(), expected.score))
+
+  def test_parallel_search_sees_repetitions(self):
+    # A queen down, white can only hope to repeat the position
+    board = Board.from_fen('3qk3/8/8/8/8/8/8/K5N1 w - - 0 1')
+    for uci in ('g1f3', 'e8e7', 'f3g1', 'e7e8', 'g1f3', 'e8e7'):
+      board.make_move([m for m in board.legal_moves() if m.uci() == uci][0])
+    expected = Searcher().search(board, max_depth = 2)
+    result = parallel_search(board, 2, 2)
+    self.assertEqual((expected.move.uci(), expected.score), ('f3g1', 0))
+    self.assertEqual((result.move.uci(), result.score), ('f3g1', 0))
+    self.assertEqual(len(board.history), 6)
+
+if __name__ == "__main__":
+  unittest.main()
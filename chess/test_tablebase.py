@@ -0,0 +1,76 @@
+from tablebase import *
+from chess import Board
+from search import Searcher, MATE
+import random
+import shutil
+import tempfile
+import unittest
+
+class TestTablebase(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.mkdtemp()
+    cls.values = generate('KQK', cls.directory)
+    cls.tablebase = Tablebase(cls.directory)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tablebase.close()
+    shutil.rmtree(cls.directory)
+
+  def test_longest_mate(self):
+    self.assertEqual(max(v for v in self.values if v < 128), 19)
+
+  def test_probe(self):
+    tablebase = self.tablebase
+    # Mate in one, and the same with the colors swapped
+    self.assertEqual(tablebase.probe(Board.from_fen('k7/8/1K6/8/8/8/7Q/8 w')),
+                     (WIN, 1))
+    self.assertEqual(tablebase.probe(Board.from_fen('8/7q/8/8/8/1k6/8/K7 b')),
+                     (WIN, 1))
+    self.assertEqual(tablebase.probe(Board.from_fen('k7/1Q6/1K6/8/8/8/8/8 b')),
+                     (LOSS, 0))
+    # Stalemate, and black can take the queen
+    self.assertEqual(tablebase.probe(Board.from_fen('k7/2Q5/1K6/8/8/8/8/8 b')),
+                     (DRAW, 0))
+    self.assertEqual(tablebase.probe(Board.from_fen('k7/1Q6/8/8/8/8/8/7K b')),
+                     (DRAW, 0))
+    self.assertEqual(tablebase.probe(Board.from_fen('k7/8/1K6/8/8/8/7R/8 w')),
+                     None)
+    self.assertEqual(tablebase.probe(Board()), None)
+
+  def test_consistent_with_moves(self):
+    """ Each position's value follows from the values after its moves. """
+    rng = random.Random(5)
+    table = Table('KQK')
+    checked = 0
+    while checked < 200:
+      board = table.board(rng.randrange(2), rng.randrange(64),
+                          rng.randrange(64), rng.randrange(64))
+      if board is None:
+        continue
+      checked += 1
+      after = []
+      for move in board.legal_moves():
+        board.make_move(move)
+        after.append(self.tablebase.probe(board) or (DRAW, 0))
+        board.unmake_move()
+      if not after:
+        expected = (LOSS, 0) if board.in_check() else (DRAW, 0)
+      elif any(result == LOSS for result, plies in after):
+        expected = (WIN, min(p for r, p in after if r == LOSS) + 1)
+      elif all(result == WIN for result, plies in after):
+        expected = (LOSS, max(p for r, p in after) + 1)
+      else:
+        expected = (DRAW, 0)
+      self.assertEqual(self.tablebase.probe(board), expected, board.fen())
+
+  def test_search_uses_tablebase(self):
+    board = Board.from_fen('8/8/8/4k3/8/8/8/3QK3 w - - 0 1')
+    result, plies = self.tablebase.probe(board)
+    searcher = Searcher(tablebase = self.tablebase)
+    found = searcher.search(board, max_depth = 2)
+    self.assertEqual(found.score, MATE - plies)
+
+if __name__ == "__main__":
+  unittest.main()
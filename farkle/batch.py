@@ -0,0 +1,200 @@
+"""
+Plays Farkle turns in batches of NumPy arrays rather than one at a time.
+
+Every turn of a batch rolls at once, and each roll's dice are packed into a
+hand (see farkle.pack) and looked up in arrays indexed by HAND_INDEX. A
+strategy is turned into a DecisionTable first by asking it about every hand
+at every turn score, so the turns can all follow it together, roll after
+roll, until each has stopped or farkled.
+
+    python batch.py -n 1000000
+"""
+
+import argparse
+import time
+import unittest
+
+import numpy as np
+
+from farkle import (Farkle, FACE_BITS, HANDS, HAND_INDEX, SCORES, BEST_MOVES,
+                    best_to_2, best_to_3, best_to_4, best_to_3_or_4,
+                    ratio_to_3, ratio_to_4, pack, unpack)
+
+STRATEGIES = [ratio_to_3, ratio_to_4, best_to_2, best_to_3, best_to_4,
+              best_to_3_or_4]
+
+# Turn scores from this up are given the same decisions
+MAX_SCORE = 10000
+
+# Index into the arrays of each packed hand of up to six dice, -1 otherwise
+HAND_LOOKUP = np.full(1 << 6 * FACE_BITS, -1, np.int16)
+HAND_LOOKUP[HANDS] = np.arange(len(HANDS))
+
+NUM_DICE = np.array([len(unpack(hand)) for hand in HANDS], np.int8)
+FARKLES = np.array([len(SCORES[hand]) == 1 for hand in HANDS])
+BEST_SCORES = np.array([BEST_MOVES[hand][1] for hand in HANDS], np.int32)
+
+class DecisionTable:
+    """
+    What strategy does with each hand at each turn score, a multiple of 50.
+    Each array is indexed by [HAND_INDEX, turn score // 50]: the score of
+    the move taken, how many dice it holds, whether to roll again and
+    whether the move isn't one of the hand's.
+    """
+    def __init__(self, strategy, max_score = MAX_SCORE):
+        columns = max_score // 50 + 1
+        self.gain = np.zeros((len(HANDS), columns), np.int32)
+        self.held = np.zeros((len(HANDS), columns), np.int8)
+        self.again = np.zeros((len(HANDS), columns), bool)
+        self.illegal = np.zeros((len(HANDS), columns), bool)
+        for i, hand in enumerate(HANDS):
+            moves = SCORES[hand]
+            if FARKLES[i]:
+                continue
+            for column in range(columns):
+                move, roll_again = strategy(moves, int(NUM_DICE[i]),
+                                            column * 50)
+                self.gain[i, column] = moves[move]
+                self.held[i, column] = len(move)
+                self.again[i, column] = roll_again
+                self.illegal[i, column] = move not in moves
+
+def roll_hands(num_dice, rng):
+    """
+    Rolls num_dice[i] dice for each i and returns the index of each roll's
+    hand.
+    """
+    dice = rng.randint(1, 7, size = (len(num_dice), 6))
+    counted = np.arange(6) < num_dice[:, None]
+    hands = ((1 << FACE_BITS * (dice - 1)) * counted).sum(axis = 1)
+    return HAND_LOOKUP[hands]
+
+def play_turns(table, count, rng = np.random):
+    """
+    Plays count turns following table, a DecisionTable, like
+    Farkle.play_game. Returns an array of each turn's score.
+    """
+    last = table.gain.shape[1] - 1
+    scores = np.zeros(count, np.int32)
+    num_dice = np.full(count, 6, np.int8)
+    # Indices into scores of the turns still rolling
+    rolling = np.arange(count)
+    while len(rolling):
+        hands = roll_hands(num_dice[rolling], rng)
+        farkled = FARKLES[hands]
+        scores[rolling[farkled]] = 0
+        rolling, hands = rolling[~farkled], hands[~farkled]
+        columns = np.minimum(scores[rolling] // 50, last)
+        again = table.again[hands, columns]
+        scores[rolling] += table.gain[hands, columns]
+        illegal = again & table.illegal[hands, columns]
+        scores[rolling[illegal]] = 0
+        again &= ~illegal
+        rolling, hands, columns = rolling[again], hands[again], columns[again]
+        # Holding every die rolls all six again
+        left = num_dice[rolling] - table.held[hands, columns]
+        num_dice[rolling] = np.where(left == 0, 6, left)
+    return scores
+
+def simulate(strategy, count, rng = np.random, chunk = 1 << 20):
+    """
+    Plays count turns of strategy, a strategy function or DecisionTable,
+    chunk turns at a time. Returns (mean score, standard error).
+    """
+    if not isinstance(strategy, DecisionTable):
+        strategy = DecisionTable(strategy)
+    total = 0.0
+    squares = 0.0
+    done = 0
+    while done < count:
+        scores = play_turns(strategy, min(chunk, count - done), rng)
+        total += scores.sum(dtype = np.float64)
+        squares += (scores.astype(np.float64) ** 2).sum()
+        done += len(scores)
+    mean = total / count
+    variance = max(squares / count - mean ** 2, 0.0)
+    return mean, (variance / count) ** 0.5
+
+def value_one_roll(num_dice, num_iterations, rng = np.random):
+    """
+    farkle.value_one_roll in a batch: the mean best score of one roll of
+    num_dice and how often it farkles.
+    """
+    hands = roll_hands(np.full(num_iterations, num_dice, np.int8), rng)
+    return (BEST_SCORES[hands].mean(), FARKLES[hands].mean())
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Compare Farkle '
+                                     'strategies over many turns')
+    parser.add_argument('-n', '--turns', type = int, default = 1000000)
+    parser.add_argument('-s', '--seed', type = int)
+    args = parser.parse_args(argv)
+    rng = np.random.RandomState(args.seed)
+    for strategy in STRATEGIES:
+        start = time.time()
+        mean, error = simulate(strategy, args.turns, rng)
+        elapsed = time.time() - start
+        print '%-16s %8.2f +- %.2f  %.0f turns/sec' % (
+            strategy.__name__, mean, 1.96 * error, args.turns / elapsed)
+
+class TestBatch(unittest.TestCase):
+    def test_lookup(self):
+        rng = np.random.RandomState(1)
+        num_dice = rng.randint(1, 7, size = 1000).astype(np.int8)
+        hands = roll_hands(num_dice, rng)
+        self.assertTrue((hands >= 0).all())
+        self.assertTrue((NUM_DICE[hands] == num_dice).all())
+
+    def test_decision_table(self):
+        table = DecisionTable(best_to_3_or_4, 1000)
+        for dice in ([1, 2, 3, 4, 6, 6], [5, 5, 2], [1, 1, 1, 1, 2]):
+            moves = Farkle().moves_and_scores(dice)
+            i = HAND_INDEX[pack(dice)]
+            for score in (0, 250, 1000):
+                move, again = best_to_3_or_4(moves, len(dice), score)
+                self.assertEqual(table.gain[i, score // 50], moves[move])
+                self.assertEqual(table.held[i, score // 50], len(move))
+                self.assertEqual(table.again[i, score // 50], again)
+
+    def test_value_one_roll(self):
+        rng = np.random.RandomState(2)
+        score, farkles = value_one_roll(1, 200000, rng)
+        self.assertAlmostEqual(score, 25, delta = 0.5)
+        self.assertAlmostEqual(farkles, 2 / 3.0, delta = 0.01)
+        score, farkles = value_one_roll(2, 200000, rng)
+        self.assertAlmostEqual(score, 50, delta = 1)
+        self.assertAlmostEqual(farkles, 4 / 9.0, delta = 0.01)
+
+    def test_hot_dice(self):
+        class Dice:
+            """ Rolls the dice it is given, in order. """
+            def __init__(self, rolls):
+                self.rolls = list(rolls)
+            def randint(self, low, high, size):
+                return np.array(self.rolls.pop(0)).reshape(size)
+        # Roll again only after scoring with every die
+        def hot_dice(moves, num_dice, current_score):
+            move, score = moves.most_common(1)[0]
+            return move, len(move) == num_dice
+        table = DecisionTable(hot_dice, 2000)
+        scores = play_turns(table, 1, Dice([[1, 2, 3, 4, 5, 6],
+                                            [1, 1, 1, 2, 3, 4]]))
+        self.assertEqual(scores[0], 1500 + BEST_MOVES[pack([1, 1, 1, 2])][1])
+        scores = play_turns(table, 1, Dice([[5, 2, 3, 4, 4, 6]]))
+        self.assertEqual(scores[0], 50)
+        scores = play_turns(table, 1, Dice([[2, 2, 3, 4, 4, 6]]))
+        self.assertEqual(scores[0], 0)
+
+    def test_matches_play_game(self):
+        rng = np.random.RandomState(4)
+        for strategy in (best_to_3, ratio_to_4, best_to_3_or_4):
+            mean, error = simulate(strategy, 200000, rng, chunk = 50000)
+            games = [Farkle().play_game(strategy) for i in range(20000)]
+            scalar = np.mean(games)
+            scalar_error = np.std(games) / len(games) ** 0.5
+            self.assertTrue(abs(mean - scalar) <
+                            5 * (error ** 2 + scalar_error ** 2) ** 0.5,
+                            (strategy.__name__, mean, scalar))
+
+if __name__ == '__main__':
+    main()
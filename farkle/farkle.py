@@ -1,4 +1,6 @@
-from collections import Counter
+from collections import Counter, Mapping
+from itertools import combinations_with_replacement
+from math import factorial
 import unittest
 from random import randint
 
@@ -73,6 +75,40 @@ def best_to_3_or_4(moves, num_dice, current_score):
 def roll(num_dice):
     return [randint(1, 6) for x in range(num_dice)]
 
+"""
+A hand can also be packed into an int of how many of each face it has,
+three bits a face with the ones lowest. Every order of the same dice packs
+to the same int, so it needs no sorting to look up, and the 924 hands of six
+or fewer dice are numbered 0 to 923 by HAND_INDEX for indexing arrays.
+"""
+FACE_BITS = 3
+FACE_MASK = 7
+
+def pack(dice):
+    """ Packs dice, any iterable of faces, into a hand. """
+    hand = 0
+    for die in dice:
+        hand += 1 << FACE_BITS * (die - 1)
+    return hand
+
+def as_hand(dice):
+    """ dice as a packed hand, whether a list of dice or already packed. """
+    if isinstance(dice, (int, long)):
+        return dice
+    return pack(dice)
+
+def face_counts(dice):
+    """ A list of how many ones, twos, ... sixes are in dice or a hand. """
+    hand = as_hand(dice)
+    return [hand >> FACE_BITS * i & FACE_MASK for i in range(6)]
+
+def unpack(hand):
+    """ The dice of a packed hand as a sorted tuple. """
+    dice = ()
+    for face in range(1, 7):
+        dice += (face, ) * (hand >> FACE_BITS * (face - 1) & FACE_MASK)
+    return dice
+
 class Farkle:
     def __init__(self):
         self.dice = roll(6)
@@ -121,26 +157,39 @@ class Farkle:
 
     def farkle(self, dice):
         """ Returns True if its a farkle, False otherwise. """
-        moves = self.moves_and_scores(dice)
-        return len(moves) == 1
+        return len(SCORES[as_hand(dice)]) == 1
     
     def max_move_and_score(self, dice):
         """
         Returns a tuple of the highest scoring move and that score
         """
-        moves = self.moves_and_scores(dice)
-        return moves.most_common(1)[0]
+        return BEST_MOVES[as_hand(dice)]
 
     def moves_and_scores(self, dice):
-        moves = Counter()
-        big_moves = self.big_moves(dice)
-        ones_and_fives = self.moves_ones_and_fives(dice)
+        """
+        Returns the Scores of every move that can be made with dice, a list
+        or a packed hand, looked up in SCORES.
+        """
+        return SCORES[as_hand(dice)]
+
+    @staticmethod
+    def score_roll(dice):
+        """
+        Works out the moves and scores of a roll from the pattern checkers,
+        which SCORES holds for every roll.
+        """
+        hand = as_hand(dice)
+        big_moves = Farkle.big_moves(hand)
+        ones_and_fives = Farkle.moves_ones_and_fives(hand)
         moves = ones_and_fives | big_moves
         moves[()] = 0
+        counts = face_counts(hand)
         for move in big_moves:
             score = big_moves[move]
-            extra_dice = set(dice) - set(move)
-            extra_ones_and_fives = self.moves_ones_and_fives(list(extra_dice))
+            # One of each face left over, however many there are
+            extra_dice = pack(face for face in range(1, 7)
+                              if counts[face - 1] and face not in move)
+            extra_ones_and_fives = Farkle.moves_ones_and_fives(extra_dice)
             for extra_move in extra_ones_and_fives:
                 extra_score = extra_ones_and_fives[extra_move]
                 new_move = tuple(sorted(move + extra_move))
@@ -148,37 +197,40 @@ class Farkle:
                 moves[new_move] = max(moves[new_move], new_score)
         return moves
 
-    def big_moves(self, dice):
+    @staticmethod
+    def big_moves(dice):
         """
         Helper for moves_and_scores.
         Returns all big moves that can be made with the 6 or less
         dice, as well as their score. In the form of a Counter with
         key tuple of dice rolled, and value numeric score.
-        dice: An array of all dice rolled.
+        dice: A list of all dice rolled, or their packed hand.
         """
+        hand = as_hand(dice)
+        dice = unpack(hand)
         moves = Counter()
-        if Farkle.six_of_a_kind(dice):
-            moves[tuple(dice)] = max(3000, moves[tuple(dice)])
-        elif Farkle.two_triplets(dice):
-            held_dice = Farkle.two_triplets(dice)
-            moves[tuple(dice[:3])] = max(dice[0] * 100, moves[tuple(dice[:3])])
-            moves[tuple(dice[3:])] = max(dice[3] * 100, moves[tuple(dice[3:])])
-            moves[tuple(dice)] = max(2500, moves[tuple(dice)])
-        elif Farkle.straight(dice) or Farkle.three_pairs(dice):
-            moves[tuple(dice)] = max(1500, moves[tuple(dice)])
-
-        if Farkle.five_of_a_kind(dice):
-            held_dice = Farkle.five_of_a_kind(dice)
+        if Farkle.six_of_a_kind(hand):
+            moves[dice] = max(3000, moves[dice])
+        elif Farkle.two_triplets(hand):
+            moves[dice[:3]] = max(dice[0] * 100, moves[dice[:3]])
+            moves[dice[3:]] = max(dice[3] * 100, moves[dice[3:]])
+            moves[dice] = max(2500, moves[dice])
+        elif Farkle.straight(hand) or Farkle.three_pairs(hand):
+            moves[dice] = max(1500, moves[dice])
+
+        if Farkle.five_of_a_kind(hand):
+            held_dice = Farkle.five_of_a_kind(hand)
             moves[tuple(held_dice)] = max(2000, moves[tuple(held_dice)]) 
-        if Farkle.four_of_a_kind(dice):
-            held_dice = Farkle.four_of_a_kind(dice)
+        if Farkle.four_of_a_kind(hand):
+            held_dice = Farkle.four_of_a_kind(hand)
             moves[tuple(held_dice)] = max(1000, moves[tuple(held_dice)])
-        if Farkle.three_of_a_kind(dice):
-            held_dice = Farkle.three_of_a_kind(dice)
+        if Farkle.three_of_a_kind(hand):
+            held_dice = Farkle.three_of_a_kind(hand)
             moves[tuple(held_dice)] = max(held_dice[0] * 100, moves[tuple(held_dice)])
         return moves
 
-    def moves_ones_and_fives(self, dice):
+    @staticmethod
+    def moves_ones_and_fives(dice):
         """
         Helper for moves_and_scores.
         Returns all combinations of 1's and 5's that can be withheld, as well as the
@@ -186,87 +238,177 @@ class Farkle:
         3+ one's and 3+ five's, but big moves overrides.
         """
         moves = Counter()
-        ones = [1 for x in dice if x == 1]
-        fives = [5 for x in dice if x == 5]
-        for i in range(len(ones) + 1):
-            for j in range(len(fives) + 1):
+        counts = face_counts(dice)
+        for i in range(counts[0] + 1):
+            for j in range(counts[4] + 1):
                 moves[(1, )*i + (5, )*j] = max(100*i + 50*j, moves[(1, )*i + (5, )*j])
         return moves
-    
+
+    # The pattern checkers take a list of dice or a packed hand, and return
+    # the sorted dice that make the pattern or False. They leave a list
+    # they are given as it is.
+
     @staticmethod
     def straight(hand):
-        if len(hand) != 6:
+        counts = face_counts(hand)
+        if counts != [1] * 6:
             return False
-        for i in range(1,7):
-            if i not in hand:
-                return False
-        return sorted(hand)
+        return [1, 2, 3, 4, 5, 6]
 
     @staticmethod
     def six_of_a_kind(hand):
-        if len(hand) != 6:
+        counts = face_counts(hand)
+        if 6 not in counts:
             return False
-        for die in hand:
-            if hand[0] != die:
-                return False
-        return hand
+        return [counts.index(6) + 1] * 6
 
     @staticmethod
     def two_triplets(hand):
-        if len(hand) != 6:
-            return False
-        hand.sort()
-        a, b, c, d, e, f = hand
-        if a == b and b == c and d == e and e == f:
-            return hand
-        else:
+        # Six of a kind is two triplets of the same face
+        counts = face_counts(hand)
+        if sum(counts) != 6 or [c for c in counts if c % 3]:
             return False
+        return list(unpack(as_hand(hand)))
 
     @staticmethod
     def three_pairs(hand):
-        if len(hand) != 6:
-            return False
-        hand.sort()
-        a, b, c, d, e, f = hand
-        if a == b and c == d and e == f:
-            return hand
-        else:
+        # Four of a kind and a pair, or six of a kind, are pairs too
+        counts = face_counts(hand)
+        if sum(counts) != 6 or [c for c in counts if c % 2]:
             return False
+        return list(unpack(as_hand(hand)))
 
     @staticmethod
     def five_of_a_kind(hand):
-        if len(hand) != 6:
+        counts = face_counts(hand)
+        if sum(counts) != 6 or max(counts) < 5:
             return False
-        c = Counter()
-        for die in hand:
-            c[die] += 1
-        v = sorted(c.values())
-        if v[-1] < 5:
-            return False
-        return [hand[0] if hand[0] == hand[1] else hand[2]]*5
+        return [counts.index(max(counts)) + 1]*5
 
     @staticmethod
     def four_of_a_kind(hand):
-        c = Counter()
-        for die in hand:
-            c[die] += 1
+        counts = face_counts(hand)
         for i in range(1,7):
-            if c[i] >= 4:
+            if counts[i - 1] >= 4:
                 return [i]*4
         return False
 
     @staticmethod
     def three_of_a_kind(hand):
-        c = Counter()
-        for die in hand:
-            c[die] += 1
-        v = sorted(c.values())
-        to_return = []
+        counts = face_counts(hand)
         for i in range(1,7):
-            if c[i] >= 3:
+            if counts[i - 1] >= 3:
                 return [i]*3
         return False
 
+class Scores(Mapping):
+    """
+    A read only view of the Counter of a roll's moves and their scores, so
+    the one SCORES holds for each roll can be handed to any strategy without
+    a copy. Moves that can't be made score 0, as in a Counter.
+    """
+    __slots__ = ('_moves',)
+
+    def __init__(self, moves):
+        self._moves = moves
+
+    def __getitem__(self, move):
+        return self._moves[move]
+
+    def __contains__(self, move):
+        return move in self._moves
+
+    def __iter__(self):
+        return iter(self._moves)
+
+    def __len__(self):
+        return len(self._moves)
+
+    def get(self, move, default = None):
+        return self._moves.get(move, default)
+
+    def most_common(self, n = None):
+        return self._moves.most_common(n)
+
+    def __repr__(self):
+        return 'Scores(%r)' % dict(self._moves)
+
+def build_tables():
+    """
+    Scores every roll of up to six dice. Returns a dict from each packed
+    hand to its Scores, and one to its best move and score.
+    """
+    scores = {}
+    best = {}
+    for num_dice in range(7):
+        for dice in combinations_with_replacement(range(1, 7), num_dice):
+            hand = pack(dice)
+            moves = Farkle.score_roll(hand)
+            scores[hand] = Scores(moves)
+            best[hand] = moves.most_common(1)[0]
+    return scores, best
+
+# There are only 924 rolls of six or fewer dice, counting no dice
+SCORES, BEST_MOVES = build_tables()
+HANDS = sorted(SCORES)
+HAND_INDEX = dict((hand, i) for i, hand in enumerate(HANDS))
+
+def roll_probabilities(num_dice):
+    """ A list of each hand num_dice can roll and its probability. """
+    rolls = []
+    for dice in combinations_with_replacement(range(1, 7), num_dice):
+        ways = factorial(num_dice)
+        for count in Counter(dice).values():
+            ways //= factorial(count)
+        rolls.append((pack(dice), ways / 6.0 ** num_dice))
+    return rolls
+
+ROLLS = [roll_probabilities(num_dice) for num_dice in range(7)]
+
+def expected_value(strategy, num_dice = 6, max_score = 10000):
+    """
+    Works out exactly what a turn of strategy scores on average, and how
+    often it ends in a farkle, by going through every roll of every state
+    of the turn, the dice left to roll and the score so far, once each.
+    Returns (expected score, farkle probability).
+    A turn is counted as stopping once its score reaches max_score, which
+    leaves out the little the very rare turns that get that far go on to
+    score.
+    """
+    values = {}
+    def value(num_dice, score):
+        if score >= max_score:
+            return score, 0.0
+        if (num_dice, score) in values:
+            return values[(num_dice, score)]
+        expected = 0.0
+        farkled = 0.0
+        # Chance of rolling again from this same state, holding nothing
+        repeat = 0.0
+        for hand, probability in ROLLS[num_dice]:
+            moves = SCORES[hand]
+            if len(moves) == 1:
+                farkled += probability
+                continue
+            move, roll_again = strategy(moves, num_dice, score)
+            new_score = score + moves[move]
+            if not roll_again:
+                expected += probability * new_score
+            elif move not in moves:
+                # play_game scores an illegal move as nothing
+                continue
+            elif not move:
+                repeat += probability
+            else:
+                next_value, next_farkled = value(
+                    num_dice - len(move) or 6, new_score)
+                expected += probability * next_value
+                farkled += probability * next_farkled
+        values[(num_dice, score)] = (expected / (1 - repeat),
+                                     farkled / (1 - repeat))
+        return values[(num_dice, score)]
+    return value(num_dice, 0)
+
 class TestFarkle(unittest.TestCase):
     def test_moves_and_scores(self):
         f = Farkle()
@@ -296,6 +438,75 @@ class TestFarkle(unittest.TestCase):
                                                      (5, 6, 6, 6, 6):1050,
                                                      (5, 5, 6, 6, 6, 6):1500}))
 
+    def test_tables(self):
+        self.assertEqual(len(SCORES), 924)
+        f = Farkle()
+        for i in range(1000):
+            dice = roll(randint(1, 6))
+            moves = Farkle.score_roll(list(dice))
+            self.assertEqual(f.moves_and_scores(list(dice)).items(),
+                             moves.items())
+            self.assertEqual(f.max_move_and_score(dice),
+                             moves.most_common(1)[0])
+            self.assertEqual(f.farkle(dice), len(moves) == 1)
+        self.assertEqual(len(HANDS), 924)
+        self.assertEqual(HAND_INDEX[pack([])], 0)
+
+    def test_scores_read_only(self):
+        moves = Farkle().moves_and_scores([1, 5, 2])
+        def change():
+            moves[(1, )] = 1000
+        self.assertRaises(TypeError, change)
+        self.assertRaises(AttributeError, lambda: moves.update({(5, ): 0}))
+        self.assertEqual(moves[(1, )], 100)
+        self.assertEqual(moves[(2, )], 0)
+        self.assertFalse((2, ) in moves)
+        self.assertEqual(moves.most_common(1), [((1, 5), 150)])
+
+    def test_expected_value(self):
+        def stop(moves, num_dice, current_score):
+            return moves.most_common(1)[0][0], False
+        # The values worked out at the top of this file
+        score, farkles = expected_value(stop, 1)
+        self.assertAlmostEqual(score, 25)
+        self.assertAlmostEqual(farkles, 2 / 3.0)
+        score, farkles = expected_value(stop, 2)
+        self.assertAlmostEqual(score, 50)
+        self.assertAlmostEqual(farkles, 4 / 9.0)
+        self.assertAlmostEqual(sum(p for hand, p in ROLLS[6]), 1)
+        self.assertEqual(len(ROLLS[6]), 462)
+        # Rolling again holding nothing goes on until a farkle
+        def never_hold(moves, num_dice, current_score):
+            return (), True
+        score, farkles = expected_value(never_hold)
+        self.assertEqual(score, 0)
+        self.assertAlmostEqual(farkles, 1)
+
+    def test_expected_value_matches_play_game(self):
+        for strategy in (best_to_3, ratio_to_4, best_to_3_or_4):
+            score, farkles = expected_value(strategy)
+            games = [Farkle().play_game(strategy) for i in range(20000)]
+            mean = sum(games) / 20000.0
+            error = (sum((g - mean) ** 2 for g in games) / 20000.0) ** 0.5
+            self.assertTrue(abs(score - mean) < 5 * error / 20000 ** 0.5,
+                            (strategy.__name__, score, mean))
+            self.assertAlmostEqual(farkles, games.count(0) / 20000.0,
+                                   delta = 0.02)
+
+    def test_hands(self):
+        self.assertEqual(pack([3, 1, 3]), pack([1, 3, 3]))
+        self.assertEqual(pack([1, 3, 3]), 1 + (2 << 6))
+        self.assertEqual(unpack(pack([6, 2, 6, 1])), (1, 2, 6, 6))
+        self.assertEqual(face_counts([6, 2, 6, 1]), [1, 1, 0, 0, 0, 2])
+        self.assertEqual(Farkle().moves_and_scores(pack([6, 3, 2, 5, 3, 3])),
+                         Farkle().moves_and_scores([6, 3, 2, 5, 3, 3]))
+        # Checking a hand leaves the dice as they were
+        dice = [3, 2, 3, 2, 3, 2]
+        self.assertEqual(Farkle.two_triplets(dice), [2, 2, 2, 3, 3, 3])
+        self.assertEqual(Farkle.three_pairs([5, 1, 5, 1, 5, 1]), False)
+        Farkle().moves_and_scores(dice)
+        self.assertEqual(dice, [3, 2, 3, 2, 3, 2])
+
     def test_big_moves(self):
         f = Farkle()
         self.assertEqual(f.big_moves([6, 3, 2, 5, 3, 3]),
@@ -390,29 +601,8 @@ if __name__ == '__main__':
 #    f = Farkle()
 #    print f.play_game(best_to_3, True)
 
-    ratio_3 = 0
-    ratio_4 = 0
-    best_4 = 0
-    best_3 = 0
-    best_3_or_4 = 0
-    for i in range(5000):
-        f = Farkle()
-        ratio_3 += f.play_game(ratio_to_3)
-        f = Farkle()
-        ratio_4 += f.play_game(ratio_to_4)
-        f = Farkle()
-        best_4 += f.play_game(best_to_4)
-        f = Farkle()
-        best_3 += f.play_game(best_to_3)
-        f = Farkle()
-        best_3_or_4 += f.play_game(best_to_3_or_4)
-    print 'Best ratio to 3'
-    print ratio_3 / 5000.0
-    print 'Best ratio to 4'
-    print ratio_4 / 5000.0
-    print 'Best to 3 or 4'
-    print best_3_or_4 / 5000.0
-    print 'Best to 3'
-    print best_3 / 5000.0
-    print 'Best to 4'
-    print best_4 / 5000.0
+    # Exact, rather than the average of a few thousand games
+    for strategy in (ratio_to_3, ratio_to_4, best_to_3_or_4, best_to_3,
+                     best_to_4):
+        score, farkles = expected_value(strategy)
+        print '%-16s %.3f  farkles %.4f' % (strategy.__name__, score, farkles)